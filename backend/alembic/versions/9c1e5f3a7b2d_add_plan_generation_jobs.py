@@ -0,0 +1,55 @@
+"""add plan_generation_jobs queue table
+
+Revision ID: 9c1e5f3a7b2d
+Revises: 1160ad22e164
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c1e5f3a7b2d'
+down_revision: Union[str, None] = '1160ad22e164'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('plan_generation_jobs',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('objective', sa.Text(), nullable=False),
+    sa.Column('duration', sa.String(length=100), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('run_after', sa.DateTime(), nullable=False),
+    sa.Column('locked_by', sa.String(length=100), nullable=True),
+    sa.Column('heartbeat_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.Column('partial_result', sa.Text(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('plan_id', sa.Integer(), nullable=True),
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['plan_id'], ['plans.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_plan_generation_jobs_id'), 'plan_generation_jobs', ['id'], unique=False)
+    op.create_index(op.f('ix_plan_generation_jobs_user_id'), 'plan_generation_jobs', ['user_id'], unique=False)
+    op.create_index('ix_plan_generation_jobs_status_run_after', 'plan_generation_jobs', ['status', 'run_after'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_plan_generation_jobs_status_run_after', table_name='plan_generation_jobs')
+    op.drop_index(op.f('ix_plan_generation_jobs_user_id'), table_name='plan_generation_jobs')
+    op.drop_index(op.f('ix_plan_generation_jobs_id'), table_name='plan_generation_jobs')
+    op.drop_table('plan_generation_jobs')
@@ -1,12 +1,27 @@
-from fastapi import Depends, HTTPException, status
+from typing import Optional
+from fastapi import Depends, HTTPException, Query, status
 from jose import JWTError, jwt
 from sqlalchemy.orm import Session
 
-from database import get_db
+from database import async_session, get_db
 from dependencies import get_user_service
 from models.user import User
 from services.user_service import UserService
 from .security import TokenData, oauth2_scheme, SECRET_KEY, ALGORITHM
+
+async def _get_user_from_token(token: str, user_service: UserService) -> Optional[User]:
+    """Возвращает пользователя по JWT или None, если токен недействителен"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        username: str = payload.get("sub")
+        if username is None:
+            return None
+        token_data = TokenData(username=username)
+    except JWTError:
+        return None
+
+    return await user_service.get_user_by_username(username=token_data.username)
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
     user_service: UserService = Depends(get_user_service),
@@ -16,20 +31,24 @@ async def get_current_user(
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-    
-    user = await user_service.get_user_by_username(username=token_data.username)
+
+    user = await _get_user_from_token(token, user_service)
     if user is None:
         raise credentials_exception
     return user
 
 async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
     return current_user
+
+async def get_websocket_user(token: Optional[str] = Query(None)) -> Optional[User]:
+    """Аутентификация WebSocket по токену из query-параметра (?token=...).
+
+    Браузеры не позволяют задать заголовок Authorization для WebSocket,
+    поэтому токен передается в URL. Возвращает None, если токен недействителен.
+    Сессия БД открывается только на время проверки: Depends(get_db) держал бы
+    соединение пула, пока открыт сокет.
+    """
+    if not token:
+        return None
+    async with async_session() as session:
+        return await _get_user_from_token(token, UserService(session))
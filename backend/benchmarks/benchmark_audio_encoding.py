@@ -0,0 +1,73 @@
+"""Стоимость кодирования TTS-ответа против сэкономленных байт.
+
+Запуск из каталога backend:
+    python -m benchmarks.benchmark_audio_encoding [--seconds 10] [--file speech.wav]
+
+Без --file кодируется синтетический речеподобный сигнал; для реальных цифр
+лучше передать записанный ответ TTS (моно, любой частоты).
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import SAMPLE_RATE
+from services.audio_encoding import AUDIO_FORMATS, BITRATE_PRESETS, encode_audio
+
+def _synthetic_speech(seconds: float, sample_rate: int) -> np.ndarray:
+    """Гармонический сигнал с меняющимся тоном и слоговой огибающей."""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = np.clip(np.sin(2 * np.pi * 3.5 * t), 0, None)
+    noise = np.random.default_rng(0).normal(0, 0.01, len(t))
+    return (0.3 * voice * envelope + noise).astype(np.float32)
+
+def _measure(audio, sample_rate, audio_format, preset, repeats):
+    timings = []
+    data = b""
+    for _ in range(repeats):
+        start = time.perf_counter()
+        data = encode_audio(audio, sample_rate, audio_format, preset)
+        timings.append(time.perf_counter() - start)
+    return min(timings), len(data)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--file", type=str, default=None)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.file:
+        audio, sample_rate = sf.read(args.file, dtype="float32", always_2d=True)
+        audio = audio.mean(axis=1)
+    else:
+        sample_rate = SAMPLE_RATE
+        audio = _synthetic_speech(args.seconds, sample_rate)
+    duration = len(audio) / sample_rate
+
+    _, wav_bytes = _measure(audio, sample_rate, AUDIO_FORMATS["wav"], "medium", 1)
+    print(f"Audio: {duration:.1f}s @ {sample_rate} Hz, WAV {wav_bytes / 1024:.0f} KiB")
+    print(f"{'format':<8}{'preset':<8}{'encode ms':>10}{'x realtime':>12}{'KiB':>9}{'kbit/s':>9}{'saved':>8}")
+
+    for name, audio_format in AUDIO_FORMATS.items():
+        presets = BITRATE_PRESETS if audio_format.compressed else {"-": None}
+        for preset in presets:
+            seconds, size = _measure(
+                audio, sample_rate, audio_format,
+                preset if audio_format.compressed else "medium", args.repeats
+            )
+            print(
+                f"{name:<8}{preset:<8}{seconds * 1000:>10.1f}{duration / seconds:>12.0f}"
+                f"{size / 1024:>9.0f}{size * 8 / duration / 1000:>9.0f}{1 - size / wav_bytes:>8.0%}"
+            )
+
+if __name__ == "__main__":
+    main()
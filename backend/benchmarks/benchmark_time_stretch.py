@@ -0,0 +1,59 @@
+"""Скорость WSOLA time-stretch относительно реального времени на CPU.
+
+Запуск из каталога backend:
+    python -m benchmarks.benchmark_time_stretch [--seconds 30] [--file speech.wav]
+
+"x realtime" — во сколько раз обработка быстрее длительности входного аудио.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import SAMPLE_RATE
+from services.time_stretch import time_stretch
+from benchmarks.benchmark_audio_encoding import _synthetic_speech
+
+SPEEDS = (0.75, 0.9, 1.15, 1.25, 1.5, 2.0)
+
+def _dominant_frequency(audio: np.ndarray, sample_rate: int) -> float:
+    spectrum = np.abs(np.fft.rfft(audio * np.hanning(len(audio))))
+    return float(np.fft.rfftfreq(len(audio), 1 / sample_rate)[np.argmax(spectrum)])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--file", type=str, default=None)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.file:
+        audio, sample_rate = sf.read(args.file, dtype="float32", always_2d=True)
+        audio = audio.mean(axis=1)
+    else:
+        sample_rate = SAMPLE_RATE
+        audio = _synthetic_speech(args.seconds, sample_rate)
+    duration = len(audio) / sample_rate
+    source_pitch = _dominant_frequency(audio, sample_rate)
+
+    print(f"Audio: {duration:.1f}s @ {sample_rate} Hz, dominant frequency {source_pitch:.0f} Hz")
+    print(f"{'speed':>6}{'ms':>10}{'x realtime':>12}{'out s':>8}{'freq Hz':>9}")
+    for speed in SPEEDS:
+        timings = []
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            stretched = time_stretch(audio, sample_rate, speed)
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        print(
+            f"{speed:>6.2f}{best * 1000:>10.1f}{duration / best:>12.0f}"
+            f"{len(stretched) / sample_rate:>8.1f}{_dominant_frequency(stretched, sample_rate):>9.0f}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Real-time factor VITS на CPU по режимам fp32 / int8 / onnx и сверка аудио с fp32.
+
+Запуск из каталога backend:
+    python -m benchmarks.benchmark_tts_cpu [--modes fp32,int8,onnx] [--threads 4]
+
+RTF — секунд синтеза на секунду аудио (меньше — лучше, < 1 — быстрее реального
+времени). Аудио сверяется с первым режимом списка (по умолчанию fp32) без шума
+VITS, чтобы различия давала только оптимизация.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from TTS.api import TTS
+from config import TTS_ONNX_PATH
+from services.tts_cpu import OnnxVitsTTS, audio_parity, deterministic_vits, quantize_int8
+
+SENTENCES = [
+    "Good morning! Let's review the plan for today.",
+    "You finished three tasks yesterday, which is a great result.",
+    "The next milestone is a short quiz about the material from this week.",
+    "Remember to take a break after forty five minutes of focused work.",
+]
+
+def _load(mode: str):
+    tts = TTS("tts_models/en/vctk/vits").to("cpu")
+    if mode == "int8":
+        return quantize_int8(tts)
+    if mode == "onnx":
+        return OnnxVitsTTS(tts, TTS_ONNX_PATH)
+    return tts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", type=str, default="fp32,int8,onnx")
+    parser.add_argument("--speaker", type=str, default="p225")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--repeats", type=int, default=2)
+    args = parser.parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    reference = {}
+    print(f"{'mode':<6}{'load s':>8}{'RTF':>8}{'x realtime':>12}{'similarity':>12}{'SNR dB':>8}{'len':>7}  parity")
+    for mode in args.modes.split(","):
+        start = time.perf_counter()
+        tts = _load(mode)
+        load_seconds = time.perf_counter() - start
+        # Прогрев: первый вызов включает ленивую инициализацию (фонемизатор, аллокации)
+        tts.tts(text=SENTENCES[0], speaker=args.speaker)
+
+        synth_seconds = 0.0
+        audio_seconds = 0.0
+        for _ in range(args.repeats):
+            for sentence in SENTENCES:
+                start = time.perf_counter()
+                audio = tts.tts(text=sentence, speaker=args.speaker)
+                synth_seconds += time.perf_counter() - start
+                audio_seconds += len(audio) / tts.synthesizer.output_sample_rate
+
+        with deterministic_vits(tts):
+            outputs = [np.asarray(tts.tts(text=s, speaker=args.speaker), dtype=np.float32) for s in SENTENCES]
+        if not reference:
+            reference = dict(zip(SENTENCES, outputs))
+        parities = [audio_parity(reference[s], out) for s, out in zip(SENTENCES, outputs)]
+
+        rtf = synth_seconds / audio_seconds
+        print(
+            f"{mode:<6}{load_seconds:>8.1f}{rtf:>8.3f}{1 / rtf:>12.1f}"
+            f"{min(p['spectral_similarity'] for p in parities):>12.4f}"
+            f"{min(p['snr_db'] for p in parities):>8.1f}"
+            f"{min(p['length_ratio'] for p in parities):>7.2f}  "
+            f"{'ok' if all(p['passed'] for p in parities) else 'FAILED'}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Пропускная способность проверок wake word: прежний путь через /stt/ против быстрого пути.
+
+Запуск из каталога backend:
+    python -m benchmarks.benchmark_wake_word [--file hey_act_ai.wav] [--clips 40]
+        [--silence-ratio 0.7] [--concurrency 4] [--legacy-profile fastest|accurate]
+        [--background-seconds 20]
+
+Прежний путь: профиль Whisper из /stt/ (vad_filter, автоопределение языка, общий
+пул инференса AUDIO_INFERENCE_WORKERS) плюс asyncio.sleep(0.3) на каждый клип.
+Быстрый путь: WakeWordDetector — энергетический гейт, tiny без таймстемпов на
+своем пуле и своей копии модели. Клиент шлет клипы непрерывно, поэтому часть
+клипов — тишина (--silence-ratio). С --background-seconds в общем пуле параллельно
+идет длинная транскрипция, как при реальной нагрузке.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+from faster_whisper import WhisperModel
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from config import (
+    AUDIO_INFERENCE_WORKERS,
+    WAKE_WORD_CONCURRENCY,
+    WAKE_WORD_CPU_THREADS,
+    WAKE_WORD_KEYWORDS,
+    WAKE_WORD_LANGUAGE,
+    WAKE_WORD_MODEL_SIZE
+)
+from services.stt_routing import WHISPER_PROFILES
+from services.wake_word import WakeWordDetector
+from benchmarks.benchmark_audio_encoding import _synthetic_speech
+
+SAMPLE_RATE = 16000
+
+def _load_clip(path: str) -> np.ndarray:
+    audio, sample_rate = sf.read(path, dtype="float32", always_2d=True)
+    audio = audio.mean(axis=1)
+    if sample_rate != SAMPLE_RATE:
+        positions = np.arange(0, len(audio), sample_rate / SAMPLE_RATE)
+        audio = np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+    return audio
+
+def _clips(args) -> list:
+    speech = _load_clip(args.file) if args.file else _synthetic_speech(2.0, SAMPLE_RATE)
+    rng = np.random.default_rng(0)
+    silence = (rng.normal(0, 0.002, len(speech))).astype(np.float32)
+    n_silent = int(args.clips * args.silence_ratio)
+    clips = [silence] * n_silent + [speech] * (args.clips - n_silent)
+    rng.shuffle(clips)
+    return clips
+
+async def _run(clips, check, concurrency):
+    latencies = []
+    queue = asyncio.Queue()
+    for clip in clips:
+        queue.put_nowait(clip)
+
+    async def client():
+        while not queue.empty():
+            clip = queue.get_nowait()
+            start = time.perf_counter()
+            await check(clip)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return time.perf_counter() - start, latencies
+
+def _background_load(model, executor, seconds, profile):
+    """Длинная транскрипция в общем пуле — занимает его, как реальные запросы /stt/."""
+    if seconds <= 0:
+        return None
+    audio = _synthetic_speech(seconds, SAMPLE_RATE)
+
+    def run():
+        segments, _ = model.transcribe(audio, **profile.decode_options())
+        return " ".join(s.text for s in segments)
+
+    return [executor.submit(run) for _ in range(AUDIO_INFERENCE_WORKERS)]
+
+def _report(name, elapsed, latencies):
+    latencies_ms = np.asarray(latencies) * 1000
+    print(
+        f"{name:<10}{len(latencies) / elapsed:>10.1f}"
+        f"{np.percentile(latencies_ms, 50):>10.0f}{np.percentile(latencies_ms, 95):>10.0f}"
+    )
+
+async def main_async(args):
+    clips = _clips(args)
+    profile = WHISPER_PROFILES[args.legacy_profile]
+    print(f"{len(clips)} clips ({args.silence_ratio:.0%} silence), concurrency {args.concurrency}, "
+          f"legacy profile '{profile.name}' ({profile.model_size}), wake word model '{WAKE_WORD_MODEL_SIZE}'")
+
+    legacy_model = WhisperModel(profile.model_size, device="cpu", compute_type="int8")
+    shared_executor = ThreadPoolExecutor(max_workers=AUDIO_INFERENCE_WORKERS)
+    loop = asyncio.get_running_loop()
+
+    async def legacy_check(clip):
+        def run():
+            segments, _ = legacy_model.transcribe(clip, **profile.decode_options())
+            return " ".join(s.text.strip() for s in segments)
+        await loop.run_in_executor(shared_executor, run)
+        await asyncio.sleep(0.3)
+
+    wake_model = WhisperModel(
+        WAKE_WORD_MODEL_SIZE, device="cpu", compute_type="int8",
+        num_workers=WAKE_WORD_CONCURRENCY, cpu_threads=WAKE_WORD_CPU_THREADS
+    )
+    detector = WakeWordDetector(
+        lambda: wake_model, WAKE_WORD_KEYWORDS, language=WAKE_WORD_LANGUAGE, max_workers=WAKE_WORD_CONCURRENCY
+    )
+
+    # Прогрев обеих моделей
+    await legacy_check(clips[0])
+    await detector.detect(_synthetic_speech(1.0, SAMPLE_RATE))
+
+    print(f"{'path':<10}{'clips/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    background = _background_load(legacy_model, shared_executor, args.background_seconds, profile)
+    _report("legacy", *await _run(clips, legacy_check, args.concurrency))
+    if background:
+        for future in background:
+            future.result()
+
+    background = _background_load(legacy_model, shared_executor, args.background_seconds, profile)
+    _report("fast", *await _run(clips, detector.detect, args.concurrency))
+    if background:
+        for future in background:
+            future.result()
+    print(f"fast path stats: {detector.stats()}")
+    detector.shutdown()
+    shared_executor.shutdown()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", type=str, default=None, help="Клип с произнесенной ключевой фразой")
+    parser.add_argument("--clips", type=int, default=40)
+    parser.add_argument("--silence-ratio", type=float, default=0.7)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--legacy-profile", type=str, default="fastest", choices=list(WHISPER_PROFILES))
+    parser.add_argument("--background-seconds", type=float, default=0)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""RSS и PSS master-процесса и его воркеров (gunicorn, пул инференса).
+
+Запуск из каталога backend (под тем же пользователем, что и сервер, или root):
+    python -m benchmarks.measure_worker_memory [--pid <master pid>] [--watch 5]
+
+Без --pid ищется master gunicorn. RSS считает общие страницы в каждом процессе,
+поэтому сумма RSS завышает память; PSS делит общую страницу между процессами,
+которые ее отображают, и сумма PSS — реальный расход. Shared — страницы, общие
+с другими процессами (веса, загруженные до fork), Private — собственные.
+"""
+import argparse
+import time
+from pathlib import Path
+
+PROC = Path("/proc")
+FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty", "Swap")
+
+def _read_memory(pid: int) -> dict:
+    """Поля smaps_rollup в байтах (на старых ядрах — сумма по smaps)."""
+    totals = dict.fromkeys(FIELDS, 0)
+    path = PROC / str(pid) / "smaps_rollup"
+    if not path.exists():
+        path = PROC / str(pid) / "smaps"
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            field = parts[0].rstrip(":")
+            if field in totals and len(parts) >= 2:
+                totals[field] += int(parts[1]) * 1024
+    return totals
+
+def _cmdline(pid: int) -> str:
+    try:
+        return (PROC / str(pid) / "cmdline").read_bytes().replace(b"\0", b" ").decode(errors="replace").strip()
+    except OSError:
+        return ""
+
+def _parent_pids() -> dict:
+    parents = {}
+    for entry in PROC.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+        except OSError:
+            continue
+        # Имя процесса в скобках может содержать пробелы — поля считаются после него
+        parents[int(entry.name)] = int(stat.rsplit(")", 1)[1].split()[1])
+    return parents
+
+def _descendants(pid: int, parents: dict) -> list:
+    result = []
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        children = sorted(child for child, parent in parents.items() if parent == current)
+        result.extend(children)
+        stack.extend(children)
+    return result
+
+def _find_master(parents: dict) -> int:
+    candidates = [pid for pid in parents if "gunicorn" in _cmdline(pid)]
+    masters = [pid for pid in candidates if parents[pid] not in candidates]
+    if not masters:
+        raise SystemExit("gunicorn master not found, pass --pid")
+    return min(masters)
+
+def _mb(value: int) -> str:
+    return f"{value / 1024**2:>10.1f}"
+
+def report(master: int):
+    parents = _parent_pids()
+    pids = [master] + _descendants(master, parents)
+    header = f"{'pid':>8}{'role':>8}" + "".join(f"{name:>15}" for name in ("RSS MB", "PSS MB", "Shared MB", "Private MB", "Swap MB"))
+    print(header)
+    totals = dict.fromkeys(FIELDS, 0)
+    for pid in pids:
+        try:
+            memory = _read_memory(pid)
+        except OSError as e:
+            print(f"{pid:>8}  unreadable: {e}")
+            continue
+        for field in FIELDS:
+            totals[field] += memory[field]
+        role = "master" if pid == master else "worker"
+        print(
+            f"{pid:>8}{role:>8}"
+            f"{_mb(memory['Rss']):>15}{_mb(memory['Pss']):>15}"
+            f"{_mb(memory['Shared_Clean'] + memory['Shared_Dirty']):>15}"
+            f"{_mb(memory['Private_Clean'] + memory['Private_Dirty']):>15}"
+            f"{_mb(memory['Swap']):>15}"
+        )
+    print(
+        f"{'total':>16}{_mb(totals['Rss']):>15}{_mb(totals['Pss']):>15}"
+        f"{_mb(totals['Shared_Clean'] + totals['Shared_Dirty']):>15}"
+        f"{_mb(totals['Private_Clean'] + totals['Private_Dirty']):>15}"
+        f"{_mb(totals['Swap']):>15}"
+    )
+    workers = len(pids) - 1
+    if workers:
+        print(f"{workers} workers: PSS {totals['Pss'] / 1024**2:.0f} MB actually used, "
+              f"RSS sum {totals['Rss'] / 1024**2:.0f} MB ({totals['Rss'] / max(totals['Pss'], 1):.1f}x overcounted)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pid", type=int, default=None, help="PID master-процесса")
+    parser.add_argument("--watch", type=float, default=0, help="Повторять каждые N секунд")
+    args = parser.parse_args()
+
+    master = args.pid or _find_master(_parent_pids())
+    if not (PROC / str(master)).exists():
+        raise SystemExit(f"Process {master} not found")
+    print(f"Master {master}: {_cmdline(master)}")
+    while True:
+        report(master)
+        if args.watch <= 0:
+            break
+        time.sleep(args.watch)
+        print()
+
+if __name__ == "__main__":
+    main()
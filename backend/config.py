@@ -24,3 +24,206 @@ JWT_ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1200
 GEN_TEMP = 0.6
 SAMPLE_RATE = 24000
+
+# Logging (см. logging_setup.py)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Уровни по подсистемам: "llm=DEBUG,sqlalchemy.engine=INFO" (INFO у sqlalchemy.engine — весь SQL)
+LOG_LEVELS = {
+    name.strip(): level.strip().upper()
+    for name, level in (
+        item.split("=") for item in os.getenv(
+            "LOG_LEVELS", "sqlalchemy.engine=WARNING,httpx=WARNING,httpcore=WARNING,openai=WARNING,numba=WARNING"
+        ).split(",") if item
+    )
+}
+# Лимит записей в секунду ниже WARNING для шумных категорий (префикс имени логгера)
+LOG_RATE_LIMITS = {
+    name.strip(): float(rate)
+    for name, rate in (
+        item.split("=") for item in os.getenv("LOG_RATE_LIMITS", "llm.parse=2,uvicorn.access=50").split(",") if item
+    )
+}
+# json — одна строка JSON на запись, text — прежний читаемый формат
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Пустое значение — только stdout
+LOG_FILE = os.getenv("LOG_FILE", "logs/app.log")
+
+# Tracing (см. tracing.py)
+# file — OTLP/JSON в TRACE_FILE, otlp — POST на коллектор, none — выключено
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "file").lower()
+# Доля запросов, трассы которых выгружаются всегда
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.05"))
+# Запрос дольше порога выгружается независимо от доли (0 — только по доле)
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "5000"))
+TRACE_FILE = os.getenv("TRACE_FILE", "logs/traces.jsonl")
+# Файл больше порога переименовывается в TRACE_FILE.1 (старые сдвигаются, хранится TRACE_FILE_BACKUPS)
+TRACE_FILE_MAX_MB = float(os.getenv("TRACE_FILE_MAX_MB", "100"))
+TRACE_FILE_BACKUPS = int(os.getenv("TRACE_FILE_BACKUPS", "3"))
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "actai-api")
+
+# Profiling (см. profiling.py)
+# Секрет для X-Profile-Token и /profiling/*; пусто — профилирование выключено
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+# Интервал сэмплирования профиля одного запроса
+PROFILING_REQUEST_INTERVAL_MS = float(os.getenv("PROFILING_REQUEST_INTERVAL_MS", "5"))
+# Частота постоянного сэмплирования всех потоков (0 — выключено)
+PROFILING_CONTINUOUS_HZ = float(os.getenv("PROFILING_CONTINUOUS_HZ", "0"))
+PROFILING_WINDOW_SECONDS = float(os.getenv("PROFILING_WINDOW_SECONDS", "600"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "logs/profiles")
+# Сколько последних профилей запросов хранить
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+
+# Background plan generation queue (см. services/plan_jobs.py)
+# Воркеров очереди в каждом API-процессе (0 — генерацию ведут только отдельные
+# процессы python -m services.plan_jobs); это же лимит одновременных генераций
+PLAN_JOB_WORKERS = int(os.getenv("PLAN_JOB_WORKERS", "2"))
+# Как часто свободный воркер проверяет очередь (задачи своего процесса будят его сразу)
+PLAN_JOB_POLL_SECONDS = float(os.getenv("PLAN_JOB_POLL_SECONDS", "2"))
+PLAN_JOB_MAX_ATTEMPTS = int(os.getenv("PLAN_JOB_MAX_ATTEMPTS", "3"))
+PLAN_JOB_RETRY_DELAY_SECONDS = float(os.getenv("PLAN_JOB_RETRY_DELAY_SECONDS", "30"))
+# Задача без heartbeat дольше порога считается брошенной и забирается другим воркером
+PLAN_JOB_STALE_SECONDS = float(os.getenv("PLAN_JOB_STALE_SECONDS", "120"))
+
+# Model warm-up configuration
+MODEL_WARMUP_ON_STARTUP = os.getenv("MODEL_WARMUP_ON_STARTUP", "true").lower() == "true"
+# Сколько секунд аудио-запрос ждет готовности модели, прежде чем вернуть 503
+MODEL_READY_TIMEOUT = float(os.getenv("MODEL_READY_TIMEOUT", "10"))
+# Требовать ли готовности моделей для /health/ready (для воркеров, обслуживающих только аудио)
+READINESS_REQUIRES_MODELS = os.getenv("READINESS_REQUIRES_MODELS", "false").lower() == "true"
+
+# Audio inference configuration
+# Размер единственного пула потоков для инференса STT/TTS на процесс
+AUDIO_INFERENCE_WORKERS = int(os.getenv("AUDIO_INFERENCE_WORKERS", "4"))
+# Сколько предложений синтезируется наперед при потоковом TTS
+STREAM_TTS_LOOKAHEAD = int(os.getenv("STREAM_TTS_LOOKAHEAD", "2"))
+
+# Streaming speech-to-text (WebSocket) configuration
+STT_STREAM_SAMPLE_RATE = 16000  # Клиент шлет PCM16 моно 16 кГц
+STT_VAD_SILENCE_MS = int(os.getenv("STT_VAD_SILENCE_MS", "600"))
+STT_MAX_UTTERANCE_SECONDS = float(os.getenv("STT_MAX_UTTERANCE_SECONDS", "15"))
+# Как часто (в секундах аудио) отправлять промежуточный транскрипт
+STT_PARTIAL_INTERVAL_SECONDS = float(os.getenv("STT_PARTIAL_INTERVAL_SECONDS", "1.0"))
+
+# Voice assistant pipeline (WebSocket STT -> LLM -> TTS, см. services/voice_pipeline.py)
+VOICE_LLM_MODEL = os.getenv("VOICE_LLM_MODEL", "gpt-4.1-mini")
+VOICE_REPLY_MAX_TOKENS = int(os.getenv("VOICE_REPLY_MAX_TOKENS", "300"))
+# Сколько прошлых реплик (пар вопрос-ответ) передается LLM как контекст диалога
+VOICE_HISTORY_TURNS = int(os.getenv("VOICE_HISTORY_TURNS", "6"))
+
+# TTS audio cache configuration (0 отключает кэш)
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "cache/tts")
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Speech-to-text upload ingestion
+# Загрузки меньше порога декодируются прямо из памяти, больше — через временный файл
+STT_SPILL_THRESHOLD_BYTES = int(os.getenv("STT_SPILL_THRESHOLD_BYTES", str(8 * 1024 * 1024)))
+STT_MAX_UPLOAD_BYTES = int(os.getenv("STT_MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+
+# Whisper micro-batching
+STT_BATCHING_ENABLED = os.getenv("STT_BATCHING_ENABLED", "true").lower() == "true"
+STT_BATCH_MAX_SIZE = int(os.getenv("STT_BATCH_MAX_SIZE", "8"))
+# Сколько миллисекунд сборщик ждет попутные запросы после первого
+STT_BATCH_WINDOW_MS = float(os.getenv("STT_BATCH_WINDOW_MS", "10"))
+
+# Whisper model tiers (см. services/stt_routing.py)
+WHISPER_DEFAULT_SIZE = "large-v3"
+WHISPER_PRELOAD_SIZES = [s for s in os.getenv("WHISPER_PRELOAD_SIZES", "base").split(",") if s]
+# Аудио короче порога (короткие команды) распознается быстрым профилем
+STT_SHORT_AUDIO_SECONDS = float(os.getenv("STT_SHORT_AUDIO_SECONDS", "4"))
+STT_DEFAULT_PROFILE = os.getenv("STT_DEFAULT_PROFILE", "accurate")
+STT_SHORT_AUDIO_PROFILE = os.getenv("STT_SHORT_AUDIO_PROFILE", "fast")
+# Подсказка языка для всех профилей (пусто — автоопределение)
+STT_LANGUAGE = os.getenv("STT_LANGUAGE") or None
+
+# Wake word fast path (см. services/wake_word.py)
+# Ключевые фразы через запятую; совпадение нечеткое (tiny-модель ошибается в написании)
+WAKE_WORD_KEYWORDS = [k.strip() for k in os.getenv("WAKE_WORD_KEYWORDS", "hey act ai,act ai").split(",") if k.strip()]
+WAKE_WORD_MODEL_SIZE = os.getenv("WAKE_WORD_MODEL_SIZE", "tiny")
+WAKE_WORD_LANGUAGE = os.getenv("WAKE_WORD_LANGUAGE", "en")
+# Свой пул потоков и своя копия модели: проверки не ждут длинных транскрипций
+WAKE_WORD_CONCURRENCY = int(os.getenv("WAKE_WORD_CONCURRENCY", "2"))
+WAKE_WORD_CPU_THREADS = int(os.getenv("WAKE_WORD_CPU_THREADS", "1"))
+# Распознается только начало клипа
+WAKE_WORD_MAX_SECONDS = float(os.getenv("WAKE_WORD_MAX_SECONDS", "3"))
+# Минимальное сходство (0..1) слов транскрипта с ключевой фразой; при 0.75 срабатывали
+# "hey, a tie" и "in fact a"
+WAKE_WORD_THRESHOLD = float(os.getenv("WAKE_WORD_THRESHOLD", "0.85"))
+
+# Long recordings: аудио длиннее порога режется по паузам и распознается параллельно
+STT_LONG_AUDIO_SECONDS = float(os.getenv("STT_LONG_AUDIO_SECONDS", "60"))
+STT_MAX_AUDIO_SECONDS = float(os.getenv("STT_MAX_AUDIO_SECONDS", "1800"))
+STT_CHUNK_SECONDS = float(os.getenv("STT_CHUNK_SECONDS", "28"))
+STT_CHUNK_OVERLAP_SECONDS = float(os.getenv("STT_CHUNK_OVERLAP_SECONDS", "1.0"))
+
+# Coqui TTS sentence pipeline
+# Сколько предложений синтезируется одновременно (скользящее окно)
+TTS_SENTENCE_CONCURRENCY = int(os.getenv("TTS_SENTENCE_CONCURRENCY", "3"))
+# Более длинные предложения делятся по знакам препинания и словам, а не обрезаются
+TTS_MAX_SENTENCE_CHARS = int(os.getenv("TTS_MAX_SENTENCE_CHARS", "200"))
+
+# XTTS voice registry: латенты кондиционирования образцов голоса
+XTTS_VOICE_CACHE_DIR = os.getenv("XTTS_VOICE_CACHE_DIR", "cache/voices")
+
+# TTS output encoding (см. services/audio_encoding.py)
+# Формат по умолчанию, если клиент не указал format и Accept не выбрал другой: opus, mp3 или wav
+TTS_DEFAULT_FORMAT = os.getenv("TTS_DEFAULT_FORMAT", "mp3")
+TTS_DEFAULT_BITRATE = os.getenv("TTS_DEFAULT_BITRATE", "medium")
+
+# Process-isolated inference (см. services/inference_workers.py)
+# Модели живут в отдельных процессах-воркерах, аудио передается через shared memory.
+# Включается явно: по умолчанию модели грузятся в процессе API (и под gunicorn
+# делятся copy-on-write, см. MODEL_PRELOAD_BEFORE_FORK)
+INFERENCE_PROCESS_ISOLATION = os.getenv("INFERENCE_PROCESS_ISOLATION", "false").lower() == "true"
+# Число процессов на модель — это же лимит одновременных задач модели
+INFERENCE_PROCESS_WORKERS = {
+    name: int(count)
+    for name, count in (
+        item.split("=") for item in os.getenv("INFERENCE_PROCESS_WORKERS", "whisper=1,tts=1,xtts=1").split(",") if item
+    )
+}
+# Задача дольше таймаута считается зависшей: воркер перезапускается
+INFERENCE_JOB_TIMEOUT = float(os.getenv("INFERENCE_JOB_TIMEOUT", "300"))
+INFERENCE_HEALTH_INTERVAL = float(os.getenv("INFERENCE_HEALTH_INTERVAL", "2"))
+# Unix-сокет общего сервера инференса (services/inference_server.py): процессы API
+# ходят в один пул воркеров. Пусто — пул в этом процессе; gunicorn.conf.py задает сам
+INFERENCE_SOCKET = os.getenv("INFERENCE_SOCKET", "")
+
+# CPU-optimized TTS (применяется только если модели работают на CPU, см. services/tts_cpu.py)
+# VITS: fp32, int8 (динамическая квантизация) или onnx (ONNX Runtime)
+TTS_CPU_MODE = os.getenv("TTS_CPU_MODE", "fp32")
+# XTTS: fp32 или int8
+XTTS_CPU_MODE = os.getenv("XTTS_CPU_MODE", "fp32")
+TTS_ONNX_PATH = os.getenv("TTS_ONNX_PATH", "cache/onnx/vctk_vits.onnx")
+# Сверка аудио оптимизированной VITS с fp32 при загрузке; при расхождении остается fp32
+TTS_CPU_PARITY_CHECK = os.getenv("TTS_CPU_PARITY_CHECK", "true").lower() == "true"
+
+# CPU thread budget (см. resources.py)
+# Сколько ядер отдать приложению; 0 — определить автоматически (affinity, cgroup, топология)
+CPU_BUDGET_CORES = float(os.getenv("CPU_BUDGET_CORES", "0"))
+# Доли ядер между Whisper, Torch TTS (VITS/XTTS) и обработкой запросов
+CPU_BUDGET_WEIGHTS = {
+    name: float(weight)
+    for name, weight in (
+        item.split("=") for item in os.getenv("CPU_BUDGET_WEIGHTS", "whisper=2,tts=2,api=1").split(",") if item
+    )
+}
+# Считать ли SMT-потоки (hyper-threading) отдельными ядрами для инференса
+CPU_BUDGET_USE_SMT = os.getenv("CPU_BUDGET_USE_SMT", "false").lower() == "true"
+# Число процессов API (воркеров gunicorn, см. gunicorn.conf.py): бюджет делится между ними
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# Model cache (см. model_registry.py)
+# Бюджет RAM под модели в процессе; при превышении выгружаются давно не использованные (0 — без лимита)
+MODEL_MEMORY_BUDGET_MB = int(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))
+# Модель без обращений дольше этого времени выгружается (0 — не выгружать)
+MODEL_IDLE_TTL_SECONDS = float(os.getenv("MODEL_IDLE_TTL_SECONDS", "1800"))
+# Модели, которые никогда не выгружаются: имя ("whisper" — все размеры) или ключ ("whisper:base")
+MODEL_PINNED = [m for m in os.getenv("MODEL_PINNED", "whisper,tts,wake_word").split(",") if m]
+
+# Copy-on-write preload (см. gunicorn.conf.py)
+# Модели грузятся в master-процессе gunicorn до fork, воркеры делят страницы весов.
+# gunicorn.conf.py включает его по умолчанию; при INFERENCE_PROCESS_ISOLATION=true не выполняется
+MODEL_PRELOAD_BEFORE_FORK = os.getenv("MODEL_PRELOAD_BEFORE_FORK", "false").lower() == "true"
+# Какие модели грузить в master; Whisper (CTranslate2) fork не переживает и грузится в каждом воркере
+MODEL_PRELOAD_NAMES = [m for m in os.getenv("MODEL_PRELOAD_NAMES", "tts,xtts").split(",") if m]
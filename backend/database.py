@@ -1,13 +1,65 @@
+import time
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from config import DATABASE_URL
+from metrics import DB_POOL_CHECKOUT_SECONDS, DB_POOL_CHECKED_OUT, DB_QUERY_SECONDS
+from tracing import KIND_CLIENT, begin_child_span
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Пул соединений, который меряет ожидание свободного соединения."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - start)
 
 # Создаем асинхронный движок базы данных
+# SQL не пишется echo из event loop; нужен — LOG_LEVELS=sqlalchemy.engine=INFO
 saengine = create_async_engine(
     DATABASE_URL.replace('postgresql://', 'postgresql+asyncpg://'),
-    echo=True
+    poolclass=InstrumentedPool
 )
 
+@event.listens_for(saengine.sync_engine.pool, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    DB_POOL_CHECKED_OUT.inc()
+
+@event.listens_for(saengine.sync_engine.pool, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    DB_POOL_CHECKED_OUT.dec()
+
+def _operation(statement: str) -> str:
+    # Метка — тип запроса (SELECT, INSERT, ...), а не текст: число рядов ограничено
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    return operation if operation in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER"
+
+@event.listens_for(saengine.sync_engine, "before_cursor_execute")
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    # Время и спан храним в контексте выполнения: при ошибке их закрывает _on_error
+    operation = _operation(statement)
+    context.query_start = time.perf_counter()
+    # Текст без значений параметров: они передаются отдельно и в спан не попадают.
+    # Спан только внутри трассы: запросы вне нее (heartbeat, опрос очереди) не плодят трассы
+    context.query_span = begin_child_span(
+        f"db.{operation.lower()}", kind=KIND_CLIENT,
+        **{"db.system": "postgresql", "db.operation": operation, "db.statement": statement[:1000]}
+    )
+
+@event.listens_for(saengine.sync_engine, "after_cursor_execute")
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    DB_QUERY_SECONDS.labels(_operation(statement)).observe(time.perf_counter() - context.query_start)
+    context.query_span.end()
+
+@event.listens_for(saengine.sync_engine, "handle_error")
+def _on_error(exception_context):
+    span = getattr(exception_context.execution_context, "query_span", None)
+    if span is not None:
+        span.end(exception_context.original_exception)
+
 # Создаем фабрику асинхронных сессий
 async_session = sessionmaker(
     saengine,
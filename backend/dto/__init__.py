@@ -10,7 +10,8 @@ from dto.plan import (
     PlanBase,
     PlanCreate,
     PlanUpdate,
-    PlanResponse
+    PlanResponse,
+    PlanJobResponse
 )
 from .task import (
     TaskBase,
@@ -41,6 +42,7 @@ __all__ = [
     "PlanUpdate",
     "PlanInDB",
     "PlanResponse",
+    "PlanJobResponse",
     "TaskBase",
     "TaskCreate",
     "TaskUpdate",
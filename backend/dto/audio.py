@@ -1,12 +1,29 @@
 from typing import Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 
 
 class TextRequest(BaseModel):
     text: str
     gender: str = "M"
+    # Отдавать аудио по предложениям по мере синтеза — только WAV-поток, format/bitrate другие не принимаются
+    stream: bool = False
+    # Формат ответа: opus, mp3 или wav; если не задан — по заголовку Accept
+    format: Optional[str] = None
+    # Пресет битрейта для сжатых форматов: low, medium, high
+    bitrate: Optional[str] = None
+    # Темп речи: 1.0 — как синтезировано, 1.25 — на четверть быстрее (высота тона сохраняется)
+    speed: float = Field(default=1.0, ge=0.5, le=2.0)
 
 class AudioResponse(BaseModel):
     processed_text: str
-    file_path: Optional[str] = None
\ No newline at end of file
+    file_path: Optional[str] = None
+
+class WakeWordResponse(BaseModel):
+    detected: bool
+    keyword: Optional[str] = None
+    text: str
+    score: float
+    # Клип без речи: модель не запускалась
+    skipped: bool
+    latency_ms: float
@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from datetime import datetime
+import json
 from pydantic import validator
 
 class TaskBase(BaseModel):
@@ -95,6 +96,31 @@ class PlanResponse(PlanBase):
     class Config:
         from_attributes = True
 
+class PlanJobResponse(BaseModel):
+    """Статус фоновой генерации плана"""
+    id: int
+    status: str  # queued | running | succeeded | failed
+    attempts: int
+    objective: str
+    duration: str
+    plan_id: Optional[int] = None
+    error: Optional[str] = None
+    # Промежуточный план: данные шага 1 и уже готовые этапы с задачами
+    partial_result: Optional[Dict[str, Any]] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    @validator('partial_result', pre=True)
+    def parse_partial_result(cls, v):
+        # В БД хранится JSON-строкой
+        if isinstance(v, str):
+            return json.loads(v)
+        return v
+
+    class Config:
+        from_attributes = True
+
 class MilestoneUpdateRequest(BaseModel):
     title: str = Field(..., min_length=1, max_length=255)
     description: Optional[str] = Field(None, max_length=1000)
\ No newline at end of file
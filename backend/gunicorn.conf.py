@@ -0,0 +1,72 @@
+"""Запуск API в нескольких процессах через gunicorn с uvicorn-воркерами.
+
+Запуск из каталога backend:
+    gunicorn -c gunicorn.conf.py main:app
+
+По умолчанию (MODEL_PRELOAD_BEFORE_FORK=true под gunicorn) приложение и модели
+(MODEL_PRELOAD_NAMES) загружаются в master-процессе до fork: воркеры делят
+страницы весов copy-on-write, и память растет не на размер моделей с каждым
+воркером. Память по воркерам: python -m benchmarks.measure_worker_memory
+
+Альтернатива — INFERENCE_PROCESS_ISOLATION=true: модели в воркерах API не
+загружаются, master запускает один сервер инференса (services/inference_server.py),
+и все воркеры API отправляют ему задачи через Unix-сокет INFERENCE_SOCKET.
+Модели загружаются один раз, preload до fork тогда не нужен и не выполняется.
+
+Метрики /metrics по всем воркерам: PROMETHEUS_MULTIPROC_DIR=<пустой каталог>
+в окружении до запуска gunicorn (см. metrics.py).
+"""
+import os
+import shutil
+import tempfile
+
+# Число воркеров задается только через WEB_CONCURRENCY: config читает его при
+# импорте, чтобы поделить бюджет CPU (resources.py) между воркерами
+os.environ.setdefault("WEB_CONCURRENCY", "2")
+# Несколько воркеров — preload до fork включен по умолчанию (выключить: MODEL_PRELOAD_BEFORE_FORK=false)
+os.environ.setdefault("MODEL_PRELOAD_BEFORE_FORK", "true")
+# Сокет общего сервера инференса; воркеры API наследуют переменную от master
+os.environ.setdefault("INFERENCE_SOCKET", os.path.join(tempfile.gettempdir(), f"actai-inference-{os.getpid()}.sock"))
+
+from config import INFERENCE_PROCESS_ISOLATION, MODEL_PRELOAD_BEFORE_FORK, WEB_CONCURRENCY
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = WEB_CONCURRENCY
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
+graceful_timeout = 30
+
+# С изоляцией инференса модели живут в сервере инференса, а не в API
+preload_models = MODEL_PRELOAD_BEFORE_FORK and not INFERENCE_PROCESS_ISOLATION
+# Импорт приложения (torch, TTS, ...) в master — его страницы тоже общие
+preload_app = preload_models
+
+inference_supervisor = None
+
+def on_starting(server):
+    multiprocess_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if multiprocess_dir:
+        # Файлы метрик прошлого запуска дали бы чужие значения счетчиков
+        shutil.rmtree(multiprocess_dir, ignore_errors=True)
+        os.makedirs(multiprocess_dir, exist_ok=True)
+    if INFERENCE_PROCESS_ISOLATION:
+        global inference_supervisor
+        server.log.info("INFERENCE_PROCESS_ISOLATION=true: models are loaded once by the shared inference server")
+        # Перезапуски сервера инференса пишутся через logging, как в воркерах
+        from logging_setup import setup_logging
+        setup_logging()
+        from metrics import mark_process_dead
+        from services.inference_server import InferenceServerSupervisor
+        inference_supervisor = InferenceServerSupervisor(os.environ["INFERENCE_SOCKET"], on_exit=mark_process_dead)
+        inference_supervisor.start()
+    if preload_models:
+        from model_registry import preload_for_fork
+        preload_for_fork()
+
+def on_exit(server):
+    if inference_supervisor is not None:
+        inference_supervisor.stop()
+
+def child_exit(server, worker):
+    from metrics import mark_process_dead
+    mark_process_dead(worker.pid)
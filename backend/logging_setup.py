@@ -0,0 +1,176 @@
+"""Логирование без блокировок на горячем пути.
+
+Обработчик на корневом логгере только кладет запись в очередь; форматирование
+(JSON), запись в файл с ротацией и в stdout делает фоновый поток QueueListener.
+Уровни задаются по подсистемам (LOG_LEVELS), шумные категории ограничиваются
+по частоте (LOG_RATE_LIMITS) — лишние записи отбрасываются еще до очереди.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from typing import Dict, Optional
+
+from config import LOG_FILE, LOG_FORMAT, LOG_LEVEL, LOG_LEVELS, LOG_RATE_LIMITS
+
+# Стандартные атрибуты LogRecord; все остальное пришло через extra=... и попадает в JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName"}
+
+_listener: Optional[QueueListener] = None
+_setup_lock = threading.Lock()
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON: время, уровень, логгер, сообщение и поля из extra."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "pid": record.process,
+            "thread": record.threadName
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", None)
+        return f"{text} (+{suppressed} suppressed)" if suppressed else text
+
+class RateLimitFilter(logging.Filter):
+    """Не больше N записей в секунду (с запасом burst=N) на категорию-префикс логгера.
+
+    WARNING и выше проходят всегда. Число отброшенных записей добавляется
+    полем suppressed к следующей пропущенной записи категории.
+    """
+
+    def __init__(self, limits: Dict[str, float]):
+        super().__init__()
+        # Длинные префиксы первыми: "llm.parse" важнее "llm"
+        self.prefixes = sorted(limits, key=len, reverse=True)
+        self.rates = dict(limits)
+        self._buckets: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def _category(self, name: str) -> Optional[str]:
+        for prefix in self.prefixes:
+            if name == prefix or name.startswith(prefix + "."):
+                return prefix
+        return None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        category = self._category(record.name)
+        if category is None:
+            return True
+        rate = self.rates[category]
+        now = time.monotonic()
+        with self._lock:
+            # [токены, время последнего пополнения, отброшено]
+            bucket = self._buckets.setdefault(category, [rate, now, 0])
+            bucket[0] = min(rate, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1
+            if bucket[2]:
+                record.suppressed = bucket[2]
+                bucket[2] = 0
+        return True
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Кладет запись в очередь, подготовив ее к форматированию в другом потоке.
+
+    В отличие от QueueHandler.prepare сообщение не склеивается с traceback:
+    исключение остается отдельным полем exc_text для JSON.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+def setup_logging():
+    """Настраивает корневой логгер; повторный вызов (reload, gunicorn) ничего не делает."""
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        formatter = JsonFormatter() if LOG_FORMAT == "json" else TextFormatter()
+        handlers = []
+        if LOG_FILE:
+            Path(LOG_FILE).parent.mkdir(parents=True, exist_ok=True)
+            file_handler = RotatingFileHandler(
+                filename=LOG_FILE,
+                maxBytes=10*1024*1024,  # 10MB
+                backupCount=5,
+                encoding='utf-8'
+            )
+            handlers.append(file_handler)
+        handlers.append(logging.StreamHandler(sys.stdout))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        # Очередь без лимита: логирующий поток никогда не ждет writer
+        log_queue = queue.SimpleQueue()
+        queue_handler = NonBlockingQueueHandler(log_queue)
+        if LOG_RATE_LIMITS:
+            queue_handler.addFilter(RateLimitFilter(LOG_RATE_LIMITS))
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(LOG_LEVEL)
+        for name, level in LOG_LEVELS.items():
+            logging.getLogger(name).setLevel(level)
+        # uvicorn ставит свои синхронные обработчики — его записи тоже идут через очередь
+        for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+            uvicorn_logger = logging.getLogger(name)
+            uvicorn_logger.handlers.clear()
+            uvicorn_logger.propagate = True
+
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+
+def stop_logging():
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+def _reinit_after_fork():
+    # Поток-writer в дочерний процесс не копируется: воркер gunicorn (preload_app)
+    # заводит свою очередь и свой writer, иначе записи копились бы в очереди без читателя
+    global _listener, _setup_lock
+    _setup_lock = threading.Lock()
+    if _listener is not None:
+        _listener = None
+        setup_logging()
+
+# Дописывает остаток очереди при остановке процесса
+atexit.register(stop_logging)
+os.register_at_fork(after_in_child=_reinit_after_fork)
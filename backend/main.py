@@ -1,40 +1,28 @@
 from fastapi import FastAPI, HTTPException, Request
 from contextlib import asynccontextmanager
 import uvicorn
-import logging.config
+import asyncio
+import logging
 import traceback
 from auth import auth_router
-from model_registry import get_whisper_model, get_tts_model, get_xtts_model
+from model_registry import start_background_warmup
+from concurrent.futures import ThreadPoolExecutor
+from config import MODEL_WARMUP_ON_STARTUP
+from resources import get_cpu_allocation
+from services.audio_service import AudioService
+from services.plan_jobs import PlanJobWorkerPool
 from database import saengine, Base, init_db
-from routers import user_router, plan_router, task_router, milestone_router, daily_checkin_router, audio_router
+from routers import user_router, plan_router, task_router, milestone_router, daily_checkin_router, audio_router, health_router, metrics_router, profiling_router
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware import Middleware
-from fastapi.middleware.gzip import GZipMiddleware
+from middleware import MetricsMiddleware, ProfilingMiddleware, SelectiveGZipMiddleware, TracingMiddleware
+from profiling import ContinuousProfiler
 from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
-from pathlib import Path
-import sys
-import os
-from logging.handlers import RotatingFileHandler
+from logging_setup import setup_logging
 
-# Создаем директорию для логов
-log_dir = Path("logs")
-log_dir.mkdir(exist_ok=True)
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        RotatingFileHandler(
-            filename=log_dir / "app.log",
-            maxBytes=10*1024*1024,  # 10MB
-            backupCount=5,
-            encoding='utf-8'
-        ),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+# Записи идут через очередь в фоновый поток: логирование не пишет в файл из event loop
+setup_logging()
 
 logger = logging.getLogger(__name__)
 
@@ -45,19 +33,51 @@ async def lifespan(app: FastAPI):
         logger.info("Initializing database...")
         await init_db()
         logger.info("Database initialized successfully!")
-        get_whisper_model()
-        get_tts_model()
-        get_xtts_model()
+        # Потоки делятся между Whisper, Torch TTS и обработкой запросов по весам бюджета
+        allocation = get_cpu_allocation()
+        logger.info(allocation.report())
+        # Пул по умолчанию (asyncio.to_thread: декодирование загрузок и т.п.) — в доле запросов
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=max(2, allocation.api_threads), thread_name_prefix="api")
+        )
+        # Общие аудио-ресурсы (NLTK, пул инференса) готовятся один раз на процесс
+        await asyncio.get_running_loop().run_in_executor(None, AudioService.prepare_resources)
+        # Модели грузятся в фоне: не-аудио эндпоинты доступны сразу
+        audio_service = AudioService.get_instance()
+        # Модель wake word маленькая и грузится в своем пуле — проверки готовы раньше основных моделей
+        audio_service.wake_word.warm_up()
+        inference_pool = audio_service.inference_pool
+        if inference_pool is not None:
+            # Воркеры сами загружают свои модели и сообщают о готовности;
+            # без прогрева они запускаются при первом обращении к модели
+            inference_pool.start(warm_up=MODEL_WARMUP_ON_STARTUP)
+        elif MODEL_WARMUP_ON_STARTUP:
+            start_background_warmup()
     except Exception as e:
         logger.error(f"Error during startup: {str(e)}")
         logger.error(traceback.format_exc())
         raise
+    # Постоянное низкочастотное сэмплирование (PROFILING_CONTINUOUS_HZ > 0)
+    ContinuousProfiler.start()
+    # Воркеры очереди фоновой генерации планов (PLAN_JOB_WORKERS на процесс)
+    plan_job_pool = PlanJobWorkerPool.get_instance()
+    plan_job_pool.start()
     yield
+    # Незавершенные генерации возвращаются в очередь и продолжаются другим процессом
+    await plan_job_pool.stop()
+    ContinuousProfiler.stop()
+    AudioService.shutdown()
 
 app = FastAPI(
     lifespan=lifespan,
     middleware=[
-        Middleware(GZipMiddleware, minimum_size=1000),
+        # Внешний слой: время запроса включает сжатие и всю отправку ответа
+        Middleware(MetricsMiddleware),
+        Middleware(TracingMiddleware),
+        # Внутри метрик и трассировки: в профиль попадает сериализация и сжатие ответа
+        Middleware(ProfilingMiddleware),
+        # Аудио уже сжато кодеком (или идет потоком) — gzip только тратил бы CPU
+        Middleware(SelectiveGZipMiddleware, minimum_size=1000, excluded_prefixes=("/api/audio",)),
     ],
     title="ActAI API",
     description="API для ActAI - системы планирования обучения и мотивации",
@@ -75,8 +95,7 @@ app.add_middleware(
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
-    logger.error(f"Global error handler caught: {str(exc)}")
-    logger.error(traceback.format_exc())
+    logger.exception(f"Global error handler caught: {str(exc)}", extra={"path": request.url.path})
     return JSONResponse(
         status_code=500,
         content={"detail": "Internal server error", "error": str(exc)}
@@ -88,4 +107,7 @@ app.include_router(plan_router, prefix="/api")
 app.include_router(task_router, prefix="/api")
 app.include_router(milestone_router, prefix="/api")
 app.include_router(daily_checkin_router.router, prefix="/api")
-app.include_router(audio_router, prefix="/api")
\ No newline at end of file
+app.include_router(audio_router, prefix="/api")
+app.include_router(health_router)
+app.include_router(metrics_router)
+app.include_router(profiling_router)
\ No newline at end of file
@@ -0,0 +1,143 @@
+"""Метрики Prometheus для /metrics: HTTP, пул БД, OpenAI, инференс моделей.
+
+Счетчики живут в памяти процесса (prometheus_client, без блокировок на горячем
+пути кроме атомарного инкремента). Несколько воркеров gunicorn: задайте
+PROMETHEUS_MULTIPROC_DIR — каждый процесс пишет значения в свои mmap-файлы в этом
+каталоге, а /metrics любого воркера агрегирует их по всем процессам.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess
+)
+
+from tracing import start_span
+
+MULTIPROCESS_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Границы под наши задержки: от миллисекунд (кэш, БД) до минут (генерация плана, длинный STT)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "actai_http_request_duration_seconds",
+    "Время обработки HTTP-запроса до последнего байта ответа",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "actai_http_requests_in_progress",
+    "HTTP-запросы в обработке",
+    ["method"],
+    multiprocess_mode="livesum"
+)
+
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "actai_db_pool_checkout_seconds",
+    "Ожидание соединения из пула БД",
+    buckets=DB_BUCKETS
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "actai_db_pool_checked_out",
+    "Соединения БД, выданные из пула",
+    multiprocess_mode="livesum"
+)
+DB_QUERY_SECONDS = Histogram(
+    "actai_db_query_duration_seconds",
+    "Время выполнения SQL-запроса",
+    ["operation"],
+    buckets=DB_BUCKETS
+)
+
+LLM_REQUEST_SECONDS = Histogram(
+    "actai_llm_request_duration_seconds",
+    "Время одного вызова OpenAI",
+    ["step", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+LLM_STEP_SECONDS = Histogram(
+    "actai_llm_step_duration_seconds",
+    "Время шага генерации целиком (с повторами и разбором ответа)",
+    ["step", "outcome"],
+    buckets=LATENCY_BUCKETS
+)
+LLM_TOKENS = Counter(
+    "actai_llm_tokens",
+    "Токены OpenAI по шагам генерации",
+    ["step", "kind"]
+)
+LLM_CACHE = Counter(
+    "actai_llm_cache_lookups",
+    "Обращения к кэшу ответов LLM",
+    ["step", "result"]
+)
+LLM_RETRIES = Counter(
+    "actai_llm_retries",
+    "Повторы вызовов после ошибки",
+    ["step"]
+)
+
+INFERENCE_SECONDS = Histogram(
+    "actai_inference_duration_seconds",
+    "Время задачи инференса с учетом ожидания в очереди",
+    ["model", "operation"],
+    buckets=LATENCY_BUCKETS
+)
+INFERENCE_QUEUE_DEPTH = Gauge(
+    "actai_inference_queue_depth",
+    "Задачи инференса, поставленные и еще не завершенные (в очереди и в работе)",
+    ["model"],
+    multiprocess_mode="livesum"
+)
+INFERENCE_QUEUE_WAIT_SECONDS = Histogram(
+    "actai_inference_queue_wait_seconds",
+    "Ожидание свободного процесса-воркера инференса",
+    ["model"],
+    buckets=LATENCY_BUCKETS
+)
+
+PLAN_JOB_SECONDS = Histogram(
+    "actai_plan_job_duration_seconds",
+    "Время попытки фоновой генерации плана",
+    ["outcome"],
+    buckets=LATENCY_BUCKETS
+)
+PLAN_JOBS_RUNNING = Gauge(
+    "actai_plan_jobs_running",
+    "Задачи генерации планов, выполняемые воркерами",
+    multiprocess_mode="livesum"
+)
+
+@contextmanager
+def track_inference(model: str, operation: str):
+    """Глубина очереди и время задачи инференса модели, плюс спан задачи в трассе запроса."""
+    depth = INFERENCE_QUEUE_DEPTH.labels(model)
+    depth.inc()
+    start = time.perf_counter()
+    try:
+        with start_span(f"inference.{model}", **{"inference.model": model, "inference.operation": operation}):
+            yield
+    finally:
+        depth.dec()
+        INFERENCE_SECONDS.labels(model, operation).observe(time.perf_counter() - start)
+
+def render_metrics():
+    """Тело ответа /metrics и его content type."""
+    if MULTIPROCESS_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+def mark_process_dead(pid: int):
+    """Убирает live-гейджи завершившегося воркера (вызывается из gunicorn child_exit)."""
+    if MULTIPROCESS_DIR:
+        multiprocess.mark_process_dead(pid)
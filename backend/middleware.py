@@ -0,0 +1,165 @@
+import asyncio
+import threading
+import time
+from urllib.parse import parse_qs
+
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import Message, Receive, Scope, Send
+
+from config import PROFILING_REQUEST_INTERVAL_MS, PROFILING_TOKEN
+from metrics import HTTP_REQUEST_SECONDS, HTTP_REQUESTS_IN_PROGRESS
+from profiling import check_profiling_token, finish_request_profile, new_profile_id, try_begin_request_profile
+from tracing import KIND_SERVER, TRACING_ENABLED, start_span
+
+class SelectiveGZipMiddleware(GZipMiddleware):
+    """GZip для JSON/текста, кроме путей с уже сжатым или потоковым содержимым.
+
+    Аудио (Opus/MP3) gzip почти не уменьшает, а потоковый WAV он буферизует
+    и задерживает, поэтому такие ответы проходят без сжатия.
+    """
+
+    def __init__(self, app, minimum_size: int = 500, excluded_prefixes: tuple = ()):
+        super().__init__(app, minimum_size=minimum_size)
+        self.excluded_prefixes = tuple(excluded_prefixes)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http" and scope["path"].startswith(self.excluded_prefixes):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+class MetricsMiddleware:
+    """Гистограмма времени HTTP-запросов по методу, шаблону маршрута и статусу.
+
+    Время считается до отправки последнего байта, поэтому потоковые ответы
+    (TTS по предложениям) учитываются целиком. Маршрут — шаблон пути
+    (/api/plans/{plan_id}), а не сам путь: иначе число рядов росло бы с каждым id.
+    """
+
+    def __init__(self, app, excluded_paths: tuple = ("/metrics",)):
+        self.app = app
+        self.excluded_paths = tuple(excluded_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["path"] in self.excluded_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        start = time.perf_counter()
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_progress.dec()
+            # Роутер FastAPI кладет найденный маршрут в scope
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                method, getattr(route, "path", "unmatched"), str(status_code)
+            ).observe(time.perf_counter() - start)
+
+class TracingMiddleware:
+    """Корневой спан трассы на HTTP-запрос; спаны шагов LLM, SQL и инференса вкладываются в него.
+
+    Id трассы возвращается в заголовке X-Trace-Id: по нему медленный запрос
+    находится в файле трасс или в Jaeger.
+    """
+
+    def __init__(self, app, excluded_paths: tuple = ("/metrics", "/health/live", "/health/ready")):
+        self.app = app
+        self.excluded_paths = tuple(excluded_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if not TRACING_ENABLED or scope["type"] != "http" or scope["path"] in self.excluded_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        traceparent = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+
+        with start_span(
+            method, kind=KIND_SERVER, traceparent=traceparent,
+            **{"http.request.method": method, "url.path": scope["path"]}
+        ) as span:
+            async def send_with_trace_id(message: Message):
+                if message["type"] == "http.response.start":
+                    status_code = message["status"]
+                    span.set_attribute("http.response.status_code", status_code)
+                    if status_code >= 500:
+                        span.set_error(f"HTTP {status_code}")
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-trace-id", span.trace_id.encode())]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_with_trace_id)
+            finally:
+                route = getattr(scope.get("route"), "path", None)
+                if route is not None:
+                    # Имя спана — шаблон маршрута, как принято в OpenTelemetry для HTTP
+                    span.name = f"{method} {route}"
+                    span.set_attribute("http.route", route)
+
+class ProfilingMiddleware:
+    """Профилирует один запрос по заголовку X-Profile: 1 (или ?__profile=1) с токеном X-Profile-Token.
+
+    В профиль входит весь путь запроса в event loop: обработчик, разбор
+    ответов LLM, расчет дат и сериализация ответа. Id сохраненного профиля —
+    в заголовке X-Profile-Id, скачать: GET /profiling/requests/{id}.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def _wants_profile(self, scope: Scope) -> bool:
+        headers = dict(scope["headers"])
+        flag = headers.get(b"x-profile") == b"1" or "1" in parse_qs(scope.get("query_string", b"").decode("latin-1")).get("__profile", [])
+        if not flag:
+            return False
+        token = headers.get(b"x-profile-token")
+        return check_profiling_token(token.decode("latin-1") if token is not None else None)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if not PROFILING_TOKEN or scope["type"] != "http" or not self._wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        sampler = try_begin_request_profile(PROFILING_REQUEST_INTERVAL_MS / 1000, threading.get_ident())
+        profile_id = new_profile_id() if sampler is not None else None
+        status_code = 500
+
+        async def send_with_profile_id(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                value = profile_id.encode() if profile_id else b"busy"
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", value)]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            if sampler is not None:
+                route = getattr(scope.get("route"), "path", scope["path"])
+                meta = {
+                    "method": scope["method"],
+                    "route": route,
+                    "status": status_code,
+                    "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+                    "created": time.time()
+                }
+                # Остановка сэмплера и запись файла — не в event loop
+                await asyncio.to_thread(finish_request_profile, sampler, profile_id, meta)
@@ -1,3 +1,12 @@
+import asyncio
+import ctypes
+import gc
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from dataclasses import dataclass
 import torch
 from faster_whisper import WhisperModel
 from TTS.api import TTS
@@ -7,52 +16,448 @@ from torch.serialization import add_safe_globals
 from TTS.tts.configs.xtts_config import XttsConfig, XttsAudioConfig
 from TTS.tts.models.xtts import XttsArgs
 from TTS.config.shared_configs import BaseDatasetConfig
+from config import (
+    WHISPER_DEFAULT_SIZE,
+    WHISPER_PRELOAD_SIZES,
+    TTS_CPU_MODE,
+    XTTS_CPU_MODE,
+    TTS_ONNX_PATH,
+    TTS_CPU_PARITY_CHECK,
+    MODEL_MEMORY_BUDGET_MB,
+    MODEL_IDLE_TTL_SECONDS,
+    MODEL_PINNED,
+    MODEL_PRELOAD_NAMES,
+    WAKE_WORD_MODEL_SIZE,
+    WAKE_WORD_CONCURRENCY,
+    WAKE_WORD_CPU_THREADS
+)
+from services.tts_cpu import optimize_vits_for_cpu, quantize_int8
+from resources import apply_torch_threads, get_cpu_allocation
 
 # Добавляем безопасные глобальные переменные для XTTS
 add_safe_globals([XttsConfig, XttsAudioConfig, BaseDatasetConfig, XttsArgs])
 
-# Глобальные переменные для хранения загруженных моделей
-whisper_model = None
-tts_model = None
-xtts_model = None
-
-def get_whisper_model():
-    global whisper_model
-    if whisper_model is None:
-        print("Loading Whisper model (first time)...")
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        compute_type = "float16" if device == "cuda" else "int8"
-        print(f"Using device: {device}, compute type: {compute_type}")
-        
+# Состояния готовности моделей
+MODEL_PENDING = "pending"
+MODEL_LOADING = "loading"
+MODEL_READY = "ready"
+MODEL_FAILED = "failed"
+# Выгружена из-за простоя или бюджета памяти; загрузится снова при следующем обращении
+MODEL_EVICTED = "evicted"
+
+MODEL_NAMES = ("whisper", "tts", "xtts")
+
+_model_status = {
+    name: {"state": MODEL_PENDING, "error": None, "load_seconds": None}
+    for name in MODEL_NAMES
+}
+_ready_events = {name: threading.Event() for name in MODEL_NAMES}
+_warmup_thread = None
+# Загрузка по требованию моделей, которые грузит не этот процесс (воркеры инференса)
+_external_loaders = {}
+
+@dataclass
+class _ModelEntry:
+    model: object
+    memory_bytes: int
+    gpu_bytes: int
+    load_seconds: float
+    loaded_at: float
+    last_used: float
+    uses: int = 0
+
+# Загруженные модели ("whisper:<size>", "tts", "xtts") в порядке последнего использования
+_models: "OrderedDict[str, _ModelEntry]" = OrderedDict()
+_models_lock = threading.RLock()
+# Загрузки идут по одной: память модели измеряется по приросту RSS, и два пика загрузки не совпадают
+_load_lock = threading.Lock()
+_evicted_keys = set()
+_cache_metrics = {"loads": 0, "reloads": 0, "evictions": 0, "load_failures": 0}
+_reaper_thread = None
+# Модели, загруженные в master-процессе до fork: их страницы общие с воркерами (copy-on-write)
+_preloaded_keys = set()
+
+def _process_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def _gpu_allocated_bytes() -> int:
+    return torch.cuda.memory_allocated() if torch.cuda.is_available() else 0
+
+def _status_name(key: str):
+    """Какому состоянию готовности соответствует модель кэша (малые Whisper — никакому)."""
+    if key == f"whisper:{WHISPER_DEFAULT_SIZE}":
+        return "whisper"
+    return key if key in MODEL_NAMES else None
+
+def _is_pinned(key: str) -> bool:
+    # Выгрузка общей с master модели не освобождает память, а повторная загрузка сделает частную копию
+    return key in _preloaded_keys or key in MODEL_PINNED or key.split(":")[0] in MODEL_PINNED
+
+def _touch_locked(entry: _ModelEntry, key: str):
+    entry.last_used = time.monotonic()
+    entry.uses += 1
+    _models.move_to_end(key)
+
+def _get_or_load(key: str, loader):
+    """Модель из кэша или загрузка под блокировкой (повторная — после выгрузки)."""
+    with _models_lock:
+        entry = _models.get(key)
+        if entry is not None:
+            _touch_locked(entry, key)
+            return entry.model
+
+    with _load_lock:
+        with _models_lock:
+            # Пока ждали блокировку, модель мог загрузить другой поток
+            entry = _models.get(key)
+            if entry is not None:
+                _touch_locked(entry, key)
+                return entry.model
+
+        status_name = _status_name(key)
+        if status_name:
+            set_model_state(status_name, MODEL_LOADING)
+        rss_before = _process_rss_bytes()
+        gpu_before = _gpu_allocated_bytes()
+        start = time.perf_counter()
         try:
-            whisper_model = WhisperModel("large-v3", 
-                                       device=device, 
-                                       compute_type=compute_type,
-                                       num_workers=2, 
-                                       cpu_threads=4)
-            # Проверяем доступность памяти GPU
-            if device == "cuda":
-                torch.cuda.empty_cache()
-                print(f"Available GPU memory: {torch.cuda.memory_allocated() / 1024**2:.2f} MB")
+            model = loader()
         except Exception as e:
-            print(f"Error loading Whisper model: {str(e)}")
+            _cache_metrics["load_failures"] += 1
+            if status_name:
+                set_model_state(status_name, MODEL_FAILED, error=str(e))
             raise
-    return whisper_model
+        load_seconds = round(time.perf_counter() - start, 2)
+        now = time.monotonic()
+        entry = _ModelEntry(
+            model=model,
+            memory_bytes=max(_process_rss_bytes() - rss_before, 0),
+            gpu_bytes=max(_gpu_allocated_bytes() - gpu_before, 0),
+            load_seconds=load_seconds,
+            loaded_at=now,
+            last_used=now,
+            uses=1
+        )
+
+        with _models_lock:
+            reloaded = key in _evicted_keys
+            _evicted_keys.discard(key)
+            _cache_metrics["loads"] += 1
+            if reloaded:
+                _cache_metrics["reloads"] += 1
+            _models[key] = entry
+            evicted = _evict_over_budget_locked(keep=key)
+        if status_name:
+            set_model_state(status_name, MODEL_READY, load_seconds=load_seconds)
+        print(f"Model '{key}' {'reloaded' if reloaded else 'loaded'} in {load_seconds}s "
+              f"(~{entry.memory_bytes / 1024**2:.0f} MB RAM, {entry.gpu_bytes / 1024**2:.0f} MB GPU)")
+        if evicted:
+            _release_memory()
+        _ensure_reaper()
+        return model
+
+def _evict_locked(key: str, reason: str):
+    entry = _models.pop(key)
+    _evicted_keys.add(key)
+    _cache_metrics["evictions"] += 1
+    status_name = _status_name(key)
+    if status_name:
+        set_model_state(status_name, MODEL_EVICTED, load_seconds=entry.load_seconds)
+    print(f"Model '{key}' evicted ({reason}, idle {time.monotonic() - entry.last_used:.0f}s, "
+          f"~{entry.memory_bytes / 1024**2:.0f} MB)")
+
+def _evict_over_budget_locked(keep: str) -> bool:
+    """LRU-выгрузка незакрепленных моделей, пока суммарная память выше бюджета."""
+    if MODEL_MEMORY_BUDGET_MB <= 0:
+        return False
+    budget = MODEL_MEMORY_BUDGET_MB * 1024 * 1024
+    evicted = False
+    while sum(e.memory_bytes for e in _models.values()) > budget:
+        candidate = next((k for k in _models if k != keep and not _is_pinned(k)), None)
+        if candidate is None:
+            break
+        _evict_locked(candidate, "memory budget")
+        evicted = True
+    return evicted
+
+def _release_memory():
+    # Модель, которая еще считает запрос, освободится, когда он закончится
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    try:
+        # Возвращаем освобожденные арены malloc системе, иначе RSS не уменьшится
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+def _reap_idle_models():
+    interval = max(min(MODEL_IDLE_TTL_SECONDS / 4, 60), 1)
+    while True:
+        time.sleep(interval)
+        now = time.monotonic()
+        with _models_lock:
+            idle = [
+                key for key, entry in _models.items()
+                if not _is_pinned(key) and now - entry.last_used > MODEL_IDLE_TTL_SECONDS
+            ]
+            for key in idle:
+                _evict_locked(key, "idle")
+        if idle:
+            _release_memory()
+
+def _ensure_reaper():
+    global _reaper_thread
+    if MODEL_IDLE_TTL_SECONDS <= 0 or (_reaper_thread is not None and _reaper_thread.is_alive()):
+        return
+    with _models_lock:
+        if _reaper_thread is None or not _reaper_thread.is_alive():
+            _reaper_thread = threading.Thread(target=_reap_idle_models, name="model_reaper", daemon=True)
+            _reaper_thread.start()
+
+def _load_whisper_model(model_size: str, num_workers: int = None, cpu_threads: int = None):
+    print(f"Loading Whisper {model_size} model...")
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    compute_type = "float16" if device == "cuda" else "int8"
+    # Потоки CTranslate2 берутся из бюджета CPU: num_workers x cpu_threads <= доля Whisper
+    allocation = get_cpu_allocation()
+    num_workers = num_workers or allocation.whisper_num_workers
+    cpu_threads = cpu_threads or allocation.whisper_cpu_threads
+    print(f"Using device: {device}, compute type: {compute_type}, "
+          f"workers: {num_workers} x {cpu_threads} threads")
+    
+    try:
+        model = WhisperModel(model_size, 
+                                   device=device, 
+                                   compute_type=compute_type,
+                                   num_workers=num_workers, 
+                                   cpu_threads=cpu_threads)
+        # Проверяем доступность памяти GPU
+        if device == "cuda":
+            torch.cuda.empty_cache()
+            print(f"Available GPU memory: {torch.cuda.memory_allocated() / 1024**2:.2f} MB")
+    except Exception as e:
+        print(f"Error loading Whisper model: {str(e)}")
+        raise
+    return model
+
+def _load_tts_model():
+    print("Loading Coqui TTS model...")
+    apply_torch_threads()
+    model = TTS("tts_models/en/vctk/vits")
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model.to(device)  # Современный синтаксис вместо gpu=True
+    if device == "cpu" and TTS_CPU_MODE != "fp32":
+        print(f"Optimizing Coqui TTS for CPU (mode: {TTS_CPU_MODE})...")
+        model = optimize_vits_for_cpu(
+            model, TTS_CPU_MODE, TTS_ONNX_PATH, TTS_CPU_PARITY_CHECK,
+            threads=get_cpu_allocation().torch_threads
+        )
+    return model
+
+def _load_xtts_model():
+    print("Loading XTTS model...")
+    apply_torch_threads()
+    model = TTS("tts_models/multilingual/multi-dataset/xtts_v2")
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    model.to(device)
+    if device == "cpu" and XTTS_CPU_MODE == "int8":
+        # XTTS сэмплирует токены — побитовой сверки с fp32 нет, качество проверяется бенчмарком
+        print("Quantizing XTTS to int8 for CPU...")
+        model = quantize_int8(model)
+    return model
+
+def get_whisper_model(model_size: str = WHISPER_DEFAULT_SIZE):
+    return _get_or_load(f"whisper:{model_size}", lambda: _load_whisper_model(model_size))
+
+def get_wake_word_model(model_size: str = WAKE_WORD_MODEL_SIZE):
+    """Отдельная копия Whisper для проверок wake word: своя очередь CTranslate2, не общая с транскрипциями."""
+    return _get_or_load(
+        f"wake_word:{model_size}",
+        lambda: _load_whisper_model(model_size, WAKE_WORD_CONCURRENCY, WAKE_WORD_CPU_THREADS)
+    )
 
 def get_tts_model():
-    global tts_model
-    if tts_model is None:
-        print("Loading Coqui TTS model (first time)...")
-        tts_model = TTS("tts_models/en/vctk/vits")
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        tts_model.to(device)  # Современный синтаксис вместо gpu=True
-    return tts_model
+    return _get_or_load("tts", _load_tts_model)
 
 def get_xtts_model():
-    global xtts_model
-    if xtts_model is None:
-        print("Loading XTTS model (first time)...")
-        xtts_model = TTS("tts_models/multilingual/multi-dataset/xtts_v2")
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        xtts_model.to(device)
-    return xtts_model
\ No newline at end of file
+    return _get_or_load("xtts", _load_xtts_model)
+
+MODEL_LOADERS = {
+    "whisper": get_whisper_model,
+    "tts": get_tts_model,
+    "xtts": get_xtts_model,
+}
+
+def _freeze_weights(model):
+    """Переводит torch-модули модели в режим только чтения: eval и без градиентов.
+
+    Инференс тогда не пишет в тензоры весов, и их страницы остаются общими
+    между master и воркерами.
+    """
+    synthesizer = getattr(model, "synthesizer", None)
+    modules = [m for m in vars(synthesizer).values() if isinstance(m, torch.nn.Module)] if synthesizer else []
+    for module in modules:
+        module.eval()
+        for parameter in module.parameters():
+            parameter.requires_grad_(False)
+
+def preload_for_fork(names=MODEL_PRELOAD_NAMES) -> list:
+    """Загружает модели в master-процессе до fork воркеров (gunicorn preload).
+
+    Воркеры наследуют кэш моделей и делят страницы весов copy-on-write вместо
+    собственной копии на каждый процесс. Возвращает имена загруженных моделей.
+    """
+    if torch.cuda.is_available():
+        # CUDA-контекст после fork в дочернем процессе непригоден
+        print("Model preload skipped: CUDA cannot be initialized before fork")
+        return []
+
+    # Межоперационный пул настраивается до первой операции torch; в master
+    # считаем в один поток, чтобы до fork не создавалась команда потоков OpenMP
+    apply_torch_threads()
+    torch.set_num_threads(1)
+    loaded = []
+    for name in names:
+        if name == "whisper":
+            print("Whisper is not preloaded: CTranslate2 worker threads do not survive fork")
+            continue
+        if name == "tts" and TTS_CPU_MODE == "onnx":
+            print("Coqui TTS is not preloaded: ONNX Runtime thread pools do not survive fork")
+            continue
+        try:
+            model = MODEL_LOADERS[name]()
+        except Exception as e:
+            print(f"Preload of '{name}' model failed: {str(e)}")
+            continue
+        _freeze_weights(model)
+        with _models_lock:
+            _preloaded_keys.add(name)
+        loaded.append(name)
+
+    # Объекты загрузки — в постоянное поколение GC: сборщик в воркерах не будет
+    # их обходить и писать в заголовки, разрывая общие страницы
+    gc.collect()
+    gc.freeze()
+    print(f"Preloaded before fork: {', '.join(loaded) or 'none'} (RSS {_process_rss_bytes() / 1024**2:.0f} MB)")
+    return loaded
+
+def _reinit_after_fork():
+    """Дочерний процесс после fork: блокировки и потоки родителя не наследуются."""
+    global _models_lock, _load_lock, _reaper_thread, _warmup_thread
+    _models_lock = threading.RLock()
+    _load_lock = threading.Lock()
+    _reaper_thread = None
+    _warmup_thread = None
+    if _preloaded_keys:
+        # В master torch считал в один поток — возвращаем бюджет TTS
+        torch.set_num_threads(get_cpu_allocation().torch_threads)
+
+os.register_at_fork(after_in_child=_reinit_after_fork)
+
+def _load_model(name: str):
+    """Загружает модель; состояние готовности обновляет кэш моделей."""
+    try:
+        MODEL_LOADERS[name]()
+    except Exception as e:
+        print(f"Warm-up of '{name}' model failed: {str(e)}")
+        print(traceback.format_exc())
+        return
+    print(f"Model '{name}' is ready (loaded in {_model_status[name]['load_seconds']}s)")
+
+def _warm_up_models(names):
+    for name in names:
+        if not _ready_events[name].is_set():
+            _load_model(name)
+    if "whisper" in names:
+        # Малые модели для быстрых профилей STT грузятся следом за основными
+        for model_size in WHISPER_PRELOAD_SIZES:
+            try:
+                get_whisper_model(model_size)
+            except Exception as e:
+                print(f"Warm-up of Whisper {model_size} failed: {str(e)}")
+
+def start_background_warmup(names=MODEL_NAMES) -> threading.Thread:
+    """Запускает фоновую загрузку моделей, не блокируя старт API."""
+    global _warmup_thread
+    if _warmup_thread is not None and _warmup_thread.is_alive():
+        return _warmup_thread
+    _warmup_thread = threading.Thread(
+        target=_warm_up_models,
+        args=(tuple(names),),
+        name="model_warmup",
+        daemon=True
+    )
+    _warmup_thread.start()
+    return _warmup_thread
+
+def set_model_state(name: str, state: str, error: str = None, load_seconds: float = None):
+    """Обновляет состояние готовности модели (кэш моделей этого процесса или воркеры инференса)."""
+    status = _model_status[name]
+    status["state"] = state
+    status["error"] = error
+    if load_seconds is not None:
+        status["load_seconds"] = load_seconds
+    if state == MODEL_READY:
+        _ready_events[name].set()
+    else:
+        _ready_events[name].clear()
+
+def set_external_loader(name: str, loader):
+    """wait_for_model вызовет loader() вместо загрузки модели в этом процессе."""
+    _external_loaders[name] = loader
+
+def is_model_ready(name: str) -> bool:
+    return _ready_events[name].is_set()
+
+def get_models_status() -> dict:
+    """Возвращает копию состояний готовности всех моделей."""
+    return {name: dict(status) for name, status in _model_status.items()}
+
+def get_model_cache_stats() -> dict:
+    """Метрики кэша моделей: события загрузки/выгрузки и резидентная память."""
+    now = time.monotonic()
+    with _models_lock:
+        models = {
+            key: {
+                "memory_bytes": entry.memory_bytes,
+                "gpu_bytes": entry.gpu_bytes,
+                "load_seconds": entry.load_seconds,
+                "idle_seconds": round(now - entry.last_used, 1),
+                "uses": entry.uses,
+                "pinned": _is_pinned(key),
+                "preloaded": key in _preloaded_keys
+            }
+            for key, entry in _models.items()
+        }
+        return {
+            "budget_bytes": MODEL_MEMORY_BUDGET_MB * 1024 * 1024,
+            "idle_ttl_seconds": MODEL_IDLE_TTL_SECONDS,
+            "resident_model_bytes": sum(m["memory_bytes"] for m in models.values()),
+            "process_rss_bytes": _process_rss_bytes(),
+            "evicted": sorted(_evicted_keys),
+            **_cache_metrics,
+            "models": models
+        }
+
+async def wait_for_model(name: str, timeout: float) -> bool:
+    """Ожидает готовности модели не дольше timeout секунд, не блокируя event loop."""
+    event = _ready_events[name]
+    deadline = time.monotonic() + timeout
+    while not event.is_set():
+        state = _model_status[name]["state"]
+        if state == MODEL_FAILED or time.monotonic() >= deadline:
+            return False
+        if state in (MODEL_PENDING, MODEL_EVICTED):
+            # Прогрев отключен, еще не дошел до модели или она выгружена — грузим по требованию
+            loader = _external_loaders.get(name)
+            if loader is not None:
+                loader()
+            else:
+                start_background_warmup((name,))
+        await asyncio.sleep(0.25)
+    return True
@@ -4,6 +4,7 @@ from .plan import Plan
 from .task import Task
 from .milestone import Milestone
 from .daily_checkin import DailyCheckin
+from .plan_job import PlanGenerationJob
 
 __all__ = [
     'Base',
@@ -11,5 +12,6 @@ __all__ = [
     'Plan',
     'Task',
     'Milestone',
-    'DailyCheckin'
+    'DailyCheckin',
+    'PlanGenerationJob'
 ] 
\ No newline at end of file
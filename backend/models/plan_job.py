@@ -0,0 +1,33 @@
+from sqlalchemy import Column, String, Text, Integer, ForeignKey, DateTime, Index
+from .base import Base
+
+# Статусы задачи генерации плана
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+class PlanGenerationJob(Base):
+    """Задача генерации плана в очереди на Postgres (забирается через FOR UPDATE SKIP LOCKED)"""
+    __tablename__ = "plan_generation_jobs"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    objective = Column(Text, nullable=False)
+    duration = Column(String(100), nullable=False)
+    status = Column(String(20), nullable=False, default=JOB_QUEUED)
+    attempts = Column(Integer, nullable=False, default=0)
+    # Не забирать раньше этого времени (отложенный повтор после ошибки)
+    run_after = Column(DateTime, nullable=False)
+    # Воркер, который держит задачу; по heartbeat_at зависшие задачи забираются снова
+    locked_by = Column(String(100))
+    heartbeat_at = Column(DateTime)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    partial_result = Column(Text)  # Stored as JSON string
+    error = Column(Text)
+    plan_id = Column(Integer, ForeignKey("plans.id", ondelete="SET NULL"))
+
+    __table_args__ = (
+        # Выборка следующей задачи: статус + время запуска
+        Index("ix_plan_generation_jobs_status_run_after", "status", "run_after"),
+    )
@@ -0,0 +1,289 @@
+"""Сэмплирующий профайлер: стеки потоков через sys._current_frames из фонового потока.
+
+Код приложения не инструментируется, поэтому профиль снимается в продакшене:
+- по запросу — заголовок X-Profile: 1 (или ?__profile=1) вместе с
+  X-Profile-Token (PROFILING_TOKEN) профилирует один HTTP-запрос, профиль
+  сохраняется в PROFILE_DIR, его id возвращается в заголовке X-Profile-Id;
+- постоянно — с частотой PROFILING_CONTINUOUS_HZ стеки всех потоков
+  копятся в окне PROFILING_WINDOW_SECONDS и скачиваются через /profiling/continuous.
+
+Формат хранения — свернутые стеки ("a;b;c 42"): их открывают speedscope,
+flamegraph.pl и Pyroscope; для терминала есть текстовое дерево вызовов.
+"""
+import hmac
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from config import PROFILE_DIR, PROFILE_KEEP, PROFILING_CONTINUOUS_HZ, PROFILING_TOKEN, PROFILING_WINDOW_SECONDS
+
+logger = logging.getLogger("profiling")
+
+MAX_STACK_DEPTH = 128
+_BACKEND_DIR = str(Path(__file__).parent) + os.sep
+
+_labels: Dict[object, str] = {}
+
+# Верхние кадры потока, который ждет (блокирующий вызов в C не виден как кадр)
+_IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+    ("connection.py", "_poll"),
+    ("socket.py", "accept")
+}
+
+def check_profiling_token(token: Optional[str]) -> bool:
+    """Токен администратора профилирования; без PROFILING_TOKEN профилирование выключено."""
+    return bool(PROFILING_TOKEN) and token is not None and hmac.compare_digest(token, PROFILING_TOKEN)
+
+def _frame_label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        if filename.startswith(_BACKEND_DIR):
+            filename = filename[len(_BACKEND_DIR):]
+        elif "site-packages" in filename:
+            filename = filename.split("site-packages" + os.sep, 1)[-1]
+        else:
+            filename = os.path.basename(filename)
+        # Метка по функции, а не по строке: сэмплы одной функции складываются
+        label = f"{code.co_name} ({filename}:{code.co_firstlineno})"
+        _labels[code] = label
+    return label
+
+def _is_idle(frame) -> bool:
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in _IDLE_FRAMES
+
+def _stack(frame) -> tuple:
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.reverse()
+    return tuple(labels)
+
+class StackSampler:
+    """Фоновый поток, который каждые interval секунд снимает стеки потоков.
+
+    thread_ids=None — все потоки процесса (кроме самого сэмплера), имя потока
+    становится корнем стека. skip_idle=True не считает ждущие потоки
+    (пулы без задач, ожидание событий), иначе они заняли бы весь профиль.
+    """
+
+    def __init__(self, interval: float, thread_ids: Optional[Iterable[int]] = None, skip_idle: bool = False):
+        self.interval = interval
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.skip_idle = skip_idle
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack_sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            frames = sys._current_frames()
+            with self._lock:
+                self.samples += 1
+                for thread_id, frame in frames.items():
+                    if thread_id == own_id or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                        continue
+                    if self.skip_idle and _is_idle(frame):
+                        continue
+                    stack = _stack(frame)
+                    if self.thread_ids is None:
+                        stack = (f"thread:{names.get(thread_id, thread_id)}",) + stack
+                    self.stacks[stack] += 1
+
+    def take(self, reset: bool = False) -> Dict[str, int]:
+        """Свернутые стеки {"a;b;c": n}; reset=True начинает новое окно."""
+        with self._lock:
+            collapsed = {";".join(stack): count for stack, count in self.stacks.items()}
+            if reset:
+                self.stacks = Counter()
+                self.samples = 0
+        return collapsed
+
+def to_collapsed(stacks: Dict[str, int]) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items(), key=lambda item: -item[1]))
+
+def to_tree(stacks: Dict[str, int], min_percent: float = 0.5) -> str:
+    """Дерево вызовов: доля сэмплов, где функция на стеке (total), и где она на вершине (self)."""
+    root: dict = {"count": 0, "self": 0, "children": {}}
+    for stack, count in stacks.items():
+        node = root
+        node["count"] += count
+        for label in stack.split(";"):
+            node = node["children"].setdefault(label, {"count": 0, "self": 0, "children": {}})
+            node["count"] += count
+        node["self"] += count
+    total = root["count"] or 1
+    lines = [f"{total} samples", "  total    self  function"]
+
+    def walk(node: dict, depth: int):
+        for label, child in sorted(node["children"].items(), key=lambda item: -item[1]["count"]):
+            percent = 100.0 * child["count"] / total
+            if percent < min_percent:
+                continue
+            lines.append(f"{percent:6.1f}% {100.0 * child['self'] / total:6.1f}%  {'  ' * depth}{label}")
+            walk(child, depth + 1)
+
+    walk(root, 0)
+    return "\n".join(lines) + "\n"
+
+def render(stacks: Dict[str, int], fmt: str) -> str:
+    return to_tree(stacks) if fmt == "tree" else to_collapsed(stacks)
+
+# --- Профиль одного запроса ---
+
+_request_profile_lock = threading.Lock()
+
+def try_begin_request_profile(interval: float, thread_id: int) -> Optional[StackSampler]:
+    """Сэмплер потока запроса или None, если уже профилируется другой запрос.
+
+    Профилируется поток event loop: в профиль попадает и работа других
+    запросов, идущих в это время, поэтому одновременно — только один.
+    """
+    if not _request_profile_lock.acquire(blocking=False):
+        return None
+    return StackSampler(interval, thread_ids=[thread_id]).start()
+
+def finish_request_profile(sampler: StackSampler, profile_id: str, meta: dict):
+    """Останавливает сэмплер и сохраняет профиль; вызывается в фоновом потоке."""
+    try:
+        sampler.stop()
+        stacks = sampler.take()
+        meta = dict(meta, samples=sampler.samples, interval_ms=sampler.interval * 1000, pid=os.getpid())
+    finally:
+        _request_profile_lock.release()
+    directory = Path(PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    (directory / f"{profile_id}.json").write_text(json.dumps({"meta": meta, "stacks": stacks}), encoding="utf-8")
+    # Старые профили удаляются, каталог не растет без предела
+    profiles = sorted(directory.glob("req-*.json"), key=lambda p: p.stat().st_mtime)
+    for path in profiles[:-PROFILE_KEEP]:
+        path.unlink(missing_ok=True)
+
+def new_profile_id() -> str:
+    return f"req-{int(time.time())}-{uuid.uuid4().hex[:8]}"
+
+def list_request_profiles() -> List[dict]:
+    directory = Path(PROFILE_DIR)
+    if not directory.exists():
+        return []
+    profiles = []
+    for path in sorted(directory.glob("req-*.json"), key=lambda p: p.stat().st_mtime, reverse=True):
+        try:
+            meta = json.loads(path.read_text(encoding="utf-8"))["meta"]
+        except (OSError, ValueError, KeyError):
+            continue
+        profiles.append({"id": path.stem, **meta})
+    return profiles
+
+def load_request_profile(profile_id: str) -> Optional[Dict[str, int]]:
+    # id приходит из URL: только имя файла внутри PROFILE_DIR
+    if not profile_id.startswith("req-") or os.sep in profile_id or "/" in profile_id:
+        return None
+    path = Path(PROFILE_DIR) / f"{profile_id}.json"
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))["stacks"]
+
+# --- Постоянное сэмплирование ---
+
+class ContinuousProfiler:
+    """Сэмплирует все потоки с низкой частотой и копит стеки по окнам.
+
+    Каждое окно сбрасывается в PROFILE_DIR/continuous-<pid>.json — скачивание
+    складывает окна всех воркеров gunicorn, а не только ответившего.
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __init__(self, hz: float, window_seconds: float):
+        self.window_seconds = window_seconds
+        self.sampler = StackSampler(1.0 / hz, skip_idle=True)
+        self.window_started = time.time()
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    @classmethod
+    def get_instance(cls) -> Optional["ContinuousProfiler"]:
+        return cls._instance
+
+    @classmethod
+    def start(cls):
+        if PROFILING_CONTINUOUS_HZ <= 0:
+            return None
+        with cls._lock:
+            if cls._instance is None:
+                profiler = cls(PROFILING_CONTINUOUS_HZ, PROFILING_WINDOW_SECONDS)
+                profiler.sampler.start()
+                profiler._flusher = threading.Thread(target=profiler._run_flusher, name="profile_flusher", daemon=True)
+                profiler._flusher.start()
+                cls._instance = profiler
+                logger.info("Continuous profiler started: %s Hz, window %ss", PROFILING_CONTINUOUS_HZ, PROFILING_WINDOW_SECONDS)
+            return cls._instance
+
+    @classmethod
+    def stop(cls):
+        with cls._lock:
+            profiler, cls._instance = cls._instance, None
+        if profiler is not None:
+            profiler._stop.set()
+            profiler.sampler.stop()
+
+    def _path(self) -> Path:
+        return Path(PROFILE_DIR) / f"continuous-{os.getpid()}.json"
+
+    def _run_flusher(self):
+        while not self._stop.wait(self.window_seconds):
+            stacks = self.sampler.take(reset=True)
+            started, self.window_started = self.window_started, time.time()
+            try:
+                Path(PROFILE_DIR).mkdir(parents=True, exist_ok=True)
+                self._path().write_text(
+                    json.dumps({"window_start": started, "window_end": self.window_started, "stacks": stacks}),
+                    encoding="utf-8"
+                )
+            except OSError as e:
+                logger.warning("Continuous profile flush failed: %s", e)
+
+def continuous_profile(include_previous: bool = True) -> Dict[str, int]:
+    """Стеки текущего окна этого процесса плюс последние окна всех процессов."""
+    merged: Counter = Counter()
+    profiler = ContinuousProfiler.get_instance()
+    if profiler is not None:
+        merged.update(profiler.sampler.take())
+    if include_previous and Path(PROFILE_DIR).exists():
+        # Файлы процессов, не обновлявшиеся два окна, — от завершенных воркеров
+        fresh_after = time.time() - 2 * PROFILING_WINDOW_SECONDS
+        for path in Path(PROFILE_DIR).glob("continuous-*.json"):
+            try:
+                if path.stat().st_mtime < fresh_after:
+                    continue
+                merged.update(json.loads(path.read_text(encoding="utf-8"))["stacks"])
+            except (OSError, ValueError, KeyError):
+                continue
+    return dict(merged)
@@ -1,42 +1,143 @@
-from typing import Tuple, Optional
+from typing import Tuple, Optional, Union
 from fastapi import UploadFile
+import av
 import numpy as np
 import soundfile as sf
+import asyncio
+import io
 import tempfile
 import shutil
 import os
+from config import STT_SPILL_THRESHOLD_BYTES, STT_MAX_UPLOAD_BYTES
+
+WHISPER_SAMPLE_RATE = 16000
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+class AudioTooLongError(ValueError):
+    """Аудио длиннее допустимого; декодирование остановлено, не дойдя до конца файла."""
+
+def _decoded_frames(container):
+    frames = container.decode(audio=0)
+    while True:
+        try:
+            frame = next(frames)
+        except StopIteration:
+            break
+        except av.error.InvalidDataError:
+            # Как faster_whisper.decode_audio: битые кадры пропускаются
+            continue
+        yield frame
+    # Сброс хвоста ресэмплера
+    yield None
+
+def decode_audio_limited(
+    source: Union[io.BytesIO, str],
+    sampling_rate: int = WHISPER_SAMPLE_RATE,
+    max_seconds: Optional[float] = None,
+    truncate: bool = False
+) -> np.ndarray:
+    """Декодирует аудио в float32 моно, как faster_whisper.decode_audio, но не дальше max_seconds.
+
+    Длинный файл отклоняется по длительности из контейнера до декодирования, а
+    если контейнер ее не знает — как только декодировано больше max_seconds:
+    сотня мегабайт Opus с низким битрейтом не разворачивается в гигабайты float32.
+    truncate=True вместо ошибки возвращает первые max_seconds.
+    """
+    max_samples = int(max_seconds * sampling_rate) if max_seconds else None
+    too_long = f"Аудио слишком длинное (максимум {max_seconds:.0f} с)" if max_seconds else ""
+    resampler = av.audio.resampler.AudioResampler(format="s16", layout="mono", rate=sampling_rate)
+    chunks = []
+    total = 0
+    with av.open(source, mode="r", metadata_errors="ignore") as container:
+        if (
+            max_samples is not None
+            and not truncate
+            and container.duration is not None
+            and container.duration / av.time_base > max_seconds
+        ):
+            raise AudioTooLongError(too_long)
+        for frame in _decoded_frames(container):
+            for resampled in resampler.resample(frame):
+                array = resampled.to_ndarray().reshape(-1)
+                chunks.append(array)
+                total += len(array)
+            if max_samples is not None and total > max_samples:
+                if not truncate:
+                    raise AudioTooLongError(too_long)
+                break
+
+    audio = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int16)
+    if max_samples is not None:
+        audio = audio[:max_samples]
+    return audio.astype(np.float32) / 32768.0
 
 class AudioRepository:
-    def __init__(self):
-        pass
+    def __init__(
+        self,
+        spill_threshold_bytes: int = STT_SPILL_THRESHOLD_BYTES,
+        max_upload_bytes: int = STT_MAX_UPLOAD_BYTES
+    ):
+        self.spill_threshold_bytes = spill_threshold_bytes
+        self.max_upload_bytes = max_upload_bytes
 
-    async def process_audio_file(self, audio_file: UploadFile) -> Tuple[str, np.ndarray]:
-        """Обработка загруженного аудио файла в памяти."""
-        # Создаем временный файл для обработки
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as temp_file:
-            try:
-                # Перемещаем указатель в начало файла
-                await audio_file.seek(0)
-                # Копируем содержимое
-                shutil.copyfileobj(audio_file.file, temp_file)
-                temp_path = temp_file.name
-            except Exception as e:
-                os.unlink(temp_file.name)
-                raise ValueError(f"Ошибка при обработке аудио файла: {str(e)}")
+    async def _read_upload(self, audio_file: UploadFile) -> Union[io.BytesIO, str]:
+        """Читает загрузку в буфер в памяти; выше порога — сбрасывает на диск.
 
+        Возвращает BytesIO либо путь к временному файлу (его удаляет вызывающий).
+        """
+        await audio_file.seek(0)
+        buffer = io.BytesIO()
+        spill_file = None
+        total = 0
         try:
-            # Проверяем размер файла
-            if os.path.getsize(temp_path) == 0:
-                raise ValueError("Загружен пустой файл")
+            while True:
+                chunk = await audio_file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                total += len(chunk)
+                if total > self.max_upload_bytes:
+                    raise ValueError(f"Файл слишком большой (максимум {self.max_upload_bytes // (1024 * 1024)} МБ)")
+                if spill_file is None and total > self.spill_threshold_bytes:
+                    suffix = os.path.splitext(audio_file.filename or "")[1] or ".bin"
+                    spill_file = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+                    spill_file.write(buffer.getbuffer())
+                    buffer = None
+                if spill_file is not None:
+                    spill_file.write(chunk)
+                else:
+                    buffer.write(chunk)
+        except Exception:
+            if spill_file is not None:
+                spill_file.close()
+                os.unlink(spill_file.name)
+            raise
 
-            # Читаем аудио данные
-            audio_array, sample_rate = sf.read(temp_path)
-            return temp_path, audio_array
+        if spill_file is not None:
+            spill_file.close()
+            return spill_file.name
 
+        if total == 0:
+            raise ValueError("Загружен пустой файл")
+        buffer.seek(0)
+        return buffer
+
+    async def process_audio_file(
+        self,
+        audio_file: UploadFile,
+        max_seconds: Optional[float] = None,
+        truncate: bool = False
+    ) -> np.ndarray:
+        """Декодирует загруженный файл в float32 моно 16 кГц для Whisper (не дальше max_seconds)."""
+        source = await self._read_upload(audio_file)
+        try:
+            return await asyncio.to_thread(decode_audio_limited, source, WHISPER_SAMPLE_RATE, max_seconds, truncate)
+        except AudioTooLongError:
+            raise
+        except Exception as e:
+            raise ValueError(f"Ошибка при обработке аудио файла: {str(e)}")
         finally:
-            # Удаляем временный файл
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
+            if isinstance(source, str) and os.path.exists(source):
+                os.unlink(source)
 
     async def generate_audio(self, audio_array: np.ndarray, sample_rate: int) -> bytes:
         """Генерация аудио в памяти."""
@@ -0,0 +1,149 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update, or_, and_
+from typing import List, Optional
+from datetime import datetime, timedelta
+
+from models import PlanGenerationJob
+from models.plan_job import JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED, JOB_FAILED
+
+class PlanJobRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def create_job(self, user_id: int, objective: str, duration: str) -> PlanGenerationJob:
+        job = PlanGenerationJob(
+            user_id=user_id,
+            objective=objective,
+            duration=duration,
+            status=JOB_QUEUED,
+            attempts=0,
+            run_after=datetime.utcnow()
+        )
+        self.session.add(job)
+        await self.session.flush()
+        await self.session.commit()
+        await self.session.refresh(job)
+        return job
+
+    async def get_job(self, job_id: int) -> Optional[PlanGenerationJob]:
+        query = select(PlanGenerationJob).where(PlanGenerationJob.id == job_id)
+        result = await self.session.execute(query)
+        return result.scalar_one_or_none()
+
+    async def claim_next_job(self, worker_id: str, stale_after: timedelta,
+                             max_attempts: int) -> Optional[PlanGenerationJob]:
+        """Забирает следующую готовую задачу или зависшую (воркер без heartbeat дольше stale_after).
+
+        SKIP LOCKED: воркеры разных процессов не ждут друг друга на одной строке —
+        каждый сразу берет следующую незаблокированную задачу. Зависшая задача
+        с исчерпанными попытками (max_attempts) не забирается: иначе задача,
+        роняющая воркер, перезапускалась бы бесконечно (см. fail_exhausted_stale_jobs).
+        """
+        now = datetime.utcnow()
+        next_job = (
+            select(PlanGenerationJob.id)
+            .where(or_(
+                and_(PlanGenerationJob.status == JOB_QUEUED, PlanGenerationJob.run_after <= now),
+                and_(
+                    PlanGenerationJob.status == JOB_RUNNING,
+                    PlanGenerationJob.heartbeat_at < now - stale_after,
+                    PlanGenerationJob.attempts < max_attempts
+                )
+            ))
+            .order_by(PlanGenerationJob.run_after, PlanGenerationJob.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        query = (
+            update(PlanGenerationJob)
+            .where(PlanGenerationJob.id == next_job)
+            .values(
+                status=JOB_RUNNING,
+                locked_by=worker_id,
+                heartbeat_at=now,
+                started_at=now,
+                attempts=PlanGenerationJob.attempts + 1,
+                updated_at=now
+            )
+            .returning(PlanGenerationJob)
+            .execution_options(synchronize_session=False)
+        )
+        result = await self.session.execute(query)
+        job = result.scalar_one_or_none()
+        await self.session.commit()
+        return job
+
+    async def fail_exhausted_stale_jobs(self, stale_after: timedelta, max_attempts: int) -> List[int]:
+        """Помечает failed зависшие задачи, у которых не осталось попыток; возвращает их id"""
+        now = datetime.utcnow()
+        query = (
+            update(PlanGenerationJob)
+            .where(
+                PlanGenerationJob.status == JOB_RUNNING,
+                PlanGenerationJob.heartbeat_at < now - stale_after,
+                PlanGenerationJob.attempts >= max_attempts
+            )
+            .values(
+                status=JOB_FAILED,
+                error="Воркер остановился без heartbeat на последней попытке",
+                locked_by=None,
+                finished_at=now,
+                updated_at=now
+            )
+            .returning(PlanGenerationJob.id)
+            .execution_options(synchronize_session=False)
+        )
+        result = await self.session.execute(query)
+        job_ids = list(result.scalars())
+        await self.session.commit()
+        return job_ids
+
+    async def _update_owned(self, job_id: int, worker_id: str, **values) -> bool:
+        """Обновляет задачу, только если ее все еще держит этот воркер"""
+        values["updated_at"] = datetime.utcnow()
+        query = (
+            update(PlanGenerationJob)
+            .where(
+                PlanGenerationJob.id == job_id,
+                PlanGenerationJob.locked_by == worker_id,
+                PlanGenerationJob.status == JOB_RUNNING
+            )
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        result = await self.session.execute(query)
+        await self.session.commit()
+        return result.rowcount == 1
+
+    async def heartbeat(self, job_id: int, worker_id: str) -> bool:
+        return await self._update_owned(job_id, worker_id, heartbeat_at=datetime.utcnow())
+
+    async def save_partial_result(self, job_id: int, worker_id: str, partial_result: str) -> bool:
+        return await self._update_owned(
+            job_id, worker_id, partial_result=partial_result, heartbeat_at=datetime.utcnow()
+        )
+
+    async def complete_job(self, job_id: int, worker_id: str, plan_id: int) -> bool:
+        return await self._update_owned(
+            job_id, worker_id, status=JOB_SUCCEEDED, plan_id=plan_id, error=None,
+            locked_by=None, finished_at=datetime.utcnow()
+        )
+
+    async def fail_job(self, job_id: int, worker_id: str, error: str) -> bool:
+        return await self._update_owned(
+            job_id, worker_id, status=JOB_FAILED, error=error,
+            locked_by=None, finished_at=datetime.utcnow()
+        )
+
+    async def requeue_job(self, job_id: int, worker_id: str, delay: timedelta, error: Optional[str] = None,
+                          refund_attempt: bool = False) -> bool:
+        """Возвращает задачу в очередь: повтор после ошибки или остановка воркера"""
+        values = dict(
+            status=JOB_QUEUED, error=error, locked_by=None, heartbeat_at=None,
+            run_after=datetime.utcnow() + delay
+        )
+        if refund_attempt:
+            # Остановка воркера — не ошибка задачи, попытка не засчитывается
+            values["attempts"] = PlanGenerationJob.attempts - 1
+        return await self._update_owned(job_id, worker_id, **values)
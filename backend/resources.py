@@ -0,0 +1,213 @@
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional
+
+from config import (
+    CPU_BUDGET_CORES,
+    CPU_BUDGET_WEIGHTS,
+    CPU_BUDGET_USE_SMT,
+    INFERENCE_PROCESS_ISOLATION,
+    INFERENCE_PROCESS_WORKERS,
+    INFERENCE_SOCKET,
+    TTS_SENTENCE_CONCURRENCY,
+    WEB_CONCURRENCY
+)
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+BUDGET_GROUPS = ("whisper", "tts", "api")
+
+def _allowed_cpus() -> set:
+    try:
+        return set(os.sched_getaffinity(0))
+    except AttributeError:
+        return set(range(os.cpu_count() or 1))
+
+def _physical_cores(cpus: set) -> int:
+    """Число физических ядер среди разрешенных логических CPU (SMT-соседи считаются одним ядром)."""
+    cores = set()
+    for cpu in cpus:
+        siblings = Path(f"/sys/devices/system/cpu/cpu{cpu}/topology/thread_siblings_list")
+        try:
+            cores.add(siblings.read_text().strip())
+        except OSError:
+            return len(cpus)
+    return len(cores) or len(cpus)
+
+def _cgroup_cpu_limit() -> Optional[float]:
+    """Лимит CPU из cgroup (v2 cpu.max или v1 cfs quota) в ядрах; None — лимита нет."""
+    try:
+        quota, period = (CGROUP_ROOT / "cpu.max").read_text().split()
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        quota = int((CGROUP_ROOT / "cpu" / "cpu.cfs_quota_us").read_text())
+        period = int((CGROUP_ROOT / "cpu" / "cpu.cfs_period_us").read_text())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+def _split(total: int, weights: Dict[str, float]) -> Dict[str, int]:
+    """Делит total ядер по весам методом наибольших остатков, каждой группе не меньше одного."""
+    weight_sum = sum(weights.values()) or 1.0
+    shares = {name: total * weight / weight_sum for name, weight in weights.items()}
+    result = {name: max(1, int(share)) for name, share in shares.items()}
+    remaining = total - sum(result.values())
+    for name in sorted(shares, key=lambda n: shares[n] - int(shares[n]), reverse=True):
+        if remaining <= 0:
+            break
+        result[name] += 1
+        remaining -= 1
+    return result
+
+@dataclass(frozen=True)
+class CPUAllocation:
+    """Распределение ядер между движками инференса и обработкой запросов.
+
+    Потоки групп — доля одного процесса API: бюджет машины делится на
+    api_processes, иначе каждый воркер gunicorn занял бы его целиком.
+    С общим сервером инференса на api_processes делится только группа api.
+    """
+    logical_cpus: int
+    physical_cores: int
+    cgroup_limit: Optional[float]
+    cores: int
+    api_processes: int
+    whisper_threads: int
+    tts_threads: int
+    api_threads: int
+    # Параметры, которые применяются при загрузке моделей в этом процессе
+    whisper_num_workers: int
+    whisper_cpu_threads: int
+    torch_threads: int
+
+    def report(self) -> str:
+        limit = f"{self.cgroup_limit:g}" if self.cgroup_limit is not None else "none"
+        return (
+            f"CPU budget: {self.cores} cores "
+            f"(logical {self.logical_cpus}, physical {self.physical_cores}, cgroup limit {limit}), "
+            f"per API process (x{self.api_processes}) -> "
+            f"whisper {self.whisper_threads} [{self.whisper_num_workers} x {self.whisper_cpu_threads} threads], "
+            f"torch tts {self.tts_threads} [{self.torch_threads} intra-op threads per call], "
+            f"api {self.api_threads}"
+        )
+
+def compute_allocation(
+    logical_cpus: int,
+    physical_cores: int,
+    cgroup_limit: Optional[float],
+    weights: Dict[str, float],
+    override_cores: float = 0,
+    use_smt: bool = False,
+    process_isolation: bool = False,
+    process_workers: Optional[Dict[str, int]] = None,
+    tts_concurrency: int = 1,
+    api_processes: int = 1,
+    shared_inference: bool = False
+) -> CPUAllocation:
+    if override_cores > 0:
+        cores = int(override_cores)
+    else:
+        cores = logical_cpus if use_smt else physical_cores
+        if cgroup_limit is not None:
+            # Дробную квоту округляем вниз, чтобы не упираться в троттлинг
+            cores = min(cores, int(cgroup_limit))
+    cores = max(cores, 1)
+
+    split = _split(max(cores, len(BUDGET_GROUPS)), {name: weights.get(name, 1.0) for name in BUDGET_GROUPS})
+    if cores < len(BUDGET_GROUPS):
+        # Ядер меньше, чем групп: каждой группе по одному потоку
+        split = {name: 1 for name in BUDGET_GROUPS}
+    # Каждый процесс API держит свои модели или свой пул воркеров инференса;
+    # пул общего сервера инференса один на все процессы и получает свою долю целиком
+    api_processes = max(api_processes, 1)
+    split = {
+        name: threads if shared_inference and name != "api" else max(1, threads // api_processes)
+        for name, threads in split.items()
+    }
+
+    if process_isolation:
+        # Бюджет делится между процессами-воркерами; каждый считает одну задачу за раз
+        workers = process_workers or {}
+        whisper_processes = max(workers.get("whisper", 1), 1)
+        tts_processes = max(workers.get("tts", 0) + workers.get("xtts", 0), 1)
+        whisper_num_workers = 1
+        whisper_cpu_threads = max(1, split["whisper"] // whisper_processes)
+        torch_threads = max(1, split["tts"] // tts_processes)
+    else:
+        # В одном процессе Whisper обслуживает до двух транскрипций параллельно,
+        # а TTS синтезирует tts_concurrency предложений одновременно
+        whisper_num_workers = 2 if split["whisper"] >= 4 else 1
+        whisper_cpu_threads = max(1, split["whisper"] // whisper_num_workers)
+        torch_threads = max(1, split["tts"] // max(tts_concurrency, 1))
+
+    return CPUAllocation(
+        logical_cpus=logical_cpus,
+        physical_cores=physical_cores,
+        cgroup_limit=cgroup_limit,
+        cores=cores,
+        api_processes=api_processes,
+        whisper_threads=split["whisper"],
+        tts_threads=split["tts"],
+        api_threads=split["api"],
+        whisper_num_workers=whisper_num_workers,
+        whisper_cpu_threads=whisper_cpu_threads,
+        torch_threads=torch_threads
+    )
+
+_allocation: Optional[CPUAllocation] = None
+_allocation_lock = threading.Lock()
+_torch_configured = False
+
+def get_cpu_allocation() -> CPUAllocation:
+    """Распределение ядер для этого процесса (считается один раз)."""
+    global _allocation
+    if _allocation is None:
+        with _allocation_lock:
+            if _allocation is None:
+                cpus = _allowed_cpus()
+                _allocation = compute_allocation(
+                    logical_cpus=len(cpus),
+                    physical_cores=_physical_cores(cpus),
+                    cgroup_limit=_cgroup_cpu_limit(),
+                    weights=CPU_BUDGET_WEIGHTS,
+                    override_cores=CPU_BUDGET_CORES,
+                    use_smt=CPU_BUDGET_USE_SMT,
+                    process_isolation=INFERENCE_PROCESS_ISOLATION,
+                    process_workers=INFERENCE_PROCESS_WORKERS,
+                    tts_concurrency=TTS_SENTENCE_CONCURRENCY,
+                    api_processes=WEB_CONCURRENCY,
+                    shared_inference=INFERENCE_PROCESS_ISOLATION and bool(INFERENCE_SOCKET)
+                )
+    return _allocation
+
+def configure_thread_env(model_name: str):
+    """Лимиты OpenMP/MKL/BLAS через переменные окружения — до импорта torch и numpy-бэкендов.
+
+    Вызывается в начале процесса-воркера инференса модели model_name.
+    """
+    allocation = get_cpu_allocation()
+    threads = str(allocation.whisper_cpu_threads if model_name == "whisper" else allocation.torch_threads)
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ.setdefault(variable, threads)
+
+def apply_torch_threads():
+    """Ограничивает пулы потоков torch бюджетом TTS; вызывается перед загрузкой моделей."""
+    global _torch_configured
+    if _torch_configured:
+        return
+    import torch
+    allocation = get_cpu_allocation()
+    torch.set_num_threads(allocation.torch_threads)
+    try:
+        # Межоперационный пул задается только до первой параллельной операции
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+    _torch_configured = True
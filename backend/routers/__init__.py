@@ -7,11 +7,17 @@ from .plan_router import router as plan_router
 from .task_router import router as task_router
 from .milestone_router import router as milestone_router
 from .audio_router import router as audio_router
+from .health_router import router as health_router
+from .metrics_router import router as metrics_router
+from .profiling_router import router as profiling_router
 
 __all__ = [
     "user_router",
     "plan_router",
     "task_router",
     "milestone_router",
-    "audio_router"
+    "audio_router",
+    "health_router",
+    "metrics_router",
+    "profiling_router"
 ]
\ No newline at end of file
@@ -1,58 +1,398 @@
 import os
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
+import asyncio
+import json
+import time
+from dataclasses import asdict
+from typing import BinaryIO, Optional, Union
+import numpy as np
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect, Query, Header, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from auth.dependencies import get_current_active_user
+from auth.dependencies import get_current_active_user, get_websocket_user
 from models import User
 from services.audio_service import AudioService
-from database import get_db
-from dto.audio import AudioResponse, TextRequest
-from repository.audio_repository import AudioRepository
+from dto.audio import AudioResponse, TextRequest, WakeWordResponse
+from services.vad import VoiceActivityDetector
+from services.stt_routing import WHISPER_PROFILES, select_whisper_profile
+from services.audio_encoding import BITRATE_PRESETS, negotiate_format
+from services.llm_service import OptimizedLLMService
+from services.voice_pipeline import VoiceAssistantSession, voice_pipeline_stats
+from model_registry import wait_for_model, get_models_status
+from config import (
+    MODEL_READY_TIMEOUT,
+    STT_BATCHING_ENABLED,
+    STT_STREAM_SAMPLE_RATE,
+    STT_VAD_SILENCE_MS,
+    STT_MAX_UTTERANCE_SECONDS,
+    STT_PARTIAL_INTERVAL_SECONDS,
+    SAMPLE_RATE,
+    TTS_DEFAULT_FORMAT,
+    TTS_DEFAULT_BITRATE
+)
 
 router = APIRouter(
     prefix="/audio",
     tags=["audio"],
 )
 
-def get_audio_repository():
-    return AudioRepository()
+def get_audio_service() -> AudioService:
+    # Сервис общий на процесс: пул инференса и ресурсы создаются один раз
+    return AudioService.get_instance()
 
-def get_audio_service(
-    db: Session = Depends(get_db),
-    audio_repository: AudioRepository = Depends(get_audio_repository)
-):
-    return AudioService(db, audio_repository)
+async def ensure_model_ready(model_name: str):
+    """Ждет готовности модели; если она не успела загрузиться — 503 с Retry-After."""
+    if not await wait_for_model(model_name, MODEL_READY_TIMEOUT):
+        model_status = get_models_status()[model_name]
+        raise HTTPException(
+            status_code=503,
+            detail=f"Модель '{model_name}' еще не готова (состояние: {model_status['state']})",
+            headers={"Retry-After": "30"}
+        )
+
+async def require_whisper_model():
+    await ensure_model_ready("whisper")
+
+def open_file_response(audio: BinaryIO, media_type: str, chunk_size: int = 64 * 1024) -> StreamingResponse:
+    """Ответ из уже открытого файла: его не сломает удаление файла из кэша во время отдачи."""
+    size = os.fstat(audio.fileno()).st_size
+
+    def chunks():
+        with audio:
+            while chunk := audio.read(chunk_size):
+                yield chunk
+
+    return StreamingResponse(chunks(), media_type=media_type, headers={"Content-Length": str(size)})
+
+class PcmFrameDecoder:
+    """Бинарные кадры PCM16 LE -> float32; нечетный последний байт переносится в следующий кадр."""
+
+    def __init__(self):
+        self._carry = b""
+
+    def decode(self, data: Optional[bytes]) -> np.ndarray:
+        data = self._carry + (data or b"")
+        usable = len(data) - len(data) % 2
+        self._carry = data[usable:]
+        return np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0
+
+def parse_client_event(text: str) -> Optional[str]:
+    """Поле event текстового кадра; None — кадр не JSON-объект с event-строкой."""
+    try:
+        payload = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(payload, dict) or not isinstance(payload.get("event"), str):
+        return None
+    return payload["event"]
+
+async def close_websocket_on_error(websocket: WebSocket, error: Exception):
+    """Закрывает сокет с кодом 1011 после необработанной ошибки; клиент мог уже отключиться."""
+    print(f"WebSocket {websocket.url.path} failed: {error}")
+    try:
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+    except Exception:
+        pass
 
 @router.post("/stt/", response_model=AudioResponse)
 async def speech_to_text(
     audio_file: UploadFile = File(...),
+    quality: Optional[str] = Query(None, description="Профиль: fastest, fast, balanced, accurate"),
+    latency_slo_ms: Optional[float] = Query(None, gt=0),
+    _: None = Depends(require_whisper_model),
     audio_service: AudioService = Depends(get_audio_service),
     current_user: User = Depends(get_current_active_user)
 ):
     """Преобразование аудио в текст без сохранения в БД."""
     try:
-        return await audio_service.transcribe_audio(audio_file)
+        return await audio_service.transcribe_audio(audio_file, quality, latency_slo_ms)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при обработке аудио: {str(e)}")
 
-@router.post("/tts/", response_class=FileResponse)
+@router.post("/tts/", response_class=StreamingResponse)
 async def text_to_speech(
     request: TextRequest,
+    accept: Optional[str] = Header(None),
     audio_service: AudioService = Depends(get_audio_service),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Преобразование текста в аудио без сохранения в БД."""
-    try:
-        await audio_service.change_speaker_gender(request.gender)
-        file_path = await audio_service.create_audio_from_text(request.text)
-        
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="Файл не найден")
-            
-        return FileResponse(
-            path=file_path,
-            media_type="audio/mpeg"
+    """Преобразование текста в аудио без сохранения в БД.
+
+    Формат ответа задается полем format или заголовком Accept (audio/ogg — Opus,
+    audio/mpeg — MP3, audio/wav — без сжатия); по умолчанию TTS_DEFAULT_FORMAT.
+    Потоковый ответ (stream=true) — только audio/wav: другой format или bitrate дают 400.
+    """
+    try:
+        audio_format = negotiate_format(request.format, accept, "wav" if request.stream else TTS_DEFAULT_FORMAT)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if request.stream and (audio_format.compressed or request.bitrate):
+        # Поток по предложениям идет в PCM: кодеры с межкадровым состоянием
+        # добавили бы задержку к первому фрагменту. Другой формат молча не подменяем
+        raise HTTPException(
+            status_code=400,
+            detail="Потоковый режим (stream=true) отдает только audio/wav: уберите format/bitrate или stream"
+        )
+    bitrate = request.bitrate or TTS_DEFAULT_BITRATE
+    if bitrate not in BITRATE_PRESETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неизвестный пресет битрейта: {bitrate}. Доступны: {', '.join(BITRATE_PRESETS)}"
         )
+
+    speaker = AudioService.speaker_for_gender(request.gender)
+    # Кэшированный ответ модели не требует; женский голос синтезирует VITS, мужской — XTTS
+    if not audio_service.has_cached_audio(request.text, speaker, audio_format, bitrate, request.speed):
+        await ensure_model_ready("tts" if request.gender == "W" else "xtts")
+    try:
+        if request.stream:
+            # Готовый файл из кэша отдаем целиком — это быстрее потокового синтеза
+            cached_audio = audio_service.open_cached_audio(request.text, speaker, audio_format, bitrate, request.speed)
+            if cached_audio is not None:
+                return open_file_response(cached_audio, audio_format.media_type)
+            return StreamingResponse(
+                audio_service.stream_speech(request.text, speaker, speed=request.speed),
+                media_type=audio_format.media_type
+            )
+        audio = await audio_service.create_audio_from_text(
+            request.text, speaker, audio_format, bitrate, request.speed
+        )
+        return open_file_response(audio, audio_format.media_type)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при генерации речи: {str(e)}")
+
+@router.get("/tts/cache/stats")
+async def tts_cache_stats(
+    audio_service: AudioService = Depends(get_audio_service),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Статистика кэша синтезированного аудио (в т.ч. hit ratio)."""
+    return audio_service.tts_cache.stats()
+
+@router.get("/inference/workers")
+async def inference_workers_stats(
+    audio_service: AudioService = Depends(get_audio_service),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Состояние процессов-воркеров инференса: готовность, занятость, перезапуски."""
+    if audio_service.inference_pool is None:
+        return {"enabled": False}
+    return {"enabled": True, **await audio_service.inference_pool.get_stats()}
+
+@router.post("/wake-word/", response_model=WakeWordResponse)
+async def wake_word_check(
+    audio_file: UploadFile = File(...),
+    audio_service: AudioService = Depends(get_audio_service),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Быстрая проверка wake word в коротком клипе.
+
+    Не ждет основную модель Whisper: клипы без речи отклоняются без модели,
+    остальные распознает tiny-модель в отдельном пуле потоков.
+    """
+    try:
+        result = await audio_service.detect_wake_word(audio_file)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ошибка при проверке wake word: {str(e)}")
+    return WakeWordResponse(**asdict(result))
+
+@router.get("/wake-word/stats")
+async def wake_word_stats(
+    audio_service: AudioService = Depends(get_audio_service),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Статистика быстрого пути wake word: проверки, отсеянные гейтом клипы, среднее время модели."""
+    return audio_service.wake_word.stats()
+
+@router.get("/stt/batching/stats")
+async def stt_batching_stats(
+    audio_service: AudioService = Depends(get_audio_service),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Статистика микро-батчинга Whisper по профилям: размер батчей и ожидание в очереди."""
+    return {
+        "enabled": STT_BATCHING_ENABLED,
+        "profiles": {name: batcher.stats() for name, batcher in audio_service.whisper_batchers.items()}
+    }
+
+@router.websocket("/stt/ws")
+async def speech_to_text_stream(
+    websocket: WebSocket,
+    current_user: Optional[User] = Depends(get_websocket_user),
+    audio_service: AudioService = Depends(get_audio_service)
+):
+    """Потоковое распознавание речи.
+
+    Клиент шлет бинарные кадры PCM16 LE моно 16 кГц и текст {"event": "end"}
+    в конце записи. Сервер отвечает JSON-сообщениями
+    {"type": "partial" | "final", "text": ..., "utterance": n}.
+    """
+    if current_user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    if not await wait_for_model("whisper", MODEL_READY_TIMEOUT):
+        await websocket.send_json({"type": "error", "detail": "Модель 'whisper' еще не готова"})
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+
+    vad = VoiceActivityDetector(
+        sample_rate=STT_STREAM_SAMPLE_RATE,
+        silence_end_ms=STT_VAD_SILENCE_MS,
+        max_utterance_s=STT_MAX_UTTERANCE_SECONDS
+    )
+    partial_samples = int(STT_PARTIAL_INTERVAL_SECONDS * STT_STREAM_SAMPLE_RATE)
+    utterance_index = 0
+    last_partial_length = 0
+    partial_task: Optional[asyncio.Task] = None
+
+    async def send_partial(audio: np.ndarray, index: int):
+        # Промежуточный результат — быстрый профиль по открытому высказыванию
+        text = await audio_service.transcribe_array_async(audio, WHISPER_PROFILES["fast"])
+        if index == utterance_index and text:
+            await websocket.send_json({"type": "partial", "text": text, "utterance": index})
+
+    async def send_final(audio: np.ndarray):
+        nonlocal utterance_index, last_partial_length, partial_task
+        index = utterance_index
+        utterance_index += 1
+        last_partial_length = 0
+        if partial_task is not None and not partial_task.done():
+            partial_task.cancel()
+        partial_task = None
+        profile, _ = select_whisper_profile(len(audio) / STT_STREAM_SAMPLE_RATE)
+        text = await audio_service.transcribe_array_async(audio, profile)
+        await websocket.send_json({"type": "final", "text": text, "utterance": index})
+
+    frames = PcmFrameDecoder()
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("text") is not None:
+                event = parse_client_event(message["text"])
+                if event is None:
+                    await websocket.send_json({"type": "error", "detail": 'Ожидается JSON вида {"event": "end"}'})
+                elif event == "end":
+                    utterance = vad.flush()
+                    if utterance is not None:
+                        await send_final(utterance)
+                    break
+                continue
+
+            pcm = frames.decode(message.get("bytes"))
+            for utterance in vad.feed(pcm):
+                await send_final(utterance)
+
+            current = vad.current_utterance()
+            if (
+                current is not None
+                and len(current) - last_partial_length >= partial_samples
+                and (partial_task is None or partial_task.done())
+            ):
+                last_partial_length = len(current)
+                partial_task = asyncio.create_task(send_partial(current, utterance_index))
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        await close_websocket_on_error(websocket, e)
+    finally:
+        if partial_task is not None and not partial_task.done():
+            partial_task.cancel()
+
+@router.websocket("/assistant/ws")
+async def voice_assistant_stream(
+    websocket: WebSocket,
+    gender: str = Query("M"),
+    speed: float = Query(1.0, ge=0.5, le=2.0),
+    language: str = Query("en"),
+    current_user: Optional[User] = Depends(get_websocket_user),
+    audio_service: AudioService = Depends(get_audio_service)
+):
+    """Голосовой ассистент: речь пользователя -> Whisper -> LLM -> TTS по одному соединению.
+
+    Клиент шлет бинарные кадры PCM16 LE моно 16 кГц, {"event": "interrupt"}
+    чтобы прервать ответ и {"event": "end"} в конце разговора. По концу
+    высказывания (VAD) сервер отвечает JSON-сообщениями "transcript",
+    "reply_delta" (токены LLM), "reply_end" (текст и тайминги этапов) и
+    бинарными кадрами PCM16 LE моно SAMPLE_RATE — речь ответа по предложениям.
+    Новое высказывание прерывает текущий ответ ("interrupted").
+    """
+    if current_user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    tts_model = "tts" if gender == "W" else "xtts"
+    for model_name in ("whisper", tts_model):
+        if not await wait_for_model(model_name, MODEL_READY_TIMEOUT):
+            await websocket.send_json({"type": "error", "detail": f"Модель '{model_name}' еще не готова"})
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+            return
+    try:
+        llm_service = OptimizedLLMService.get_instance()
+    except RuntimeError as e:
+        await websocket.send_json({"type": "error", "detail": str(e)})
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+        return
+
+    # Ответ отправляется из задачи реплики, служебные сообщения — из цикла приема
+    send_lock = asyncio.Lock()
+
+    async def send(message: Union[dict, bytes]):
+        async with send_lock:
+            if isinstance(message, bytes):
+                await websocket.send_bytes(message)
+            else:
+                await websocket.send_json(message)
+
+    session = VoiceAssistantSession(
+        audio_service, llm_service, send,
+        speaker=AudioService.speaker_for_gender(gender), language=language, speed=speed
+    )
+    vad = VoiceActivityDetector(
+        sample_rate=STT_STREAM_SAMPLE_RATE,
+        silence_end_ms=STT_VAD_SILENCE_MS,
+        max_utterance_s=STT_MAX_UTTERANCE_SECONDS
+    )
+    await send({"type": "ready", "sample_rate": SAMPLE_RATE, "encoding": "pcm_s16le"})
+
+    frames = PcmFrameDecoder()
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("text") is not None:
+                event = parse_client_event(message["text"])
+                if event == "interrupt":
+                    session.interrupt()
+                elif event == "end":
+                    utterance = vad.flush()
+                    if utterance is not None:
+                        session.on_utterance(utterance, time.perf_counter())
+                    await session.finish()
+                    break
+                else:
+                    await send({"type": "error", "detail": 'Ожидается JSON вида {"event": "interrupt"} или {"event": "end"}'})
+                continue
+
+            for utterance in vad.feed(frames.decode(message.get("bytes"))):
+                # Время конца речи — точка отсчета time-to-first-audio
+                session.on_utterance(utterance, time.perf_counter())
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        await close_websocket_on_error(websocket, e)
+    finally:
+        session.interrupt()
+
+@router.get("/assistant/stats")
+async def voice_assistant_stats(current_user: User = Depends(get_current_active_user)):
+    """Тайминги этапов голосового ассистента (p50/p95 по последним репликам), в т.ч. time-to-first-audio."""
+    return voice_pipeline_stats()
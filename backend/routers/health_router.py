@@ -0,0 +1,43 @@
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+
+from config import READINESS_REQUIRES_MODELS
+from database import saengine
+from model_registry import get_models_status, get_model_cache_stats, MODEL_READY, MODEL_EVICTED
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+@router.get("/live")
+async def liveness():
+    """Процесс жив и обрабатывает запросы"""
+    return {"status": "alive"}
+
+@router.get("/ready")
+async def readiness():
+    """Готовность принимать трафик: БД доступна, состояния моделей в ответе"""
+    models = get_models_status()
+    try:
+        async with saengine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        database_ready = True
+    except Exception:
+        database_ready = False
+
+    # Выгруженная по простою модель загрузится при первом запросе — это не потеря готовности
+    models_ready = all(m["state"] in (MODEL_READY, MODEL_EVICTED) for m in models.values())
+    ready = database_ready and (models_ready or not READINESS_REQUIRES_MODELS)
+
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={
+            "status": "ready" if ready else "not_ready",
+            "database": database_ready,
+            "models": models
+        }
+    )
+
+@router.get("/models")
+async def model_cache():
+    """Кэш моделей процесса: загрузки, выгрузки, повторные загрузки и занятая память"""
+    return get_model_cache_stats()
@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from metrics import render_metrics
+
+router = APIRouter(tags=["metrics"])
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Метрики в текстовом формате Prometheus (агрегированные по воркерам при PROMETHEUS_MULTIPROC_DIR)"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
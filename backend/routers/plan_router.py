@@ -1,23 +1,44 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
 from database import get_db
 from services.plan_service import PlanService
-from dto.plan import PlanCreate, PlanResponse, PlanUpdate, TaskResponse
+from services.plan_jobs import PlanJobWorkerPool
+from dto.plan import PlanCreate, PlanJobResponse, PlanResponse, PlanUpdate, TaskResponse
 from auth.dependencies import get_current_active_user
 from models.user import User
 
 router = APIRouter(prefix="/plans", tags=["plans"])
 
-@router.post("/", response_model=PlanResponse)
+@router.post("/", response_model=PlanResponse, responses={status.HTTP_202_ACCEPTED: {"model": PlanJobResponse}})
 async def create_plan(
     plan_data: PlanCreate,
+    request: Request,
+    background: bool = Query(False, description="Поставить генерацию в очередь и сразу вернуть задачу (202)"),
     current_user: User = Depends(get_current_active_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Создает новый план обучения"""
+    """Создает новый план обучения
+
+    С background=true генерация идет в фоновом воркере: ответ 202 с задачей,
+    статус и промежуточный план — GET /plans/jobs/{job_id} (ссылка в Location).
+    """
     plan_service = PlanService(db)
+    if background:
+        job = await plan_service.enqueue_plan_generation(
+            user_id=current_user.id,
+            objective=plan_data.objective,
+            duration=plan_data.duration
+        )
+        PlanJobWorkerPool.get_instance().notify()
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content=jsonable_encoder(PlanJobResponse.model_validate(job)),
+            headers={"Location": str(request.url_for("get_plan_job", job_id=job.id))}
+        )
     try:
         plan = await plan_service.generate_and_create_plan(
             user_id=current_user.id,
@@ -40,6 +61,22 @@ async def get_user_plans(
     plan_service = PlanService(db)
     return await plan_service.get_user_plans(current_user.id)
 
+@router.get("/jobs/{job_id}", response_model=PlanJobResponse)
+async def get_plan_job(
+    job_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Статус фоновой генерации плана; после succeeded план доступен по plan_id"""
+    plan_service = PlanService(db)
+    job = await plan_service.get_user_plan_job(current_user.id, job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Plan job not found"
+        )
+    return job
+
 @router.get("/{plan_id}", response_model=PlanResponse)
 async def get_plan(
     plan_id: int,
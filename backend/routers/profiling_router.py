@@ -0,0 +1,54 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+
+from profiling import (
+    ContinuousProfiler,
+    check_profiling_token,
+    continuous_profile,
+    list_request_profiles,
+    load_request_profile,
+    render
+)
+
+async def require_profiling_token(x_profile_token: Optional[str] = Header(None)):
+    """Доступ только с токеном администратора (PROFILING_TOKEN)"""
+    if not check_profiling_token(x_profile_token):
+        # Без токена эндпоинты выглядят несуществующими
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+
+router = APIRouter(
+    prefix="/profiling",
+    tags=["profiling"],
+    dependencies=[Depends(require_profiling_token)],
+    include_in_schema=False
+)
+
+ProfileFormat = Query("collapsed", pattern="^(collapsed|tree)$")
+
+@router.get("/requests")
+async def request_profiles():
+    """Сохраненные профили запросов (новые первыми)"""
+    return list_request_profiles()
+
+@router.get("/requests/{profile_id}")
+async def request_profile(profile_id: str, format: str = ProfileFormat):
+    """Профиль запроса: свернутые стеки (speedscope, flamegraph.pl) или дерево вызовов"""
+    stacks = load_request_profile(profile_id)
+    if stacks is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    return PlainTextResponse(
+        render(stacks, format),
+        headers={"Content-Disposition": f'inline; filename="{profile_id}.{"txt" if format == "tree" else "collapsed"}"'}
+    )
+
+@router.get("/continuous")
+async def continuous(format: str = ProfileFormat):
+    """Агрегированные стеки постоянного сэмплирования по всем воркерам"""
+    if ContinuousProfiler.get_instance() is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Continuous profiling is disabled (PROFILING_CONTINUOUS_HZ=0)"
+        )
+    return PlainTextResponse(render(continuous_profile(), format))
@@ -0,0 +1,97 @@
+import io
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+import soundfile as sf
+
+@dataclass(frozen=True)
+class AudioFormat:
+    name: str
+    extension: str
+    media_type: str
+    sf_format: str
+    sf_subtype: str
+    compressed: bool = True
+
+AUDIO_FORMATS = {
+    "opus": AudioFormat("opus", ".ogg", "audio/ogg", "OGG", "OPUS"),
+    "mp3": AudioFormat("mp3", ".mp3", "audio/mpeg", "MP3", "MPEG_LAYER_III"),
+    "wav": AudioFormat("wav", ".wav", "audio/wav", "WAV", "PCM_16", compressed=False),
+}
+
+# Пресеты битрейта -> compression_level libsndfile по форматам (0 — максимальный битрейт, 1 — минимальный).
+# Для речи 24 кГц: Opus ~32/45/64 кбит/с, MP3 ~29/41/66 кбит/с
+BITRATE_PRESETS = {
+    "low": {"opus": 0.9, "mp3": 0.9},
+    "medium": {"opus": 0.85, "mp3": 0.5},
+    "high": {"opus": 0.78, "mp3": 0.1},
+}
+
+# media type из заголовка Accept -> формат
+_ACCEPT_TO_FORMAT = {
+    "audio/ogg": "opus",
+    "audio/opus": "opus",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/wav": "wav",
+    "audio/x-wav": "wav",
+}
+
+def negotiate_format(requested: Optional[str], accept: Optional[str], default: str) -> AudioFormat:
+    """Формат ответа: явный параметр запроса, затем Accept (по q), затем default."""
+    if requested:
+        if requested not in AUDIO_FORMATS:
+            raise ValueError(f"Неподдерживаемый формат аудио: {requested}. Доступны: {', '.join(AUDIO_FORMATS)}")
+        return AUDIO_FORMATS[requested]
+
+    if accept:
+        candidates = []
+        for position, item in enumerate(accept.split(",")):
+            parts = [p.strip() for p in item.split(";")]
+            media_type = parts[0].lower()
+            quality = 1.0
+            for param in parts[1:]:
+                if param.startswith("q="):
+                    try:
+                        quality = float(param[2:])
+                    except ValueError:
+                        quality = 0.0
+            if media_type in _ACCEPT_TO_FORMAT and quality > 0:
+                candidates.append((-quality, position, _ACCEPT_TO_FORMAT[media_type]))
+        if candidates:
+            return AUDIO_FORMATS[min(candidates)[2]]
+
+    return AUDIO_FORMATS[default]
+
+def encode_audio(
+    audio: np.ndarray,
+    sample_rate: int,
+    audio_format: AudioFormat,
+    preset: str = "medium"
+) -> bytes:
+    """Кодирует float32 моно в байты выбранного формата."""
+    if preset not in BITRATE_PRESETS:
+        raise ValueError(f"Неизвестный пресет битрейта: {preset}. Доступны: {', '.join(BITRATE_PRESETS)}")
+    buffer = io.BytesIO()
+    options = {}
+    if audio_format.compressed:
+        options["compression_level"] = BITRATE_PRESETS[preset][audio_format.name]
+    sf.write(
+        buffer,
+        audio,
+        sample_rate,
+        format=audio_format.sf_format,
+        subtype=audio_format.sf_subtype,
+        **options
+    )
+    return buffer.getvalue()
+
+def write_audio_file(
+    path: str,
+    audio: np.ndarray,
+    sample_rate: int,
+    audio_format: AudioFormat,
+    preset: str = "medium"
+):
+    with open(path, "wb") as f:
+        f.write(encode_audio(audio, sample_rate, audio_format, preset))
@@ -1,12 +1,16 @@
 from concurrent.futures import ThreadPoolExecutor
+import logging
 import os
+import threading
+import struct
 import time
 import asyncio
 import tempfile
 import shutil
 from pathlib import Path
+from collections import deque
 from datetime import datetime
-from typing import Tuple, Optional
+from typing import BinaryIO, Tuple, Optional
 from fastapi import UploadFile
 from faster_whisper import WhisperModel
 import re
@@ -18,41 +22,249 @@ import torch
 from TTS.api import TTS
 from sqlalchemy.orm import Session
 from dto.audio import AudioResponse
-from config import SAMPLE_RATE
-from model_registry import get_tts_model, get_whisper_model, get_xtts_model
-from repository.audio_repository import AudioRepository
+from config import (
+    SAMPLE_RATE,
+    AUDIO_INFERENCE_WORKERS,
+    STREAM_TTS_LOOKAHEAD,
+    TTS_CACHE_DIR,
+    TTS_CACHE_MAX_BYTES,
+    STT_BATCHING_ENABLED,
+    STT_BATCH_MAX_SIZE,
+    STT_BATCH_WINDOW_MS,
+    STT_DEFAULT_PROFILE,
+    STT_LONG_AUDIO_SECONDS,
+    STT_MAX_AUDIO_SECONDS,
+    STT_CHUNK_SECONDS,
+    STT_CHUNK_OVERLAP_SECONDS,
+    TTS_SENTENCE_CONCURRENCY,
+    TTS_MAX_SENTENCE_CHARS,
+    XTTS_VOICE_CACHE_DIR,
+    TTS_DEFAULT_FORMAT,
+    TTS_DEFAULT_BITRATE,
+    INFERENCE_PROCESS_ISOLATION,
+    INFERENCE_PROCESS_WORKERS,
+    INFERENCE_JOB_TIMEOUT,
+    INFERENCE_HEALTH_INTERVAL,
+    INFERENCE_SOCKET,
+    WAKE_WORD_KEYWORDS,
+    WAKE_WORD_LANGUAGE,
+    WAKE_WORD_CONCURRENCY,
+    WAKE_WORD_MAX_SECONDS,
+    WAKE_WORD_THRESHOLD
+)
+from model_registry import get_tts_model, get_wake_word_model, get_whisper_model, get_xtts_model
+from repository.audio_repository import AudioRepository, WHISPER_SAMPLE_RATE
+from services.tts_cache import TTSAudioCache
+from services.audio_encoding import AUDIO_FORMATS, AudioFormat, write_audio_file
+from services.voice_registry import XTTSVoiceRegistry
+from services.whisper_batcher import WhisperBatchScheduler, supports_batching
+from services.long_audio import split_at_silence, stitch_transcripts
+from services.time_stretch import time_stretch
+from services.inference_server import RemoteInferencePool
+from services.inference_workers import InferenceJobs, InferenceWorkerPool
+from services.stt_routing import WhisperProfile, WHISPER_PROFILES, select_whisper_profile
+from services.wake_word import WakeWordDetector, WakeWordResult
+from metrics import track_inference
+
+# Горячий путь: записи уходят в очередь logging_setup, а не синхронным print
+stt_logger = logging.getLogger("audio.stt")
+tts_logger = logging.getLogger("audio.tts")
+
+def _wav_stream_header(sample_rate, channels=1, bits_per_sample=16):
+    """WAV header for a stream of unknown length (RIFF/data sizes set to 0xFFFFFFFF)."""
+    byte_rate = sample_rate * channels * bits_per_sample // 8
+    block_align = channels * bits_per_sample // 8
+    return (
+        b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, byte_rate, block_align, bits_per_sample)
+        + b"data" + struct.pack("<I", 0xFFFFFFFF)
+    )
+
+def _pcm16_bytes(audio_array):
+    """Convert a float waveform in [-1, 1] to little-endian 16-bit PCM bytes."""
+    return (np.clip(audio_array, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+# Голоса VCTK: женский синтезирует VITS, мужской — XTTS по образцу голоса
+FEMALE_SPEAKER = "p225"
+MALE_SPEAKER = "p228"
+MALE_SPEAKER_WAV = "segment-000.wav"
+
+VITS_MODEL_NAME = "tts_models/en/vctk/vits"
+XTTS_MODEL_NAME = "tts_models/multilingual/multi-dataset/xtts_v2"
 
 class AudioService:
-    def __init__(self, db_session: Session, audio_repository: AudioRepository):
-        self.db = db_session
+    """Аудио-сервис уровня приложения: один экземпляр и один пул инференса на процесс.
+
+    Состояние конкретного запроса (например, выбранный голос) передается
+    аргументами методов, а не хранится в экземпляре.
+    """
+    _instance = None
+    _initialization_lock = threading.Lock()
+
+    def __init__(self, audio_repository: AudioRepository):
         self.audio_repository = audio_repository
-        self.executor = ThreadPoolExecutor(max_workers=4)
-        
-        # Используем загруженные модели из registry вместо создания новых
-        self.whisper_model = get_whisper_model()
-        self.tts_model = get_tts_model()
-        self.xtts_model = get_xtts_model()
-        
+        self.executor = ThreadPoolExecutor(
+            max_workers=AUDIO_INFERENCE_WORKERS,
+            thread_name_prefix="audio_inference"
+        )
+        self.tts_cache = TTSAudioCache(TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES)
+        self.voice_registry = XTTSVoiceRegistry(get_xtts_model, XTTS_VOICE_CACHE_DIR)
+        # Отдельная очередь микро-батчинга на каждый профиль Whisper
+        self.whisper_batchers = {}
+        # Модели в отдельных процессах: инференс не делит GIL с event loop.
+        # Под gunicorn пул один на все процессы API (сервер инференса за INFERENCE_SOCKET),
+        # без пула модели грузятся в этом процессе и работают в self.executor
+        self.inference_pool: Optional[InferenceJobs] = None
+        if INFERENCE_PROCESS_ISOLATION and INFERENCE_SOCKET:
+            self.inference_pool = RemoteInferencePool(
+                INFERENCE_SOCKET, INFERENCE_PROCESS_WORKERS, connect_timeout=INFERENCE_JOB_TIMEOUT
+            )
+        elif INFERENCE_PROCESS_ISOLATION:
+            self.inference_pool = InferenceWorkerPool(
+                INFERENCE_PROCESS_WORKERS,
+                job_timeout=INFERENCE_JOB_TIMEOUT,
+                health_interval=INFERENCE_HEALTH_INTERVAL
+            )
+        # Wake word всегда считается в этом процессе на своей копии tiny-модели:
+        # воркер Whisper в пуле один на процесс и занят длинными транскрипциями
+        self.wake_word = WakeWordDetector(
+            get_wake_word_model,
+            WAKE_WORD_KEYWORDS,
+            language=WAKE_WORD_LANGUAGE,
+            max_workers=WAKE_WORD_CONCURRENCY,
+            max_seconds=WAKE_WORD_MAX_SECONDS,
+            threshold=WAKE_WORD_THRESHOLD,
+            sample_rate=WHISPER_SAMPLE_RATE
+        )
+
+    @classmethod
+    def get_instance(cls) -> "AudioService":
+        if cls._instance is None:
+            with cls._initialization_lock:
+                if cls._instance is None:
+                    cls._instance = cls(AudioRepository())
+        return cls._instance
+
+    @classmethod
+    def prepare_resources(cls):
+        """Однократная подготовка ресурсов при старте (вызывается из lifespan)."""
         # Initialize NLTK for sentence tokenization
-        nltk.download('punkt', quiet=True)
+        try:
+            nltk.data.find("tokenizers/punkt")
+        except LookupError:
+            nltk.download('punkt', quiet=True)
+        cls.get_instance()
+
+    @classmethod
+    def shutdown(cls):
+        """Останавливает пул инференса и процессы-воркеры при остановке приложения."""
+        with cls._initialization_lock:
+            if cls._instance is not None:
+                if cls._instance.inference_pool is not None:
+                    cls._instance.inference_pool.stop()
+                cls._instance.wake_word.shutdown()
+                cls._instance.executor.shutdown(wait=False, cancel_futures=True)
+                cls._instance = None
+
+    @staticmethod
+    def speaker_for_gender(gender: str) -> str:
+        return FEMALE_SPEAKER if gender == "W" else MALE_SPEAKER
+
+    # Модели берутся из registry при первом обращении, чтобы создание сервиса
+    # не блокировалось фоновой загрузкой моделей
+    @property
+    def whisper_model(self):
+        return get_whisper_model()
+
+    @property
+    def tts_model(self):
+        return get_tts_model()
+
+    @property
+    def xtts_model(self):
+        return get_xtts_model()
         
-    async def transcribe_audio_async(self, file_path):
-        """Asynchronously transcribe audio using faster-whisper."""
-        print("🎙️ Transcribing audio...")
+    def _pool_for(self, model_name: str) -> Optional[InferenceJobs]:
+        """Пул воркеров, если модель вынесена в отдельные процессы; иначе None."""
+        if self.inference_pool is not None and self.inference_pool.serves(model_name):
+            return self.inference_pool
+        return None
+
+    def _get_whisper_batcher(self, profile: WhisperProfile) -> WhisperBatchScheduler:
+        batcher = self.whisper_batchers.get(profile.name)
+        if batcher is None:
+            runner = None
+            pool = self._pool_for("whisper")
+            if pool is not None:
+                # Батч собирается здесь, а декодируется в процессе-воркере Whisper
+                runner = lambda audios: pool.transcribe_batch(
+                    audios, profile.model_size, STT_BATCH_MAX_SIZE, profile.decode_options()
+                )
+            batcher = WhisperBatchScheduler(
+                lambda: get_whisper_model(profile.model_size),
+                self.executor,
+                max_batch_size=STT_BATCH_MAX_SIZE,
+                window_ms=STT_BATCH_WINDOW_MS,
+                options=profile.decode_options(),
+                runner=runner
+            )
+            self.whisper_batchers[profile.name] = batcher
+        return batcher
+
+    async def _transcribe(self, audio, profile: WhisperProfile) -> str:
+        with track_inference("whisper", profile.name):
+            if (STT_BATCHING_ENABLED and isinstance(audio, np.ndarray)
+                    and supports_batching(profile.decode_options())):
+                # Concurrent requests of one profile are merged into one batched encode/decode;
+                # profiles with options the batch cannot honour go through model.transcribe
+                return await self._get_whisper_batcher(profile).transcribe(audio)
+
+            pool = self._pool_for("whisper")
+            if pool is not None:
+                return await pool.transcribe(audio, profile.model_size, profile.decode_options())
+
+            # Run transcription in a separate thread since it's CPU/GPU intensive
+            loop = asyncio.get_event_loop()
+
+            def _run():
+                model = get_whisper_model(profile.model_size)
+                segments, _ = model.transcribe(audio, **profile.decode_options())
+                # transcribe() returns a lazy generator: decode it inside the executor,
+                # otherwise the actual inference would run on the event loop
+                return " ".join(segment.text.strip() for segment in segments).strip()
+
+            return await loop.run_in_executor(self.executor, _run)
+
+    async def _transcribe_long(self, audio: np.ndarray, profile: WhisperProfile) -> str:
+        """Split long audio at silences into overlapping chunks and transcribe them in parallel."""
+        bounds = split_at_silence(
+            audio, WHISPER_SAMPLE_RATE, STT_CHUNK_SECONDS, STT_CHUNK_OVERLAP_SECONDS
+        )
+        stt_logger.info("Long audio (%.0fs) split into %d chunks", len(audio) / WHISPER_SAMPLE_RATE, len(bounds))
+        # Куски — срезы исходного массива; параллелизм ограничен пулом инференса
+        texts = await asyncio.gather(*[
+            self._transcribe(audio[start:end], profile) for start, end in bounds
+        ])
+        return stitch_transcripts(texts)
+
+    async def transcribe_audio_async(self, audio, profile: Optional[WhisperProfile] = None):
+        """Asynchronously transcribe audio (a file path or a float32 16 kHz array) using faster-whisper."""
+        profile = profile or WHISPER_PROFILES[STT_DEFAULT_PROFILE]
+        stt_logger.debug("Transcribing audio (profile: %s)", profile.name)
         start = time.perf_counter()
         
         try:
-            # Run transcription in a separate thread since it's CPU/GPU intensive
-            loop = asyncio.get_event_loop()
-            segments, _ = await loop.run_in_executor(
-                self.executor, 
-                lambda: self.whisper_model.transcribe(file_path)
-            )
-            
-            transcript = " ".join(segment.text for segment in segments)
+            if isinstance(audio, np.ndarray) and len(audio) > STT_LONG_AUDIO_SECONDS * WHISPER_SAMPLE_RATE:
+                transcript = await self._transcribe_long(audio, profile)
+            else:
+                transcript = await self._transcribe(audio, profile)
             
             end = time.perf_counter()
-            print(f"📜 Transcribed in {end-start:.2f}s: {transcript}")
+            # Без текста транскрипта: он может быть длинным и содержит данные пользователя
+            stt_logger.info(
+                "Transcribed in %.2fs (%d chars)", end - start, len(transcript),
+                extra={"profile": profile.name, "duration_s": round(end - start, 3)}
+            )
             
             # Очищаем память GPU после использования
             if torch.cuda.is_available():
@@ -62,11 +274,15 @@ class AudioService:
             return transcript
             
         except Exception as e:
-            print(f"Error in transcription: {str(e)}")
+            stt_logger.error("Error in transcription: %s", e)
             if torch.cuda.is_available():
                 torch.cuda.empty_cache()
             raise
     
+    async def transcribe_array_async(self, audio: np.ndarray, profile: Optional[WhisperProfile] = None) -> str:
+        """Transcribe an in-memory float32 16 kHz mono waveform without logging."""
+        return await self._transcribe(audio, profile or WHISPER_PROFILES[STT_DEFAULT_PROFILE])
+
     def process_non_speech_sounds(self, text):
         """Process non-speech sounds in the transcribed text."""
         # Implement your specific processing logic here
@@ -75,7 +291,7 @@ class AudioService:
     
     async def process_non_speech_sounds_async(self, text):
         """Asynchronously process non-speech sounds in the transcribed text."""
-        print("🔧 Processing non-speech sounds...")
+        stt_logger.debug("Processing non-speech sounds")
         
         # If this is a lightweight operation, it could be done directly
         # For consistency or if it becomes more complex, use the executor
@@ -86,8 +302,8 @@ class AudioService:
         )
         return formatted_text
     
-    async def process_sentence(self, sentence, output_file=None):
-        """Process a single sentence for TTS with Coqui TTS."""
+    async def process_sentence(self, sentence, speaker):
+        """Process a single sentence for TTS with Coqui TTS into an in-memory waveform."""
         loop = asyncio.get_event_loop()
         
         # Process special pronunciation instructions in [brackets]
@@ -96,206 +312,344 @@ class AudioService:
             pattern = r'\[(.*?)\]'
             sentence = re.sub(pattern, r'\1', sentence)
         
-        # Limit sentence length to reduce memory usage
-        if len(sentence) > 200:
-            sentence = sentence[:200]
-        
-        # Generate audio with Coqui TTS
-        if output_file:
-            # Generate directly to file
-            await loop.run_in_executor(
-                self.executor,
-                lambda: self.tts_model.tts_to_file(
-                    text=sentence,
-                    file_path=output_file,
-                    speaker=self.speaker
-                )
-            )
-            # Read the file to get the audio array
-            audio_array, _ = await loop.run_in_executor(
-                self.executor,
-                lambda: sf.read(output_file)
-            )
-        else:
+        with track_inference("tts", "synthesize"):
+            pool = self._pool_for("tts")
+            if pool is not None:
+                return await pool.synthesize(sentence, speaker)
+
             # Generate to waveform
             audio_array = await loop.run_in_executor(
                 self.executor,
                 lambda: self.tts_model.tts(
                     text=sentence,
-                    speaker=self.speaker
+                    speaker=speaker
                 )
             )
         
         return audio_array
     
     def speed_up_audio(self, audio_array, speed_factor=1.15):
-        """Speed up audio by simple resampling."""
-        # Calculate new length based on speed factor
-        new_length = int(len(audio_array) / speed_factor)
-        # Resample the audio array
-        indices = np.linspace(0, len(audio_array) - 1, new_length)
-        indices = indices.astype(np.int32)
-        return audio_array[indices]
+        """Change speech tempo by `speed_factor` while preserving pitch (WSOLA)."""
+        return time_stretch(audio_array, SAMPLE_RATE, speed_factor)
     
-    async def text_to_speech_async(self, text, output_file="response.mp3", speaker_wav=None, language="en"):
-        """Asynchronously convert text to speech using XTTS or Coqui TTS."""
-        print("🔊 Generating speech...")
-        start = time.perf_counter()
-        
-        # Process text to better handle sentence breaks
+    @staticmethod
+    def _normalize_tts_text(text):
+        """Process text to better handle sentence breaks."""
         text = re.sub(r'(?<![.!?])\n', '. ', text)
         text = re.sub(r'\.(?! )', '. ', text)
-        
-        if speaker_wav:
-            # Use XTTS for voice cloning
+        return text
+
+    async def _synthesize_sentence(self, sentence, speaker, speaker_wav=None, language="en"):
+        """Synthesize one sentence to an in-memory waveform with XTTS or Coqui TTS."""
+        if not speaker_wav:
+            return await self.process_sentence(sentence, speaker)
+        with track_inference("xtts", "synthesize"):
+            pool = self._pool_for("xtts")
+            if pool is not None:
+                return await pool.synthesize_xtts(sentence, speaker_wav, language)
             loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
+            # Латенты голоса берутся из реестра — образец не пересчитывается на каждый запрос
+            return await loop.run_in_executor(
                 self.executor,
-                lambda: self.xtts_model.tts_to_file(
-                    text=text,
-                    file_path=output_file,
-                    speaker_wav=speaker_wav,
-                    language=language,
-                    split_sentences=True
-                )
+                lambda: self.voice_registry.synthesize(sentence, speaker_wav, language)
             )
-        else:
-            # Use regular Coqui TTS with optimized settings
-            await self._text_to_speech_coqui_async(text, output_file)
+
+    @staticmethod
+    def _split_sentences(text, max_chars=TTS_MAX_SENTENCE_CHARS):
+        """Split text into sentences, breaking long ones at clause and then word boundaries."""
+        units = []
+        for sentence in nltk.sent_tokenize(text):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            if len(sentence) <= max_chars:
+                units.append(sentence)
+                continue
+            # Сначала режем по знакам препинания внутри предложения, затем по словам
+            parts = []
+            for clause in re.split(r'(?<=[,;:\u2014])\s+', sentence):
+                parts.extend(clause.split() if len(clause) > max_chars else [clause])
+            current = ""
+            for part in parts:
+                if current and len(current) + 1 + len(part) > max_chars:
+                    units.append(current)
+                    current = part
+                else:
+                    current = f"{current} {part}" if current else part
+            if current:
+                units.append(current)
+        return units
+
+    async def _synthesize_in_order(self, sentences, speaker, speaker_wav=None, language="en", window=TTS_SENTENCE_CONCURRENCY):
+        """Yield sentence waveforms in order, keeping up to `window` synthesis jobs in flight.
+
+        A new job starts as soon as the oldest one is consumed, so long texts
+        never stall waiting for a whole batch to finish.
+        """
+        pending = deque()
+        next_index = 0
+        try:
+            while next_index < len(sentences) or pending:
+                while next_index < len(sentences) and len(pending) < window:
+                    pending.append(asyncio.create_task(
+                        self._synthesize_sentence(sentences[next_index], speaker, speaker_wav, language)
+                    ))
+                    next_index += 1
+                yield np.asarray(await pending.popleft(), dtype=np.float32)
+        finally:
+            # Потребитель мог прерваться (например, клиент отключился) — не оставляем синтез висеть в пуле
+            for task in pending:
+                task.cancel()
+
+    async def stream_speech(self, text, speaker=FEMALE_SPEAKER, language="en", speed=1.0):
+        """Stream speech sentence by sentence as a WAV header followed by PCM chunks.
+
+        Up to STREAM_TTS_LOOKAHEAD sentences are synthesized ahead of the one
+        being sent, and chunks are always yielded in sentence order.
+        """
+        tts_logger.debug("Streaming speech")
+        start = time.perf_counter()
+        speaker_wav = MALE_SPEAKER_WAV if speaker == MALE_SPEAKER else None
+        sentences = self._split_sentences(self._normalize_tts_text(text))
+        silence = _pcm16_bytes(np.zeros(int(0.15 * SAMPLE_RATE / speed), dtype=np.float32))
+        loop = asyncio.get_event_loop()
+
+        yield _wav_stream_header(SAMPLE_RATE)
+
+        sent_chunks = 0
+        async for audio_array in self._synthesize_in_order(
+            sentences, speaker, speaker_wav, language, window=STREAM_TTS_LOOKAHEAD
+        ):
+            if sent_chunks == 0:
+                tts_logger.debug("First audio chunk after %.2fs", time.perf_counter() - start)
+            sent_chunks += 1
+            if speed != 1.0:
+                audio_array = await loop.run_in_executor(self.executor, self.speed_up_audio, audio_array, speed)
+            yield _pcm16_bytes(audio_array)
+            yield silence
+
+        tts_logger.info("Speech streamed in %.2fs (%d sentences)", time.perf_counter() - start, len(sentences))
+
+    async def synthesize_pcm(self, text, speaker=FEMALE_SPEAKER, language="en", speed=1.0) -> bytes:
+        """Synthesize a short text (one sentence as it arrives from the LLM) to 16-bit PCM at SAMPLE_RATE."""
+        speaker_wav = MALE_SPEAKER_WAV if speaker == MALE_SPEAKER else None
+        audio_array = np.asarray(
+            await self._synthesize_sentence(self._normalize_tts_text(text), speaker, speaker_wav, language),
+            dtype=np.float32
+        )
+        if speed != 1.0:
+            loop = asyncio.get_event_loop()
+            audio_array = await loop.run_in_executor(self.executor, self.speed_up_audio, audio_array, speed)
+        return _pcm16_bytes(audio_array)
+
+    async def text_to_speech_async(
+        self,
+        text,
+        output_file="response.mp3",
+        speaker=FEMALE_SPEAKER,
+        speaker_wav=None,
+        language="en",
+        audio_format: AudioFormat = AUDIO_FORMATS[TTS_DEFAULT_FORMAT],
+        bitrate: str = TTS_DEFAULT_BITRATE,
+        speed: float = 1.0
+    ):
+        """Asynchronously convert text to speech using XTTS or Coqui TTS and encode it as `audio_format`."""
+        tts_logger.debug("Generating speech")
+        start = time.perf_counter()
+        
+        text = self._normalize_tts_text(text)
+        
+        # XTTS (voice cloning, speaker_wav) and VITS share the in-memory sentence pipeline
+        await self._text_to_speech_coqui_async(text, output_file, speaker, speaker_wav, language, audio_format, bitrate, speed)
         
         end = time.perf_counter()
-        print(f"✅ Speech generated in {end-start:.2f}s, saved to {output_file}")
+        tts_logger.info("Speech generated in %.2fs", end - start, extra={"duration_s": round(end - start, 3)})
         return output_file
 
-    async def _text_to_speech_coqui_async(self, text, output_file):
-        """Internal method for Coqui TTS processing."""
-        sentences = nltk.sent_tokenize(text)
-        silence = np.zeros(int(0.15 * SAMPLE_RATE), dtype=np.float32)
-        pieces = []
-        
-        if len(sentences) <= 1 and len(text) < 200:
-            temp_file = f"{output_file}.temp.mp3"
-            audio_array = await self.process_sentence(text, temp_file)
-            
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
-                self.executor,
-                lambda: sf.write(output_file, audio_array, SAMPLE_RATE)
-            )
-            
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
+    async def _text_to_speech_coqui_async(
+        self,
+        text,
+        output_file,
+        speaker,
+        speaker_wav=None,
+        language="en",
+        audio_format: AudioFormat = AUDIO_FORMATS[TTS_DEFAULT_FORMAT],
+        bitrate: str = TTS_DEFAULT_BITRATE,
+        speed: float = 1.0
+    ):
+        """Internal method for Coqui TTS processing.
+
+        Sentences are synthesized in memory through a sliding window and copied
+        in order into one growing float32 buffer, which is encoded and written to disk once.
+        """
+        sentences = self._split_sentences(text)
+        silence_samples = int(0.15 * SAMPLE_RATE)
+        # Грубая оценка длины (~70 мс на символ), буфер растет при нехватке
+        buffer = np.zeros(max(int(len(text) * 0.07 * SAMPLE_RATE), SAMPLE_RATE), dtype=np.float32)
+        length = 0
+
+        async for audio_array in self._synthesize_in_order(sentences, speaker, speaker_wav, language):
+            needed = length + len(audio_array) + silence_samples
+            if needed > len(buffer):
+                grown = np.zeros(max(needed, int(len(buffer) * 1.5)), dtype=np.float32)
+                grown[:length] = buffer[:length]
+                buffer = grown
+            buffer[length:length + len(audio_array)] = audio_array
+            # Пауза между предложениями уже нулевая — просто сдвигаем позицию
+            length += len(audio_array) + silence_samples
+
+        if length == 0:
+            tts_logger.warning("No audio generated, possibly empty text input")
+            full_audio = np.zeros(int(0.5 * SAMPLE_RATE), dtype=np.float32)
         else:
-            batch_size = 3
-            for i in range(0, len(sentences), batch_size):
-                batch = sentences[i:i+batch_size]
-                batch_tasks = []
-                
-                for j, sentence in enumerate(batch):
-                    if sentence.strip():
-                        temp_file = f"{output_file}.{i+j}.temp.mp3"
-                        task = asyncio.create_task(self.process_sentence(sentence, temp_file))
-                        batch_tasks.append((task, temp_file))
-                
-                for task, temp_file in batch_tasks:
-                    audio_array = await task
-                    pieces.append(audio_array)
-                    pieces.append(silence.copy())
-                    
-                    if os.path.exists(temp_file):
-                        os.remove(temp_file)
-            
-            if pieces:
-                loop = asyncio.get_event_loop()
-                full_audio = await loop.run_in_executor(
-                    self.executor,
-                    lambda: np.concatenate(pieces).astype(np.float32)
-                )
-                
-                await loop.run_in_executor(
-                    self.executor,
-                    lambda: sf.write(output_file, full_audio, SAMPLE_RATE)
-                )
-            else:
-                print("Warning: No audio generated, possibly empty text input")
-                full_audio = np.zeros(int(0.5 * SAMPLE_RATE), dtype=np.float32)
-                await loop.run_in_executor(
-                    self.executor,
-                    lambda: sf.write(output_file, full_audio, SAMPLE_RATE)
-                )
+            # Хвостовая пауза после последнего предложения не нужна
+            full_audio = buffer[:length - silence_samples]
 
-    async def transcribe_audio(self, audio_file: UploadFile) -> AudioResponse:
-        """Преобразование аудио-файла в текст."""
+        def _finalize():
+            # Темп меняется один раз для всей речи, паузы между предложениями сжимаются вместе с ней
+            audio = self.speed_up_audio(full_audio, speed) if speed != 1.0 else full_audio
+            write_audio_file(output_file, audio, SAMPLE_RATE, audio_format, bitrate)
+
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(self.executor, _finalize)
+
+    @staticmethod
+    def _check_audio_filename(filename: str):
         # Проверяем формат файла
-        if not audio_file.filename.lower().endswith(('.mp3', '.wav', '.ogg', '.m4a')):
-            raise ValueError(f"Неподдерживаемый формат файла: {audio_file.filename}. Поддерживаются: mp3, wav, ogg, m4a")
-            
-        # Создаем временный файл для обработки
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as temp_file:
-            try:
-                # Перемещаем указатель в начало файла
-                await audio_file.seek(0)
-                # Копируем содержимое
-                shutil.copyfileobj(audio_file.file, temp_file)
-                temp_path = temp_file.name
-            except Exception as e:
-                os.unlink(temp_file.name)
-                raise ValueError(f"Ошибка при сохранении временного файла: {str(e)}")
+        if not filename.lower().endswith(('.mp3', '.wav', '.ogg', '.m4a')):
+            raise ValueError(f"Неподдерживаемый формат файла: {filename}. Поддерживаются: mp3, wav, ogg, m4a")
 
+    async def detect_wake_word(self, audio_file: UploadFile) -> WakeWordResult:
+        """Проверка wake word в коротком клипе (быстрый путь, без основной модели Whisper)."""
+        self._check_audio_filename(audio_file.filename)
+        # Детектор смотрит только на первые WAKE_WORD_MAX_SECONDS — остальное не декодируется
+        audio = await self.audio_repository.process_audio_file(
+            audio_file, max_seconds=WAKE_WORD_MAX_SECONDS, truncate=True
+        )
+        return await self.wake_word.detect(audio)
+
+    async def transcribe_audio(
+        self,
+        audio_file: UploadFile,
+        quality: Optional[str] = None,
+        latency_slo_ms: Optional[float] = None
+    ) -> AudioResponse:
+        """Преобразование аудио-файла в текст.
+
+        Профиль Whisper выбирается по длительности аудио, явному quality или SLO по задержке.
+        """
+        self._check_audio_filename(audio_file.filename)
+            
         try:
-            # Проверяем размер файла
-            if os.path.getsize(temp_path) == 0:
-                raise ValueError("Загружен пустой файл")
+            # Декодируем загрузку в память, без промежуточных файлов; длинное аудио
+            # отклоняется по ходу декодирования, а не после разворота всего файла
+            audio = await self.audio_repository.process_audio_file(audio_file, max_seconds=STT_MAX_AUDIO_SECONDS)
+
+            # Старые клиенты шлют проверку wake word в /stt/ с именем файла wake_word_check
+            if "wake_word_check" in audio_file.filename:
+                result = await self.wake_word.detect(audio)
+                return AudioResponse(processed_text=result.text)
+
+            profile, _ = select_whisper_profile(
+                len(audio) / WHISPER_SAMPLE_RATE,
+                quality=quality,
+                latency_slo_ms=latency_slo_ms
+            )
 
             # Выполняем преобразование речи в текст
-            transcript = await self.transcribe_audio_async(temp_path)
+            transcript = await self.transcribe_audio_async(audio, profile)
 
             # Обрабатываем нерегулярные звуки, если необходимо
             processed_text = await self.process_non_speech_sounds_async(transcript)
-            await asyncio.sleep(0.3)
-
-            # Проверка на wake_word_check
-            if "wake_word_check" in audio_file.filename:
-                return AudioResponse(
-                    processed_text=processed_text
-                )
 
             return AudioResponse(
                 processed_text=processed_text
             )
 
         except Exception as e:
-            print(f"Ошибка при транскрибации: {str(e)}")
+            stt_logger.error("Ошибка при транскрибации: %s", e)
             raise
 
-        finally:
-            # Всегда удаляем временный файл
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
+    def _tts_cache_key(
+        self,
+        text: str,
+        speaker: str,
+        audio_format: AudioFormat,
+        bitrate: str,
+        speed: float = 1.0,
+        language: str = "en"
+    ) -> str:
+        # Разные форматы, битрейты и темп одного текста — разные записи кэша
+        encoding = f"{audio_format.name}:{bitrate if audio_format.compressed else ''}:{speed:g}"
+        if speaker == MALE_SPEAKER:
+            # Голос XTTS задается образцом: меняется файл — меняется ключ
+            voice = self.voice_registry.voice_id(MALE_SPEAKER_WAV)
+            return self.tts_cache.make_key(text, XTTS_MODEL_NAME, voice, language, encoding)
+        return self.tts_cache.make_key(text, VITS_MODEL_NAME, speaker, language, encoding)
 
-    async def change_speaker_gender(self, gender: str):
-        if gender == "W":
-            self.speaker = "p225" 
-        else:
-            self.speaker = "p228" 
+    def has_cached_audio(
+        self,
+        text: str,
+        speaker: str = FEMALE_SPEAKER,
+        audio_format: AudioFormat = AUDIO_FORMATS[TTS_DEFAULT_FORMAT],
+        bitrate: str = TTS_DEFAULT_BITRATE,
+        speed: float = 1.0
+    ) -> bool:
+        """Проверка наличия в кэше без учета в статистике попаданий."""
+        return self.tts_cache.enabled and self.tts_cache.contains(
+            self._tts_cache_key(text, speaker, audio_format, bitrate, speed)
+        )
+
+    def open_cached_audio(
+        self,
+        text: str,
+        speaker: str = FEMALE_SPEAKER,
+        audio_format: AudioFormat = AUDIO_FORMATS[TTS_DEFAULT_FORMAT],
+        bitrate: str = TTS_DEFAULT_BITRATE,
+        speed: float = 1.0
+    ) -> Optional[BinaryIO]:
+        """Уже синтезированное аудио для этого текста, голоса и формата (открытый файл), если есть."""
+        if not self.tts_cache.enabled:
+            return None
+        return self.tts_cache.get(self._tts_cache_key(text, speaker, audio_format, bitrate, speed))
+
+    async def create_audio_from_text(
+        self,
+        text: str,
+        speaker: str = FEMALE_SPEAKER,
+        audio_format: AudioFormat = AUDIO_FORMATS[TTS_DEFAULT_FORMAT],
+        bitrate: str = TTS_DEFAULT_BITRATE,
+        speed: float = 1.0
+    ) -> BinaryIO:
+        """Создание аудио из текста (повторные тексты отдаются из кэша без модели).
+
+        Возвращает открытый файл: вытеснение из кэша во время отдачи ответа его не затрагивает.
+        """
+        cached_audio = self.open_cached_audio(text, speaker, audio_format, bitrate, speed)
+        if cached_audio is not None:
+            tts_logger.debug("TTS cache hit")
+            return cached_audio
 
-    async def create_audio_from_text(self, text: str) -> str:
-        """Создание аудио из текста."""
         # Создаем временный файл
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as temp_file:
+        with tempfile.NamedTemporaryFile(delete=False, suffix=audio_format.extension) as temp_file:
             output_filename = temp_file.name
 
         try:
             # Преобразуем текст в речь
-            if self.speaker == "p228":
-                await self.text_to_speech_async(text, output_file=output_filename, speaker_wav="segment-000.wav") 
-            else:
-                await self.text_to_speech_async(text, output_file=output_filename)
-            
-            return output_filename
+            speaker_wav = MALE_SPEAKER_WAV if speaker == MALE_SPEAKER else None
+            await self.text_to_speech_async(
+                text,
+                output_file=output_filename,
+                speaker=speaker,
+                speaker_wav=speaker_wav,
+                audio_format=audio_format,
+                bitrate=bitrate,
+                speed=speed
+            )
+
+            return self.tts_cache.put(self._tts_cache_key(text, speaker, audio_format, bitrate, speed), output_filename)
         except Exception as e:
             # Удаляем временный файл в случае ошибки
             if os.path.exists(output_filename):
                 os.unlink(output_filename)
             raise
-    
\ No newline at end of file
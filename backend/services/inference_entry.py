@@ -0,0 +1,21 @@
+"""Точки входа процессов инференса: воркера модели (spawn) и сервера инференса.
+
+Модуль намеренно не импортирует numpy и torch: OpenMP, MKL и OpenBLAS
+читают лимиты потоков один раз, при загрузке библиотеки. Поэтому
+переменные окружения ставятся здесь, до импорта services.inference_workers.
+"""
+from resources import configure_thread_env
+
+def run_worker(model_name: str, worker_id: int, conn):
+    # Лимиты потоков этого воркера из общего бюджета CPU
+    configure_thread_env(model_name)
+    from services.inference_workers import _worker_main
+    _worker_main(model_name, worker_id, conn)
+
+if __name__ == "__main__":
+    # Сервер инференса: python -m services.inference_entry <socket> [parent_pid].
+    # Запуск через этот модуль, а не services.inference_server: spawn импортирует
+    # главный модуль в каждом воркере, и он не должен тянуть numpy до configure_thread_env
+    import sys
+    from services.inference_server import run_server
+    run_server(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else None)
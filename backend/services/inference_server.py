@@ -0,0 +1,371 @@
+"""Общий пул инференса для всех процессов API.
+
+Под gunicorn каждый воркер со своим InferenceWorkerPool держал бы свою копию
+Whisper, VITS и XTTS: память росла бы как WEB_CONCURRENCY x все модели, а
+процессы spawn не делят страницы весов. Поэтому master gunicorn запускает один
+процесс сервера инференса (InferenceServerSupervisor, см. gunicorn.conf.py),
+а воркеры API ходят в него через Unix-сокет INFERENCE_SOCKET
+(RemoteInferencePool).
+
+Протокол — кадры "длина + pickle". Аудио в обе стороны идет через shared
+memory, по сокету передаются только ссылки на сегменты. Сокет доступен
+только владельцу: pickle принимается только от процессов того же пользователя.
+Сервер рассылает клиентам состояния моделей, поэтому /health/ready каждого
+воркера API показывает готовность общих моделей.
+"""
+import asyncio
+import itertools
+import logging
+import os
+import pickle
+import signal
+import struct
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+from config import (
+    INFERENCE_HEALTH_INTERVAL,
+    INFERENCE_JOB_TIMEOUT,
+    INFERENCE_PROCESS_WORKERS,
+    MODEL_WARMUP_ON_STARTUP
+)
+from services.inference_workers import (
+    MODEL_LOADING,
+    InferenceJobs,
+    InferenceWorkerPool,
+    SharedArray,
+    WorkerCrashedError,
+    release_shared_inputs,
+    take_shared_array
+)
+
+logger = logging.getLogger("inference.server")
+
+_HEADER = struct.Struct("!I")
+_BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _encode(message) -> bytes:
+    body = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    return _HEADER.pack(len(body)) + body
+
+async def _read_message(reader: asyncio.StreamReader):
+    (length,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    return pickle.loads(await reader.readexactly(length))
+
+def _discard_result(value):
+    # Результат, который некому отдать, не должен оставить сегмент shared memory
+    if isinstance(value, SharedArray):
+        try:
+            take_shared_array(value)
+        except FileNotFoundError:
+            pass
+
+# --- Процесс сервера ---
+
+class InferenceServer:
+    """Пул воркеров инференса и Unix-сокет, через который его используют процессы API."""
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self.pool = InferenceWorkerPool(
+            INFERENCE_PROCESS_WORKERS,
+            job_timeout=INFERENCE_JOB_TIMEOUT,
+            health_interval=INFERENCE_HEALTH_INTERVAL,
+            state_callback=self._on_state,
+            share_results=True
+        )
+        self._states = {
+            name: {"state": "pending", "error": None, "load_seconds": None}
+            for name in self.pool.worker_counts
+        }
+        self._clients: Dict[asyncio.StreamWriter, asyncio.Lock] = {}
+        # Ссылки на задачи запросов: event loop держит их только слабо
+        self._calls = set()
+
+    def _on_state(self, model_name: str, state: str, error: str = None, load_seconds: float = None):
+        status = self._states[model_name]
+        status["state"] = state
+        status["error"] = error
+        if load_seconds is not None:
+            status["load_seconds"] = load_seconds
+        message = _encode(("state", model_name, dict(status)))
+        for writer in list(self._clients):
+            if not writer.is_closing():
+                writer.write(message)
+
+    async def serve(self, parent_pid: Optional[int] = None):
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, stop.set)
+        self.pool.start(warm_up=MODEL_WARMUP_ON_STARTUP)
+        if os.path.exists(self.socket_path):
+            # Сокет прошлого запуска
+            os.unlink(self.socket_path)
+        # Сокет сразу создается доступным только владельцу
+        umask = os.umask(0o077)
+        try:
+            server = await asyncio.start_unix_server(self._handle_client, path=self.socket_path)
+        finally:
+            os.umask(umask)
+        logger.info("Inference server listening on %s (pid %d)", self.socket_path, os.getpid())
+        try:
+            while not stop.is_set():
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=2.0)
+                except asyncio.TimeoutError:
+                    pass
+                if parent_pid is not None and os.getppid() != parent_pid:
+                    # master gunicorn убит без on_exit — не оставляем воркеры сиротами
+                    logger.warning("Inference server: parent process is gone, stopping")
+                    break
+        finally:
+            server.close()
+            self.pool.stop()
+            try:
+                os.unlink(self.socket_path)
+            except FileNotFoundError:
+                pass
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        lock = asyncio.Lock()
+        self._clients[writer] = lock
+        for model_name, status in self._states.items():
+            writer.write(_encode(("state", model_name, dict(status))))
+        try:
+            while True:
+                try:
+                    request_id, method, args = await _read_message(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                # Задачи клиента идут параллельно; воркер вернется в пул, даже если клиент отключится
+                task = asyncio.create_task(self._call(writer, lock, request_id, method, args))
+                self._calls.add(task)
+                task.add_done_callback(self._calls.discard)
+        finally:
+            self._clients.pop(writer, None)
+            writer.close()
+
+    async def _call(self, writer: asyncio.StreamWriter, lock: asyncio.Lock, request_id: int, method: str, args: tuple):
+        try:
+            if method == "submit":
+                value = await self.pool.submit(*args)
+            elif method == "start_model":
+                value = self.pool.start_model(*args)
+            elif method == "stats":
+                value = self.pool.stats()
+            else:
+                raise ValueError(f"Unknown inference server method: {method}")
+            ok = True
+        except Exception as e:
+            ok, value = False, (type(e).__name__, str(e))
+        if writer.is_closing():
+            _discard_result(value)
+            return
+        try:
+            async with lock:
+                writer.write(_encode(("result", request_id, ok, value)))
+                await writer.drain()
+        except ConnectionError:
+            _discard_result(value)
+
+def run_server(socket_path: str, parent_pid: Optional[int] = None):
+    """Точка входа процесса сервера инференса."""
+    # Ctrl+C получает вся группа процессов; остановкой управляет master через SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from logging_setup import setup_logging
+    setup_logging()
+    asyncio.run(InferenceServer(socket_path).serve(parent_pid))
+
+class InferenceServerSupervisor:
+    """Держит процесс сервера инференса запущенным; работает в master gunicorn.
+
+    Сервер запускается через subprocess, а не multiprocessing: воркеры gunicorn
+    наследуют объекты Process master-а и при выходе пытались бы их дождаться.
+    Упавший сервер перезапускается с нарастающей задержкой; задержка
+    сбрасывается, если сервер проработал дольше минуты.
+    """
+
+    def __init__(self, socket_path: str, on_exit=None):
+        self.socket_path = socket_path
+        self._on_exit = on_exit
+        self._process: Optional[subprocess.Popen] = None
+        self._started_at = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._restarts = 0
+
+    def start(self):
+        self._spawn()
+        self._thread = threading.Thread(target=self._run, name="inference_server_supervisor", daemon=True)
+        self._thread.start()
+
+    def _spawn(self):
+        self._process = subprocess.Popen(
+            [sys.executable, "-m", "services.inference_entry", self.socket_path, str(os.getpid())],
+            cwd=_BACKEND_DIR
+        )
+        self._started_at = time.monotonic()
+        logger.info("Started inference server (pid %d)", self._process.pid)
+
+    def _alive(self) -> bool:
+        # Статус может забрать и master gunicorn (waitpid(-1)) — тогда poll() видит ECHILD и
+        # тоже считает процесс завершенным
+        return self._process.poll() is None
+
+    def _run(self):
+        while not self._stop.wait(1.0):
+            if self._alive():
+                continue
+            pid = self._process.pid
+            logger.error("Inference server (pid %d) exited with code %s, restarting", pid, self._process.returncode)
+            if self._on_exit is not None:
+                self._on_exit(pid)
+            if time.monotonic() - self._started_at > 60:
+                self._restarts = 0
+            self._restarts += 1
+            if self._stop.wait(min(2 ** min(self._restarts, 5), 30)):
+                break
+            self._spawn()
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._process is not None and self._alive():
+            self._process.terminate()
+            try:
+                self._process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+
+# --- Сторона процесса API ---
+
+class RemoteInferencePool(InferenceJobs):
+    """Клиент сервера инференса с интерфейсом InferenceWorkerPool.
+
+    Обрыв соединения (перезапуск сервера) завершает задачи в полете
+    WorkerCrashedError, модели считаются загружающимися до переподключения.
+    """
+
+    def __init__(self, socket_path: str, worker_counts: Dict[str, int], connect_timeout: float):
+        self.socket_path = socket_path
+        self.worker_counts = {name: count for name, count in worker_counts.items() if count > 0}
+        self.connect_timeout = connect_timeout
+        self._request_ids = itertools.count()
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._start_requested = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connected: Optional[asyncio.Event] = None
+        self._send_lock: Optional[asyncio.Lock] = None
+        self._connection_task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def serves(self, model_name: str) -> bool:
+        return model_name in self.worker_counts
+
+    def start(self, warm_up: bool = True):
+        """Подключается к серверу; прогрев моделей решает сам сервер (MODEL_WARMUP_ON_STARTUP)."""
+        from model_registry import set_external_loader
+        self._loop = asyncio.get_running_loop()
+        self._connected = asyncio.Event()
+        self._send_lock = asyncio.Lock()
+        for model_name in self.worker_counts:
+            set_external_loader(model_name, lambda name=model_name: self._request_start(name))
+        self._connection_task = self._loop.create_task(self._connection_loop())
+
+    def _request_start(self, model_name: str):
+        if model_name not in self._start_requested:
+            self._start_requested.add(model_name)
+            self._loop.create_task(self._request("start_model", model_name))
+
+    async def _connection_loop(self):
+        from model_registry import set_model_state
+        delay = 0.5
+        while not self._stopping:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.socket_path)
+            except OSError:
+                # Сервер еще стартует или перезапускается
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 10)
+                continue
+            delay = 0.5
+            self._writer = writer
+            self._connected.set()
+            try:
+                while True:
+                    self._on_message(await _read_message(reader))
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            finally:
+                self._connected.clear()
+                self._writer = None
+                writer.close()
+                self._start_requested.clear()
+                pending, self._pending = self._pending, {}
+                for future in pending.values():
+                    if not future.done():
+                        future.set_exception(WorkerCrashedError("Connection to the inference server was lost"))
+                if not self._stopping:
+                    logger.warning("Lost connection to the inference server, reconnecting")
+                    for model_name in self.worker_counts:
+                        set_model_state(model_name, MODEL_LOADING)
+
+    def _on_message(self, message):
+        from model_registry import set_model_state
+        if message[0] == "state":
+            _, model_name, status = message
+            if model_name in self.worker_counts:
+                set_model_state(model_name, status["state"], error=status["error"], load_seconds=status["load_seconds"])
+            return
+        _, request_id, ok, value = message
+        future = self._pending.pop(request_id, None)
+        if future is None or future.done():
+            _discard_result(value)
+            return
+        if not ok:
+            error_type, error_message = value
+            error_class = WorkerCrashedError if error_type == WorkerCrashedError.__name__ else RuntimeError
+            future.set_exception(error_class(error_message))
+        elif isinstance(value, SharedArray):
+            future.set_result(take_shared_array(value))
+        else:
+            future.set_result(value)
+
+    async def _request(self, method: str, *args, inputs: List = ()):
+        try:
+            await asyncio.wait_for(self._connected.wait(), self.connect_timeout)
+        except BaseException:
+            release_shared_inputs(inputs)
+            raise
+        request_id = next(self._request_ids)
+        future = self._loop.create_future()
+        # Сегменты входа нужны серверу, пока он не ответит, даже если ожидающий запрос отменен
+        future.add_done_callback(lambda f: release_shared_inputs(inputs))
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._pending[request_id] = future
+        async with self._send_lock:
+            if self._writer is None:
+                self._pending.pop(request_id, None)
+                future.set_exception(WorkerCrashedError("Not connected to the inference server"))
+            else:
+                self._writer.write(_encode((request_id, method, args)))
+                await self._writer.drain()
+        return await asyncio.shield(future)
+
+    async def submit(self, model_name: str, kind: str, payload: dict, inputs: List = ()):
+        return await self._request("submit", model_name, kind, payload, inputs=inputs)
+
+    async def get_stats(self) -> dict:
+        return {"server": self.socket_path, **await self._request("stats")}
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping = True
+        if self._connection_task is not None:
+            self._connection_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
@@ -0,0 +1,534 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing as mp
+import queue
+import signal
+import threading
+import time
+import traceback
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from multiprocessing.connection import Connection, wait as wait_connections
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+
+from metrics import INFERENCE_QUEUE_WAIT_SECONDS
+from services.inference_entry import run_worker
+
+logger = logging.getLogger("inference")
+
+# Состояния готовности моделей — те же строки, что model_registry.MODEL_*.
+# Модуль их не импортирует: процессу сервера инференса torch не нужен
+MODEL_LOADING = "loading"
+MODEL_READY = "ready"
+MODEL_FAILED = "failed"
+
+class WorkerCrashedError(RuntimeError):
+    """Процесс-воркер упал или был перезапущен во время выполнения задачи."""
+
+@dataclass(frozen=True)
+class SharedArray:
+    """Ссылка на numpy-массив в shared memory — передается между процессами вместо самих данных."""
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+def share_array(array: np.ndarray) -> Tuple[SharedMemory, SharedArray]:
+    """Копирует массив в новый сегмент shared memory. Сегмент освобождает создатель (unlink)."""
+    array = np.ascontiguousarray(array)
+    shm = SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, SharedArray(shm.name, array.shape, array.dtype.str)
+
+def take_shared_array(ref: SharedArray) -> np.ndarray:
+    """Забирает результат воркера: копия в память процесса, сегмент удаляется."""
+    shm = SharedMemory(name=ref.name)
+    try:
+        return np.ndarray(ref.shape, dtype=ref.dtype, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+
+def _with_shared_input(ref: SharedArray, fn):
+    """Вызывает fn с массивом-представлением сегмента без копирования данных."""
+    shm = SharedMemory(name=ref.name)
+    try:
+        return fn(np.ndarray(ref.shape, dtype=ref.dtype, buffer=shm.buf))
+    finally:
+        try:
+            shm.close()
+        except BufferError:
+            # Кто-то еще держит представление — сегмент закроется при сборке мусора
+            pass
+
+def release_shared_inputs(inputs: List[SharedMemory]):
+    for shm in inputs:
+        shm.close()
+        shm.unlink()
+
+def _export_array(array) -> SharedArray:
+    shm, ref = share_array(np.asarray(array, dtype=np.float32))
+    # Сегмент живет до take_shared_array в API-процессе
+    shm.close()
+    return ref
+
+# --- Код процесса-воркера ---
+
+class _WhisperHandler:
+    def __init__(self):
+        from config import WHISPER_PRELOAD_SIZES
+        from model_registry import get_whisper_model
+        self._get_model = get_whisper_model
+        get_whisper_model()
+        for model_size in WHISPER_PRELOAD_SIZES:
+            get_whisper_model(model_size)
+
+    def __call__(self, kind: str, payload: dict):
+        if kind == "transcribe":
+            model = self._get_model(payload["model_size"])
+
+            def _run(audio):
+                segments, _ = model.transcribe(audio, **payload["options"])
+                return " ".join(segment.text.strip() for segment in segments).strip()
+
+            audio = payload["audio"]
+            return _with_shared_input(audio, _run) if isinstance(audio, SharedArray) else _run(audio)
+
+        if kind == "transcribe_batch":
+            from faster_whisper import BatchedInferencePipeline
+            from services.whisper_batcher import transcribe_batch
+            pipeline = BatchedInferencePipeline(model=self._get_model(payload["model_size"]))
+            bounds = np.cumsum([0] + payload["lengths"])
+
+            def _run(audio):
+                return transcribe_batch(
+                    pipeline,
+                    [audio[start:end] for start, end in zip(bounds[:-1], bounds[1:])],
+                    payload["max_batch_size"],
+                    payload["options"]
+                )
+
+            return _with_shared_input(payload["audio"], _run)
+
+        raise ValueError(f"Unknown whisper job: {kind}")
+
+class _TTSHandler:
+    def __init__(self):
+        from model_registry import get_tts_model
+        # Модель берется из registry на каждую задачу, чтобы ее можно было выгрузить при простое
+        self._get_model = get_tts_model
+        get_tts_model()
+
+    def __call__(self, kind: str, payload: dict):
+        if kind != "synthesize":
+            raise ValueError(f"Unknown tts job: {kind}")
+        return _export_array(self._get_model().tts(text=payload["text"], speaker=payload["speaker"]))
+
+class _XTTSHandler:
+    def __init__(self):
+        from config import XTTS_VOICE_CACHE_DIR
+        from model_registry import get_xtts_model
+        from services.voice_registry import XTTSVoiceRegistry
+        get_xtts_model()
+        self._voices = XTTSVoiceRegistry(get_xtts_model, XTTS_VOICE_CACHE_DIR)
+
+    def __call__(self, kind: str, payload: dict):
+        if kind != "synthesize":
+            raise ValueError(f"Unknown xtts job: {kind}")
+        return _export_array(
+            self._voices.synthesize(payload["text"], payload["speaker_wav"], payload["language"])
+        )
+
+_HANDLERS = {
+    "whisper": _WhisperHandler,
+    "tts": _TTSHandler,
+    "xtts": _XTTSHandler,
+}
+
+def _worker_main(model_name: str, worker_id: int, conn: Connection):
+    # Остановкой управляет API-процесс, Ctrl+C воркеру не адресован
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    start = time.perf_counter()
+    try:
+        handler = _HANDLERS[model_name]()
+    except Exception as e:
+        print(traceback.format_exc())
+        conn.send(("failed", worker_id, str(e)))
+        return
+    conn.send(("ready", worker_id, round(time.perf_counter() - start, 2)))
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            # API-процесс закрыл канал — завершаемся вместе с ним
+            break
+        if job is None:
+            break
+        job_id, kind, payload = job
+        try:
+            conn.send(("result", job_id, handler(kind, payload)))
+        except Exception as e:
+            conn.send(("error", job_id, f"{type(e).__name__}: {e}"))
+
+# --- Сторона API-процесса ---
+
+class InferenceJobs(ABC):
+    """Задачи инференса поверх submit(): общий код локального пула и клиента сервера инференса."""
+
+    @abstractmethod
+    async def submit(self, model_name: str, kind: str, payload: dict, inputs: List[SharedMemory] = ()):
+        """Выполняет задачу kind модели model_name; сегменты inputs освобождаются после ответа."""
+
+    async def transcribe(self, audio, model_size: str, options: dict) -> str:
+        """Транскрипция файла (путь) или float32-массива 16 кГц."""
+        if isinstance(audio, np.ndarray):
+            shm, ref = share_array(audio.astype(np.float32, copy=False))
+            return await self.submit(
+                "whisper", "transcribe", {"audio": ref, "model_size": model_size, "options": options}, [shm]
+            )
+        return await self.submit(
+            "whisper", "transcribe", {"audio": audio, "model_size": model_size, "options": options}
+        )
+
+    async def transcribe_batch(
+        self,
+        audios: List[np.ndarray],
+        model_size: str,
+        max_batch_size: int,
+        options: dict
+    ) -> List[str]:
+        """Батч для WhisperBatchScheduler: все аудио одним сегментом shared memory."""
+        shm, ref = share_array(np.concatenate(audios).astype(np.float32, copy=False))
+        return await self.submit(
+            "whisper",
+            "transcribe_batch",
+            {
+                "audio": ref,
+                "lengths": [len(audio) for audio in audios],
+                "model_size": model_size,
+                "max_batch_size": max_batch_size,
+                "options": options
+            },
+            [shm]
+        )
+
+    async def synthesize(self, text: str, speaker: str) -> np.ndarray:
+        return await self.submit("tts", "synthesize", {"text": text, "speaker": speaker})
+
+    async def synthesize_xtts(self, text: str, speaker_wav: str, language: str = "en") -> np.ndarray:
+        return await self.submit(
+            "xtts", "synthesize", {"text": text, "speaker_wav": speaker_wav, "language": language}
+        )
+
+@dataclass
+class _WorkerHandle:
+    model_name: str
+    worker_id: int
+    process: mp.Process
+    # Свой канал у каждого воркера: kill зависшего воркера не может испортить
+    # общую очередь или оставить захваченной ее блокировку
+    conn: Connection
+    ready: bool = False
+    alive: bool = True
+    job_id: Optional[int] = None
+    jobs_done: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+@dataclass
+class _Job:
+    future: asyncio.Future
+    worker: _WorkerHandle
+    deadline: float
+    inputs: List[SharedMemory]
+
+class InferenceWorkerPool(InferenceJobs):
+    """Пул процессов-воркеров, каждый владеет своей моделью из model_registry.
+
+    На каждую модель — worker_counts[model] процессов, каждый выполняет одну
+    задачу за раз, поэтому число процессов и есть лимит параллельности модели.
+    Аудио в воркер и обратно передается через shared memory, по каналам
+    (Pipe на воркер) идут только ссылки на сегменты. Монитор здоровья перезапускает упавшие
+    воркеры, воркеры с зависшими задачами (дольше job_timeout) и воркеры, не
+    сумевшие загрузить модель, — с нарастающей задержкой; задача упавшего
+    воркера завершается WorkerCrashedError. Состояния моделей для /health/ready
+    пишутся в model_registry этого процесса или передаются в state_callback
+    (сервер инференса рассылает их процессам API).
+
+    start(warm_up=False) не запускает воркеры сразу: модель поднимается при
+    первом обращении (wait_for_model или задача), как и без изоляции.
+    """
+
+    def __init__(
+        self,
+        worker_counts: Dict[str, int],
+        job_timeout: float,
+        health_interval: float,
+        state_callback: Optional[Callable] = None,
+        share_results: bool = False
+    ):
+        self.worker_counts = {name: count for name, count in worker_counts.items() if count > 0}
+        self.job_timeout = job_timeout
+        self.health_interval = health_interval
+        self._state_callback = state_callback
+        # True — аудио-результат остается в shared memory, SharedArray забирает получатель
+        self.share_results = share_results
+        # spawn: воркер не наследует потоки, CUDA-контекст и сокеты API-процесса
+        self._ctx = mp.get_context("spawn")
+        # Каналы новых воркеров для потока-читателя и пробуждение его ожидания
+        self._new_connections: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._wakeup_recv, self._wakeup_send = mp.Pipe(duplex=False)
+        self._workers: Dict[int, _WorkerHandle] = {}
+        self._idle: Dict[str, asyncio.Queue] = {}
+        self._jobs: Dict[int, _Job] = {}
+        self._job_ids = itertools.count()
+        self._worker_ids = itertools.count()
+        self._restarts: Dict[str, int] = {name: 0 for name in self.worker_counts}
+        self._started_models = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reader: Optional[threading.Thread] = None
+        self._monitor: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def start(self, warm_up: bool = True):
+        """Запускает пул; вызывается из event loop (lifespan). warm_up=False — воркеры по требованию."""
+        self._loop = asyncio.get_running_loop()
+        for model_name in self.worker_counts:
+            self._idle[model_name] = asyncio.Queue()
+            if self._state_callback is None:
+                from model_registry import set_external_loader
+                # wait_for_model поднимет воркеры модели, а не загрузит ее в API-процессе
+                set_external_loader(model_name, lambda name=model_name: self.start_model(name))
+        self._reader = threading.Thread(target=self._read_results, name="inference_results", daemon=True)
+        self._reader.start()
+        self._monitor = self._loop.create_task(self._watch())
+        if warm_up:
+            for model_name in self.worker_counts:
+                self.start_model(model_name)
+
+    def start_model(self, model_name: str):
+        """Запускает воркеры модели, если они еще не запущены (только из event loop)."""
+        if model_name in self._started_models or self._stopping or model_name not in self.worker_counts:
+            return
+        self._started_models.add(model_name)
+        self._set_state(model_name, MODEL_LOADING)
+        for _ in range(self.worker_counts[model_name]):
+            self._spawn(model_name)
+
+    def _spawn(self, model_name: str) -> _WorkerHandle:
+        worker_id = next(self._worker_ids)
+        conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(
+            # Не _worker_main: модуль с ним импортирует numpy раньше, чем заданы лимиты потоков
+            target=run_worker,
+            args=(model_name, worker_id, child_conn),
+            name=f"inference-{model_name}-{worker_id}",
+            daemon=True
+        )
+        process.start()
+        # Конец воркера закрываем здесь, иначе его смерть не даст EOF читателю
+        child_conn.close()
+        handle = _WorkerHandle(model_name, worker_id, process, conn)
+        self._workers[worker_id] = handle
+        self._new_connections.put(conn)
+        self._wakeup_send.send_bytes(b"")
+        logger.info("Started %s inference worker %d (pid %d)", model_name, worker_id, process.pid)
+        return handle
+
+    def _set_state(self, model_name: str, state: str, error: str = None, load_seconds: float = None):
+        if self._state_callback is not None:
+            self._state_callback(model_name, state, error=error, load_seconds=load_seconds)
+        else:
+            from model_registry import set_model_state
+            set_model_state(model_name, state, error=error, load_seconds=load_seconds)
+
+    def _read_results(self):
+        """Поток-читатель каналов воркеров; развертывает аудио из shared memory вне event loop."""
+        connections: List[Connection] = []
+        while True:
+            for conn in wait_connections([self._wakeup_recv, *connections]):
+                if conn is self._wakeup_recv:
+                    conn.recv_bytes()
+                    while True:
+                        try:
+                            new_conn = self._new_connections.get_nowait()
+                        except queue.Empty:
+                            break
+                        if new_conn is None:
+                            return
+                        connections.append(new_conn)
+                    continue
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    # Воркер завершился; перезапуск — забота монитора здоровья
+                    connections.remove(conn)
+                    conn.close()
+                    continue
+                kind, key, value = message
+                if kind == "result" and isinstance(value, SharedArray) and not self.share_results:
+                    try:
+                        value = take_shared_array(value)
+                    except Exception as e:
+                        kind, value = "error", f"{type(e).__name__}: {e}"
+                try:
+                    self._loop.call_soon_threadsafe(self._on_message, kind, key, value)
+                except RuntimeError:
+                    # Event loop уже закрыт — приложение останавливается
+                    return
+
+    def _on_message(self, kind: str, key: int, value):
+        if kind in ("ready", "failed"):
+            handle = self._workers.get(key)
+            if handle is None or not handle.alive:
+                return
+            if kind == "ready":
+                handle.ready = True
+                self._set_state(handle.model_name, MODEL_READY, load_seconds=value)
+                self._idle[handle.model_name].put_nowait(handle)
+            else:
+                # Ошибка загрузки бывает временной (сеть при скачивании весов) — перезапускаем с задержкой
+                logger.error("%s inference worker %d failed to load: %s", handle.model_name, handle.worker_id, value)
+                handle.alive = False
+                del self._workers[key]
+                if not self._has_ready_worker(handle.model_name):
+                    self._set_state(handle.model_name, MODEL_FAILED, error=value)
+                self._schedule_respawn(handle)
+            return
+
+        job = self._jobs.pop(key, None)
+        if job is None:
+            return
+        self._release_job(job)
+        if not job.future.done():
+            if kind == "result":
+                job.future.set_result(value)
+            else:
+                job.future.set_exception(RuntimeError(value))
+
+    def _release_job(self, job: _Job):
+        release_shared_inputs(job.inputs)
+        worker = job.worker
+        worker.job_id = None
+        worker.jobs_done += 1
+        if worker.alive:
+            self._idle[worker.model_name].put_nowait(worker)
+
+    def _has_ready_worker(self, model_name: str) -> bool:
+        return any(w.ready and w.alive for w in self._workers.values() if w.model_name == model_name)
+
+    async def _watch(self):
+        """Health check: живы ли процессы и не зависли ли задачи."""
+        while not self._stopping:
+            await asyncio.sleep(self.health_interval)
+            now = time.monotonic()
+            for job_id, job in list(self._jobs.items()):
+                if now > job.deadline and job.worker.alive:
+                    logger.warning(
+                        "Inference job %d exceeded %.0fs, restarting worker %d",
+                        job_id, self.job_timeout, job.worker.worker_id
+                    )
+                    job.worker.process.kill()
+            for handle in list(self._workers.values()):
+                if handle.alive and not handle.process.is_alive():
+                    self._on_worker_died(handle)
+
+    def _on_worker_died(self, handle: _WorkerHandle):
+        handle.alive = False
+        del self._workers[handle.worker_id]
+        logger.error(
+            "%s inference worker %d exited (code %s)", handle.model_name, handle.worker_id, handle.process.exitcode
+        )
+        if handle.job_id is not None:
+            job = self._jobs.pop(handle.job_id, None)
+            if job is not None:
+                self._release_job(job)
+                if not job.future.done():
+                    job.future.set_exception(WorkerCrashedError(
+                        f"{handle.model_name} worker exited with code {handle.process.exitcode}"
+                    ))
+        if not self._has_ready_worker(handle.model_name):
+            self._set_state(handle.model_name, MODEL_LOADING)
+        self._schedule_respawn(handle)
+
+    def _schedule_respawn(self, handle: _WorkerHandle):
+        # Перезапуск с нарастающей задержкой, чтобы падение при старте не крутилось без паузы
+        self._restarts[handle.model_name] += 1
+        delay = min(2 ** min(self._restarts[handle.model_name], 5), 30) if not handle.ready else 0
+        self._loop.call_later(delay, self._respawn, handle.model_name)
+
+    def _respawn(self, model_name: str):
+        if not self._stopping:
+            self._spawn(model_name)
+
+    def serves(self, model_name: str) -> bool:
+        return model_name in self.worker_counts
+
+    async def submit(self, model_name: str, kind: str, payload: dict, inputs: List[SharedMemory] = ()):
+        """Задача воркеру модели; сегменты inputs освобождаются, когда воркер ответит."""
+        if model_name not in self._idle:
+            raise RuntimeError(f"No inference workers configured for '{model_name}'")
+        self.start_model(model_name)
+        wait_start = time.perf_counter()
+        try:
+            worker = await asyncio.wait_for(self._idle[model_name].get(), self.job_timeout)
+            while not worker.alive:
+                worker = await asyncio.wait_for(self._idle[model_name].get(), self.job_timeout)
+            INFERENCE_QUEUE_WAIT_SECONDS.labels(model_name).observe(time.perf_counter() - wait_start)
+        except BaseException:
+            release_shared_inputs(inputs)
+            raise
+
+        job_id = next(self._job_ids)
+        future = self._loop.create_future()
+        # Результат отмененного ожидания никто не заберет — не логируем его ошибку как потерянную
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        worker.job_id = job_id
+        # Воркер вернется в пул только когда ответит, даже если ожидающий запрос отменен
+        self._jobs[job_id] = _Job(future, worker, time.monotonic() + self.job_timeout, list(inputs))
+        worker.conn.send((job_id, kind, payload))
+        return await asyncio.shield(future)
+
+    def stop(self, timeout: float = 5.0):
+        """Останавливает воркеры: сначала мягко, затем terminate."""
+        self._stopping = True
+        if self._monitor is not None:
+            self._monitor.cancel()
+        for handle in self._workers.values():
+            try:
+                handle.conn.send(None)
+            except Exception:
+                pass
+        deadline = time.monotonic() + timeout
+        for handle in self._workers.values():
+            handle.process.join(max(deadline - time.monotonic(), 0))
+            if handle.process.is_alive():
+                handle.process.terminate()
+        self._new_connections.put(None)
+        self._wakeup_send.send_bytes(b"")
+        if self._reader is not None:
+            self._reader.join(timeout)
+        self._workers.clear()
+
+    async def get_stats(self) -> dict:
+        return self.stats()
+
+    def stats(self) -> dict:
+        return {
+            "restarts": dict(self._restarts),
+            "in_flight": len(self._jobs),
+            "workers": [
+                {
+                    "model": w.model_name,
+                    "worker_id": w.worker_id,
+                    "pid": w.process.pid,
+                    "ready": w.ready,
+                    "busy": w.job_id is not None,
+                    "jobs_done": w.jobs_done,
+                    "uptime_seconds": round(time.monotonic() - w.started_at, 1)
+                }
+                for w in self._workers.values()
+            ]
+        }
@@ -3,8 +3,7 @@ import logging
 import threading
 import sys
 from pathlib import Path
-from typing import List, Optional, Dict, Any, Tuple
-from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Optional, Dict, Any, Tuple
 import json
 import re
 import time
@@ -15,41 +14,64 @@ from datetime import datetime, timedelta
 from collections import OrderedDict
 
 from models import Task, Milestone
+from metrics import LLM_CACHE, LLM_REQUEST_SECONDS, LLM_RETRIES, LLM_STEP_SECONDS, LLM_TOKENS
+from tracing import KIND_CLIENT, start_span
 
 # Добавляем путь к родительской директории
 sys.path.append(str(Path(__file__).parent.parent))
 
+logger = logging.getLogger("llm")
+# Полные ответы модели — только на DEBUG и с лимитом частоты (LOG_RATE_LIMITS)
+parse_logger = logging.getLogger("llm.parse")
+
 # --- ДЕКОРАТОРЫ ДЛЯ МОНИТОРИНГА ---
+def _step_name(func) -> str:
+    # _llm_generate_step1_basic_plan -> step1_basic_plan (метка шага в метриках)
+    return func.__name__.replace("_llm_generate_", "")
+
 def timing_decorator(func):
+    step = _step_name(func)
+
     @wraps(func)
     async def wrapper(*args, **kwargs):
         start_time = time.time()
         try:
-            result = await func(*args, **kwargs)
+            with start_span(f"llm.{step}", **{"llm.step": step}):
+                result = await func(*args, **kwargs)
             elapsed = time.time() - start_time
-            print(f"{func.__name__} completed in {elapsed:.2f}s")
+            LLM_STEP_SECONDS.labels(step, "success").observe(elapsed)
+            logger.info("%s completed in %.2fs", func.__name__, elapsed, extra={"step": step, "duration_s": round(elapsed, 3)})
             return result
         except Exception as e:
             elapsed = time.time() - start_time
-            print(f"{func.__name__} failed after {elapsed:.2f}s: {str(e)}")
+            LLM_STEP_SECONDS.labels(step, "error").observe(elapsed)
+            logger.error("%s failed after %.2fs: %s", func.__name__, elapsed, e, extra={"step": step, "duration_s": round(elapsed, 3)})
             raise
     return wrapper
 
 def retry_on_failure(max_retries=5, delay=1.0):
     def decorator(func):
+        step = _step_name(func)
+
         @wraps(func)
         async def wrapper(*args, **kwargs):
             last_exception = None
             for attempt in range(max_retries + 1):
                 try:
-                    return await func(*args, **kwargs)
+                    # Спан на попытку: в трассе видно, сколько времени ушло на неудачные
+                    with start_span(f"llm.{step}.attempt", **{"llm.step": step, "llm.attempt": attempt + 1}):
+                        return await func(*args, **kwargs)
                 except Exception as e:
                     last_exception = e
                     if attempt < max_retries:
-                        print(f"{func.__name__} failed (attempt {attempt + 1}/{max_retries + 1}): {str(e)}. Retrying in {delay}s...")
+                        LLM_RETRIES.labels(step).inc()
+                        logger.warning(
+                            "%s failed (attempt %d/%d): %s. Retrying in %ss...",
+                            func.__name__, attempt + 1, max_retries + 1, e, delay
+                        )
                         await asyncio.sleep(delay)
                     else:
-                        print(f"{func.__name__} failed after {max_retries + 1} attempts")
+                        logger.error("%s failed after %d attempts", func.__name__, max_retries + 1)
                         raise last_exception
         return wrapper
     return decorator
@@ -135,10 +157,8 @@ class OptimizedLLMService:
     _instance = None
     _plan_context = {}
     _initialization_lock = threading.Lock()
-    _thread_pool = None
     
     # Константы для оптимизации
-    MAX_WORKERS = 15  # Увеличиваем количество воркеров
     GENERATION_TIMEOUT = 60  # Оптимизируем таймаут
     CACHE_SIZE = 200  # Увеличиваем размер кэша
     CACHE_TTL = 3600  # TTL для кэша в секундах
@@ -159,22 +179,16 @@ class OptimizedLLMService:
         
         self.client = AsyncOpenAI(api_key=api_key)
         
-        if OptimizedLLMService._thread_pool is None:
-            OptimizedLLMService._thread_pool = ThreadPoolExecutor(
-                max_workers=self.MAX_WORKERS,
-                thread_name_prefix="llm_worker"
-            )
-        
         self._cache = OrderedDict()
         self._cache_timestamps = {}
-        print("OptimizedLLMService initialized successfully")
+        logger.info("OptimizedLLMService initialized successfully")
 
     @classmethod
     def clear_context(cls):
         """Очищает контекст плана"""
         with cls._initialization_lock:
             cls._plan_context = {}
-            print("LLMService context cleared.")
+            logger.info("LLMService context cleared.")
 
     def _get_cache_key(self, prompt: str, max_tokens: int, temperature: float) -> str:
         """Создает ключ для кэширования"""
@@ -227,7 +241,7 @@ class OptimizedLLMService:
 
     def _parse_step1_basic_plan_fast(self, text_response: str) -> Dict[str, Any]:
         """Улучшенный парсер для базового плана"""
-        print(f"Parsing step 1 response: {text_response[:200]}...")
+        parse_logger.debug("Parsing step 1 response: %.200s...", text_response)
         
         data = {
             "plan_title": "Learning Plan", 
@@ -263,7 +277,7 @@ class OptimizedLLMService:
                     if numbers:
                         data["estimated_total_duration_weeks"] = int(numbers[0])
                 except (IndexError, ValueError) as e:
-                    print(f"Failed to parse duration: {e}")
+                    parse_logger.warning("Failed to parse duration: %s", e)
                 current_section = None
             elif line_lower.startswith("weekly:"):
                 data["suggested_weekly_commitment_hours"] = line.split(":", 1)[1].strip()
@@ -288,12 +302,12 @@ class OptimizedLLMService:
                     if item:  # Проверяем что элемент не пустой
                         data["milestone_titles_to_create"].append(item)
         
-        print(f"Parsed plan data: {data}")
+        parse_logger.debug("Parsed plan data: %s", data)
         return data
 
     def _parse_step2_milestone_details_fast(self, text_response: str, milestone_title: str) -> Dict[str, Any]:
         """Улучшенный парсер для деталей этапа"""
-        print(f"Parsing step 2 response for {milestone_title}: {text_response[:200]}...")
+        parse_logger.debug("Parsing step 2 response for %s: %.200s...", milestone_title, text_response)
         
         data = {
             "milestone_title": milestone_title,
@@ -324,12 +338,12 @@ class OptimizedLLMService:
                 if task:  # Проверяем что задача не пустая
                     data["task_titles_to_create"].append(task)
         
-        print(f"Parsed milestone data: {data}")
+        parse_logger.debug("Parsed milestone data: %s", data)
         return data
 
     def _parse_step3_task_details_fast(self, text_response: str, task_title: str) -> Dict[str, Any]:
         """Улучшенный парсер для деталей задачи"""
-        print(f"Parsing step 3 response for {task_title}: {text_response[:200]}...")
+        parse_logger.debug("Parsing step 3 response for %s: %.200s...", task_title, text_response)
         
         data = {
             "task_title": task_title,
@@ -361,48 +375,105 @@ class OptimizedLLMService:
                     if numbers:
                         data["task_estimated_hours"] = int(numbers[0])
                 except (IndexError, ValueError) as e:
-                    print(f"Failed to parse hours: {e}")
+                    parse_logger.warning("Failed to parse hours: %s", e)
             elif line_lower.startswith("tip:"):
                 data["task_ai_suggestion"] = line.split(":", 1)[1].strip()
             elif line_lower == "end":
                 break
         
-        print(f"Parsed task data: {data}")
+        parse_logger.debug("Parsed task data: %s", data)
         return data
 
-    async def _generate_with_openai(self, prompt: str, max_tokens: int, temperature: float) -> str:
+    async def _generate_with_openai(self, prompt: str, max_tokens: int, temperature: float, step: str = "other") -> str:
         """Асинхронная генерация через OpenAI API с кэшированием"""
         cache_key = self._get_cache_key(prompt, max_tokens, temperature)
         
         if cache_key in self._cache:
-            print("Cache hit for prompt")
+            LLM_CACHE.labels(step, "hit").inc()
+            logger.debug("Cache hit for prompt", extra={"step": step})
             return self._cache[cache_key]
+        LLM_CACHE.labels(step, "miss").inc()
         
+        start = time.perf_counter()
         try:
-            response = await self.client.chat.completions.create(
-                model="gpt-4.1-mini",
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": "You are an expert learning plan creator. Always follow the exact format requested. Be specific, practical, and actionable in your responses."
-                    },
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=max_tokens,
-                temperature=temperature,
-                top_p=0.9,
-                frequency_penalty=0.0,
-                presence_penalty=0.0
-            )
-            
+            with start_span(
+                "openai.chat.completions", kind=KIND_CLIENT,
+                **{"llm.step": step, "gen_ai.system": "openai", "gen_ai.request.model": "gpt-4.1-mini", "gen_ai.request.max_tokens": max_tokens}
+            ) as span:
+                response = await self.client.chat.completions.create(
+                    model="gpt-4.1-mini",
+                    messages=[
+                        {
+                            "role": "system", 
+                            "content": "You are an expert learning plan creator. Always follow the exact format requested. Be specific, practical, and actionable in your responses."
+                        },
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    top_p=0.9,
+                    frequency_penalty=0.0,
+                    presence_penalty=0.0
+                )
+                if response.usage is not None:
+                    span.set_attribute("gen_ai.usage.input_tokens", response.usage.prompt_tokens)
+                    span.set_attribute("gen_ai.usage.output_tokens", response.usage.completion_tokens)
+            LLM_REQUEST_SECONDS.labels(step, "success").observe(time.perf_counter() - start)
+            self._count_tokens(step, response.usage)
             result = self._clean_llm_text_output(response.choices[0].message.content)
             self._update_cache(cache_key, result)
-            print(f"OpenAI response: {result[:200]}...")
+            parse_logger.debug("OpenAI response: %.200s...", result)
             return result
             
         except Exception as e:
-            print(f"OpenAI API error: {str(e)}")
+            LLM_REQUEST_SECONDS.labels(step, "error").observe(time.perf_counter() - start)
+            logger.error("OpenAI API error: %s", e, extra={"step": step})
+            raise
+
+    @staticmethod
+    def _count_tokens(step: str, usage):
+        if usage is not None:
+            LLM_TOKENS.labels(step, "prompt").inc(usage.prompt_tokens)
+            LLM_TOKENS.labels(step, "completion").inc(usage.completion_tokens)
+
+    async def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        max_tokens: int = 300,
+        temperature: float = 0.7,
+        model: str = "gpt-4.1-mini"
+    ):
+        """Потоковая генерация ответа в диалоге: отдает фрагменты текста по мере прихода токенов.
+
+        Без кэша и повторов — ответ зависит от истории диалога, а повтор после
+        начала потока продублировал бы уже отправленный текст.
+        """
+        start = time.perf_counter()
+        # Без ошибки и без конца потока — ответ прервал потребитель
+        outcome = "cancelled"
+        stream = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            # Последний фрагмент потока несет usage — для учета токенов
+            stream_options={"include_usage": True}
+        )
+        try:
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    self._count_tokens("voice_chat", chunk.usage)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+            outcome = "success"
+        except Exception:
+            outcome = "error"
             raise
+        finally:
+            LLM_REQUEST_SECONDS.labels("voice_chat", outcome).observe(time.perf_counter() - start)
+            # Потребитель мог прерваться (перебивание) — закрываем HTTP-поток к OpenAI
+            await stream.close()
 
     @timing_decorator
     @retry_on_failure(max_retries=2, delay=1.0)
@@ -415,7 +486,7 @@ class OptimizedLLMService:
             desired_plan_duration=desired_plan_duration
         )
         
-        response_text = await self._generate_with_openai(prompt, max_tokens, temperature)
+        response_text = await self._generate_with_openai(prompt, max_tokens, temperature, step="step1_basic_plan")
         return self._parse_step1_basic_plan_fast(response_text)
 
     @timing_decorator
@@ -432,7 +503,7 @@ class OptimizedLLMService:
             plan_duration=len(all_milestone_titles)
         )
         
-        response_text = await self._generate_with_openai(prompt, max_tokens, temperature)
+        response_text = await self._generate_with_openai(prompt, max_tokens, temperature, step="step2_milestone_detail")
         return self._parse_step2_milestone_details_fast(response_text, milestone_title)
 
     @timing_decorator  
@@ -448,7 +519,7 @@ class OptimizedLLMService:
             plan_duration=plan_duration_weeks
         )
         
-        response_text = await self._generate_with_openai(prompt, max_tokens, temperature)
+        response_text = await self._generate_with_openai(prompt, max_tokens, temperature, step="step3_task_detail")
         return self._parse_step3_task_details_fast(response_text, task_title)
 
     async def _generate_milestone_details_parallel(
@@ -557,60 +628,79 @@ class OptimizedLLMService:
         max_tokens_step1: int = 800,
         max_tokens_step2: int = 600, 
         max_tokens_step3: int = 400,
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        progress_callback: Optional[Callable[[Dict], Awaitable[None]]] = None,
+        resume_from: Optional[Dict] = None
     ) -> Dict:
-        """Генерация полного плана со всеми деталями с параллельной обработкой"""
-        print(f"Starting full plan generation for: '{user_objective}'")
+        """Генерация полного плана со всеми деталями с параллельной обработкой
+
+        progress_callback получает промежуточный план после шага 1 и после
+        каждого обработанного этапа (для опроса статуса фоновой задачи);
+        resume_from — такой промежуточный план: генерация продолжается с
+        первого необработанного этапа, уже оплаченные вызовы не повторяются.
+        """
+        logger.info("Starting full plan generation for: '%s'", user_objective)
         
         try:
             # Извлекаем количество недель из desired_plan_duration
             plan_duration_weeks = int(''.join(filter(str.isdigit, desired_plan_duration)))
             
-            # Шаг 1: Базовый план
-            print("Step 1: Generating basic plan...")
-            basic_plan = await self._llm_generate_step1_basic_plan(
-                user_objective, desired_plan_duration, max_tokens_step1, temperature
-            )
+            if resume_from and resume_from.get("milestone_titles"):
+                # Продолжение прерванной генерации: шаг 1 и готовые этапы не повторяются
+                plan, milestone_titles, first_milestone = self._restore_partial_plan(resume_from)
+                start_date, end_date = plan["start_date"], plan["end_date"]
+                logger.info("Resuming plan generation from milestone %d/%d", first_milestone + 1, len(milestone_titles))
+            else:
+                # Шаг 1: Базовый план
+                logger.info("Step 1: Generating basic plan...")
+                basic_plan = await self._llm_generate_step1_basic_plan(
+                    user_objective, desired_plan_duration, max_tokens_step1, temperature
+                )
             
-            # Ограничиваем количество этапов в зависимости от длительности плана
-            optimal_milestones = self._calculate_optimal_milestones(plan_duration_weeks)
-            milestone_titles = basic_plan.pop("milestone_titles_to_create", [])[:optimal_milestones]
+                # Ограничиваем количество этапов в зависимости от длительности плана
+                optimal_milestones = self._calculate_optimal_milestones(plan_duration_weeks)
+                milestone_titles = basic_plan.pop("milestone_titles_to_create", [])[:optimal_milestones]
             
-            if not milestone_titles:
-                print("No milestones generated in step 1")
-                return {
-                    "error": "No milestones generated", 
-                    "basic_plan": basic_plan
-                }
+                if not milestone_titles:
+                    logger.warning("No milestones generated in step 1")
+                    return {
+                        "error": "No milestones generated", 
+                        "basic_plan": basic_plan
+                    }
             
-            # Создаем структуру плана
-            start_date = datetime.now()
-            end_date = start_date + timedelta(weeks=plan_duration_weeks)
+                # Создаем структуру плана
+                start_date = datetime.now()
+                end_date = start_date + timedelta(weeks=plan_duration_weeks)
             
-            plan = {
-                "title": basic_plan["plan_title"],
-                "description": basic_plan["plan_summary"],
-                "estimated_duration_weeks": plan_duration_weeks,
-                "weekly_commitment_hours": basic_plan["suggested_weekly_commitment_hours"],
-                "difficulty_level": basic_plan["difficulty_level"],
-                "prerequisites": basic_plan["prerequisites"],
-                "start_date": start_date,
-                "end_date": end_date,
-                "progress_percentage": 0.0,
-                "milestones": []
-            }
+                plan = {
+                    "title": basic_plan["plan_title"],
+                    "description": basic_plan["plan_summary"],
+                    "estimated_duration_weeks": plan_duration_weeks,
+                    "weekly_commitment_hours": basic_plan["suggested_weekly_commitment_hours"],
+                    "difficulty_level": basic_plan["difficulty_level"],
+                    "prerequisites": basic_plan["prerequisites"],
+                    "start_date": start_date,
+                    "end_date": end_date,
+                    "progress_percentage": 0.0,
+                    "milestones": []
+                }
             
+                first_milestone = 0
+                await self._report_progress(progress_callback, plan, milestone_titles, first_milestone)
+
             # Шаг 2: Параллельная генерация деталей этапов
-            print(f"Step 2: Generating details for {len(milestone_titles)} milestones in parallel...")
+            remaining_titles = milestone_titles[first_milestone:]
+            logger.info("Step 2: Generating details for %d milestones in parallel...", len(remaining_titles))
             milestone_details_list = await self._generate_milestone_details_parallel(
                 user_objective, plan["title"], 
-                milestone_titles, max_tokens_step2, temperature
+                remaining_titles, max_tokens_step2, temperature
             )
             
             # Обработка результатов этапов
-            for i, milestone_details in enumerate(milestone_details_list):
+            for i, milestone_details in enumerate(milestone_details_list, start=first_milestone):
                 if isinstance(milestone_details, Exception):
-                    print(f"Failed to generate milestone '{milestone_titles[i]}': {milestone_details}")
+                    logger.error("Failed to generate milestone '%s': %s", milestone_titles[i], milestone_details)
+                    await self._report_progress(progress_callback, plan, milestone_titles, i + 1)
                     continue
                 
                 # Ограничиваем количество задач для этапа
@@ -628,7 +718,7 @@ class OptimizedLLMService:
                 
                 # Параллельная генерация задач для этапа
                 if task_titles:
-                    print(f"Step 3: Generating {len(task_titles)} tasks for milestone '{milestone_titles[i]}' in parallel...")
+                    logger.info("Step 3: Generating %d tasks for milestone '%s' in parallel...", len(task_titles), milestone_titles[i])
                     task_details_list = await self._generate_task_details_parallel(
                         milestone_titles[i], task_titles, plan_duration_weeks, max_tokens_step3, temperature
                     )
@@ -642,7 +732,7 @@ class OptimizedLLMService:
                     # Обработка результатов задач
                     for j, task_details in enumerate(task_details_list):
                         if isinstance(task_details, Exception):
-                            print(f"Failed to generate task '{task_titles[j]}': {task_details}")
+                            logger.error("Failed to generate task '%s': %s", task_titles[j], task_details)
                             continue
                             
                         # Рассчитываем дату выполнения задачи с учетом приоритета
@@ -665,12 +755,13 @@ class OptimizedLLMService:
                         milestone["tasks"].append(task)
                 
                 plan["milestones"].append(milestone)
+                await self._report_progress(progress_callback, plan, milestone_titles, i + 1)
             
-            print("Full plan generation completed successfully")
+            logger.info("Full plan generation completed successfully")
             return plan
             
         except Exception as e:
-            print(f"Full plan generation failed: {str(e)}")
+            logger.exception("Full plan generation failed: %s", e)
             return {
                 "error": f"Plan generation failed: {str(e)}",
                 "user_objective": user_objective,
@@ -683,6 +774,35 @@ class OptimizedLLMService:
             self._cache.clear()
             self._cache_timestamps.clear()
 
+    @staticmethod
+    async def _report_progress(progress_callback, plan: Dict, milestone_titles: List[str], milestones_processed: int):
+        if progress_callback is None:
+            return
+        try:
+            await progress_callback({
+                **plan,
+                "milestone_titles": milestone_titles,
+                "milestones_processed": milestones_processed,
+                "milestones_total": len(milestone_titles)
+            })
+        except Exception as e:
+            # Сохранение прогресса не должно прерывать генерацию
+            logger.warning("Progress callback failed: %s", e)
+
+    @staticmethod
+    def _restore_partial_plan(partial: Dict) -> Tuple[Dict, List[str], int]:
+        """Промежуточный план из JSON (даты строками) -> план, заголовки этапов, число обработанных этапов"""
+        plan = {
+            key: value for key, value in partial.items()
+            if key not in ("milestone_titles", "milestones_processed", "milestones_total")
+        }
+        plan["start_date"] = datetime.fromisoformat(plan["start_date"])
+        plan["end_date"] = datetime.fromisoformat(plan["end_date"])
+        for milestone in plan["milestones"]:
+            for task in milestone["tasks"]:
+                task["due_date"] = datetime.fromisoformat(task["due_date"])
+        return plan, partial["milestone_titles"], partial["milestones_processed"]
+
     # --- Методы для совместимости со старым API ---
     async def generate_basic_plan(
         self,
@@ -692,7 +812,7 @@ class OptimizedLLMService:
         temperature: float = 0.7
     ) -> str:
         """Генерация базового плана (шаг 1)"""
-        print(f"Starting basic plan generation for: '{user_objective}'")
+        logger.info("Starting basic plan generation for: '%s'", user_objective)
         
         self._plan_context = {
             "user_objective": user_objective,
@@ -725,7 +845,7 @@ class OptimizedLLMService:
             raise ValueError(f"Invalid milestone_id: {milestone_id}")
             
         milestone_title = milestone_titles[milestone_id]
-        print(f"Generating details for milestone: {milestone_title}")
+        logger.info("Generating details for milestone: %s", milestone_title)
         
         milestone_details = await self._llm_generate_step2_milestone_detail(
             user_objective, basic_plan["plan_title"], milestone_title,
@@ -758,7 +878,7 @@ class OptimizedLLMService:
             raise ValueError(f"Invalid task_id: {task_id}")
             
         task_title = task_titles[task_id]
-        print(f"Generating details for task: {task_title} in milestone: {milestone['milestone_title']}")
+        logger.info("Generating details for task: %s in milestone: %s", task_title, milestone['milestone_title'])
         
         task_details = await self._llm_generate_step3_task_detail(
             milestone["milestone_title"], task_title, len(task_titles), max_tokens, temperature
@@ -809,7 +929,7 @@ Tips:
 END
         """
         
-        response_text = await self._generate_with_openai(additional_info_prompt, max_tokens, temperature)
+        response_text = await self._generate_with_openai(additional_info_prompt, max_tokens, temperature, step="additional_info")
         
         if "additional_info" not in self._plan_context:
             self._plan_context["additional_info"] = {}
@@ -843,7 +963,7 @@ New timeline:
 Priority: [High/Medium/Low]
 END
         """
-        response = await self._generate_with_openai(prompt, max_tokens=400, temperature=0.7)
+        response = await self._generate_with_openai(prompt, max_tokens=400, temperature=0.7, step="task_adaptation")
         return self._parse_task_adaptation(response)
 
     def _parse_task_adaptation(self, text_response: str) -> Dict[str, Any]:
@@ -0,0 +1,72 @@
+import re
+from typing import List, Tuple
+import numpy as np
+
+FRAME_MS = 30
+
+def _frame_energies(audio: np.ndarray, frame_size: int) -> np.ndarray:
+    n_frames = len(audio) // frame_size
+    frames = audio[:n_frames * frame_size].reshape(n_frames, frame_size)
+    return np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+
+def split_at_silence(
+    audio: np.ndarray,
+    sample_rate: int,
+    chunk_seconds: float,
+    overlap_seconds: float,
+    search_seconds: float = 5.0
+) -> List[Tuple[int, int]]:
+    """Делит аудио на перекрывающиеся куски с границами в самых тихих местах.
+
+    Граница ищется в последних search_seconds каждого куска длиной chunk_seconds
+    (кадр с минимальной энергией); следующий кусок начинается на overlap_seconds
+    раньше границы, чтобы слово на стыке попало в оба куска целиком.
+    Возвращает список (start, end) в сэмплах; сами куски — срезы без копирования.
+    """
+    total = len(audio)
+    chunk = int(chunk_seconds * sample_rate)
+    if total <= chunk:
+        return [(0, total)]
+
+    frame_size = int(sample_rate * FRAME_MS / 1000)
+    energies = _frame_energies(audio, frame_size)
+    overlap = int(overlap_seconds * sample_rate)
+    search = min(int(search_seconds * sample_rate), chunk // 2)
+
+    bounds = []
+    start = 0
+    while start < total:
+        target = start + chunk
+        if target >= total:
+            bounds.append((start, total))
+            break
+        first_frame = (target - search) // frame_size
+        last_frame = max(first_frame + 1, target // frame_size)
+        cut = (first_frame + int(np.argmin(energies[first_frame:last_frame]))) * frame_size
+        bounds.append((start, cut))
+        start = max(cut - overlap, start + 1)
+    return bounds
+
+def _normalize_word(word: str) -> str:
+    return re.sub(r"[^\w']", "", word.lower())
+
+def stitch_transcripts(texts: List[str], max_overlap_words: int = 8) -> str:
+    """Склеивает транскрипты соседних кусков, убирая повтор слов на стыке.
+
+    Ищется самый длинный суффикс предыдущего текста, совпадающий (без учета
+    регистра и пунктуации) с префиксом следующего, и он удаляется из следующего.
+    """
+    words: List[str] = []
+    for text in texts:
+        next_words = text.split()
+        if not next_words:
+            continue
+        tail = [_normalize_word(w) for w in words[-max_overlap_words:]]
+        head = [_normalize_word(w) for w in next_words[:max_overlap_words]]
+        overlap = 0
+        for size in range(min(len(tail), len(head)), 0, -1):
+            if tail[-size:] == head[:size]:
+                overlap = size
+                break
+        words.extend(next_words[overlap:])
+    return " ".join(words)
@@ -0,0 +1,238 @@
+"""Фоновая генерация планов: очередь задач в Postgres и пул async-воркеров.
+
+POST /plans/?background=true только ставит задачу в таблицу plan_generation_jobs
+и сразу отвечает 202. Воркеры забирают задачи через FOR UPDATE SKIP LOCKED,
+поэтому воркеры любого числа процессов (API или отдельные, запущенные через
+python -m services.plan_jobs) не конкурируют за одну строку. Пока задача
+идет, воркер обновляет heartbeat и сохраняет промежуточный план; задачу
+воркера, упавшего или перезапущенного без heartbeat, забирает другой и
+продолжает с сохраненного прогресса — оплаченные вызовы OpenAI не повторяются.
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from datetime import timedelta
+from typing import Callable, List, Optional
+
+from config import (
+    PLAN_JOB_MAX_ATTEMPTS,
+    PLAN_JOB_POLL_SECONDS,
+    PLAN_JOB_RETRY_DELAY_SECONDS,
+    PLAN_JOB_STALE_SECONDS,
+    PLAN_JOB_WORKERS
+)
+from database import async_session
+from metrics import PLAN_JOB_SECONDS, PLAN_JOBS_RUNNING
+from models import PlanGenerationJob
+from repository.plan_job_repository import PlanJobRepository
+from services.plan_service import PlanService, datetime_handler
+from tracing import start_span
+
+logger = logging.getLogger("plan_jobs")
+
+class PlanJobWorkerPool:
+    """Пул воркеров очереди генерации планов в текущем процессе (не больше concurrency задач сразу)."""
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = cls(PLAN_JOB_WORKERS)
+        return cls._instance
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.stale_after = timedelta(seconds=PLAN_JOB_STALE_SECONDS)
+        # Heartbeat в несколько раз чаще порога зависания
+        self.heartbeat_interval = max(1.0, PLAN_JOB_STALE_SECONDS / 4)
+        self._worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._workers: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._next_stale_sweep = 0.0
+        # Отмена воркеров из stop(), а не потеря задачи: задачи возвращаются в очередь
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+
+    def start(self):
+        if self.concurrency <= 0 or self._workers:
+            return
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._workers = [
+            asyncio.create_task(self._worker_loop(f"{self._worker_prefix}:{n}"), name=f"plan_job_worker_{n}")
+            for n in range(self.concurrency)
+        ]
+        logger.info("Plan job workers started: %d", self.concurrency)
+
+    async def stop(self):
+        """Останавливает воркеров; их задачи возвращаются в очередь без штрафа"""
+        self._stopping = True
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    def notify(self):
+        """Будит воркеров этого процесса сразу после постановки задачи, не дожидаясь опроса"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _claim(self, worker_id: str) -> Optional[PlanGenerationJob]:
+        async with async_session() as session:
+            repository = PlanJobRepository(session)
+            if time.monotonic() >= self._next_stale_sweep:
+                self._next_stale_sweep = time.monotonic() + self.heartbeat_interval
+                # Зависшие задачи без оставшихся попыток не забираются — помечаем их failed
+                for job_id in await repository.fail_exhausted_stale_jobs(self.stale_after, PLAN_JOB_MAX_ATTEMPTS):
+                    logger.warning("Plan job %d: worker died on the last attempt, marked as failed", job_id,
+                                   extra={"plan_job_id": job_id})
+            return await repository.claim_next_job(worker_id, self.stale_after, PLAN_JOB_MAX_ATTEMPTS)
+
+    async def _worker_loop(self, worker_id: str):
+        while True:
+            # Сброс до запроса к очереди: задача, поставленная во время запроса, снова разбудит
+            self._wakeup.clear()
+            try:
+                job = await self._claim(worker_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Plan job worker %s: claim failed: %s", worker_id, e)
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=PLAN_JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run_job(job, worker_id)
+
+    async def _heartbeat(self, job_id: int, worker_id: str, on_lost: Callable[[], None]):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                async with async_session() as session:
+                    owned = await PlanJobRepository(session).heartbeat(job_id, worker_id)
+            except Exception as e:
+                logger.warning("Plan job %d: heartbeat failed: %s", job_id, e, extra={"plan_job_id": job_id})
+                continue
+            if not owned:
+                # Задачу уже забрал другой воркер (мы считались зависшими)
+                logger.warning("Plan job %d: lost ownership to another worker", job_id, extra={"plan_job_id": job_id})
+                on_lost()
+                return
+
+    async def _run_job(self, job: PlanGenerationJob, worker_id: str):
+        start = time.perf_counter()
+        # Задачу забрал другой воркер: генерация отменяется до записи плана, иначе план задвоится
+        lost = asyncio.Event()
+        generation: Optional[asyncio.Task] = None
+
+        def abandon():
+            lost.set()
+            if generation is not None:
+                generation.cancel()
+
+        async def save_progress(partial_plan: dict):
+            async with async_session() as session:
+                owned = await PlanJobRepository(session).save_partial_result(
+                    job.id, worker_id, json.dumps(partial_plan, default=datetime_handler, ensure_ascii=False)
+                )
+            if not owned:
+                logger.warning("Plan job %d: lost ownership while saving progress", job.id, extra={"plan_job_id": job.id})
+                abandon()
+                # Отмена срабатывает прямо здесь, генерация дальше не идет
+                await asyncio.sleep(0)
+
+        heartbeat = asyncio.create_task(self._heartbeat(job.id, worker_id, abandon))
+        outcome = "error"
+        PLAN_JOBS_RUNNING.inc()
+        try:
+            with start_span("plan_job", **{"plan_job.id": job.id, "plan_job.attempt": job.attempts}):
+                generation = asyncio.create_task(self._generate_plan(job, save_progress))
+                plan = await generation
+            async with async_session() as session:
+                if not await PlanJobRepository(session).complete_job(job.id, worker_id, plan.id):
+                    logger.error(
+                        "Plan job %d: finished after losing ownership, plan %d may be a duplicate", job.id, plan.id,
+                        extra={"plan_job_id": job.id}
+                    )
+            outcome = "success"
+        except asyncio.CancelledError:
+            if lost.is_set() and not self._stopping:
+                # Задачу ведет другой воркер: не возвращаем ее в очередь и не считаем ошибкой
+                outcome = "lost"
+                return
+            # Остановка процесса: задача сразу возвращается в очередь другим воркерам
+            outcome = "cancelled"
+            await asyncio.shield(self._requeue(job, worker_id, refund_attempt=True))
+            raise
+        except Exception as e:
+            logger.exception("Plan job %d attempt %d failed: %s", job.id, job.attempts, e,
+                             extra={"plan_job_id": job.id})
+            async with async_session() as session:
+                repository = PlanJobRepository(session)
+                if job.attempts < PLAN_JOB_MAX_ATTEMPTS:
+                    outcome = "retry"
+                    # Отступ растет с каждой попыткой
+                    delay = timedelta(seconds=PLAN_JOB_RETRY_DELAY_SECONDS * job.attempts)
+                    await repository.requeue_job(job.id, worker_id, delay, error=str(e))
+                else:
+                    await repository.fail_job(job.id, worker_id, str(e))
+        finally:
+            heartbeat.cancel()
+            PLAN_JOBS_RUNNING.dec()
+            PLAN_JOB_SECONDS.labels(outcome).observe(time.perf_counter() - start)
+
+    async def _generate_plan(self, job: PlanGenerationJob, save_progress):
+        async with async_session() as session:
+            return await PlanService(session).generate_and_create_plan(
+                user_id=job.user_id,
+                objective=job.objective,
+                duration=job.duration,
+                progress_callback=save_progress,
+                # Повтор или задача упавшего воркера: продолжаем с сохраненного прогресса
+                resume_from=json.loads(job.partial_result) if job.partial_result else None
+            )
+
+    async def _requeue(self, job: PlanGenerationJob, worker_id: str, refund_attempt: bool):
+        try:
+            async with async_session() as session:
+                await PlanJobRepository(session).requeue_job(
+                    job.id, worker_id, timedelta(0), refund_attempt=refund_attempt
+                )
+        except Exception as e:
+            # Не вышло — задачу заберут по устаревшему heartbeat
+            logger.error("Plan job %d: requeue on shutdown failed: %s", job.id, e, extra={"plan_job_id": job.id})
+
+async def _run_standalone():
+    pool = PlanJobWorkerPool.get_instance()
+    if pool.concurrency <= 0:
+        raise SystemExit("PLAN_JOB_WORKERS must be > 0 for a standalone plan worker")
+    stop = asyncio.Event()
+    # SIGTERM (перезапуск, деплой): текущие задачи возвращаются в очередь, а не ждут таймаута heartbeat
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+    pool.start()
+    try:
+        await stop.wait()
+    finally:
+        await pool.stop()
+
+if __name__ == "__main__":
+    # Отдельный процесс только для генерации: масштабируется независимо от API
+    # (API-процессы тогда можно запускать с PLAN_JOB_WORKERS=0)
+    from logging_setup import setup_logging
+    setup_logging()
+    asyncio.run(_run_standalone())
@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Awaitable, Callable, Dict, List, Optional
 from datetime import datetime, timedelta
 import json
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -6,8 +6,10 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from repository.plan_repository import PlanRepository
 from repository.milestone_repository import MilestoneRepository
 from repository.task_repository import TaskRepository
+from repository.plan_job_repository import PlanJobRepository
 from services.llm_service import LLMService
-from models import Plan, Task
+from models import Plan, PlanGenerationJob, Task
+from tracing import start_span
 
 def datetime_handler(obj):
     """Обработчик для сериализации datetime объектов в JSON"""
@@ -20,21 +22,33 @@ class PlanService:
         self.plan_repository = PlanRepository(session)
         self.milestone_repository = MilestoneRepository(session)
         self.task_repository = TaskRepository(session)
+        self.plan_job_repository = PlanJobRepository(session)
         self.llm_service = LLMService.get_instance()
 
     async def generate_and_create_plan(
         self, 
         user_id: int, 
         objective: str, 
-        duration: str
+        duration: str,
+        progress_callback: Optional[Callable[[Dict], Awaitable[None]]] = None,
+        resume_from: Optional[Dict] = None
     ) -> Plan:
         """Генерирует план через LLM и создает его в БД"""
         # Получаем план от LLM
         plan_data = await self.llm_service.generate_full_plan_step_by_step(
             user_objective=objective,
-            desired_plan_duration=duration
+            desired_plan_duration=duration,
+            progress_callback=progress_callback,
+            resume_from=resume_from
         )
+        if "error" in plan_data:
+            raise RuntimeError(plan_data["error"])
 
+        with start_span("plan.persist", **{"plan.milestones": len(plan_data.get("milestones", []))}):
+            return await self._persist_generated_plan(user_id, plan_data)
+
+    async def _persist_generated_plan(self, user_id: int, plan_data: dict) -> Plan:
+        """Сохраняет сгенерированный план с этапами и заданиями"""
         # Создаем план
         plan = await self.plan_repository.create_plan({
             "user_id": user_id,
@@ -73,6 +87,17 @@ class PlanService:
 
         return await self.plan_repository.get_plan_by_id(plan.id)
 
+    async def enqueue_plan_generation(self, user_id: int, objective: str, duration: str) -> PlanGenerationJob:
+        """Ставит генерацию плана в очередь фоновых задач (см. services/plan_jobs.py)"""
+        return await self.plan_job_repository.create_job(user_id, objective, duration)
+
+    async def get_user_plan_job(self, user_id: int, job_id: int) -> Optional[PlanGenerationJob]:
+        """Получает задачу генерации плана пользователя"""
+        job = await self.plan_job_repository.get_job(job_id)
+        if job and job.user_id == user_id:
+            return job
+        return None
+
     async def get_user_plan(self, user_id: int, plan_id: int) -> Optional[Plan]:
         """Получает план пользователя"""
         plan = await self.plan_repository.get_plan_by_id(plan_id)
@@ -0,0 +1,77 @@
+import logging
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from config import (
+    STT_DEFAULT_PROFILE,
+    STT_LANGUAGE,
+    STT_SHORT_AUDIO_PROFILE,
+    STT_SHORT_AUDIO_SECONDS,
+    WHISPER_DEFAULT_SIZE
+)
+
+logger = logging.getLogger("stt.routing")
+
+@dataclass(frozen=True)
+class WhisperProfile:
+    """Профиль распознавания: размер модели и параметры декодирования."""
+    name: str
+    model_size: str
+    beam_size: int
+    vad_filter: bool
+    # Ожидаемая доля реального времени на CPU (секунд обработки на секунду аудио)
+    # и постоянные накладные расходы — нужны для выбора профиля под SLO
+    realtime_factor: float
+    overhead_ms: float
+    language: Optional[str] = STT_LANGUAGE
+
+    def decode_options(self) -> dict:
+        return {
+            "beam_size": self.beam_size,
+            "vad_filter": self.vad_filter,
+            "language": self.language
+        }
+
+    def estimate_latency_ms(self, duration_s: float) -> float:
+        return self.overhead_ms + duration_s * self.realtime_factor * 1000
+
+# От самого быстрого к самому точному
+WHISPER_PROFILES = {
+    "fastest": WhisperProfile("fastest", "tiny", beam_size=1, vad_filter=False, realtime_factor=0.03, overhead_ms=40),
+    "fast": WhisperProfile("fast", "base", beam_size=1, vad_filter=True, realtime_factor=0.06, overhead_ms=60),
+    "balanced": WhisperProfile("balanced", "small", beam_size=2, vad_filter=True, realtime_factor=0.2, overhead_ms=120),
+    "accurate": WhisperProfile("accurate", WHISPER_DEFAULT_SIZE, beam_size=5, vad_filter=True, realtime_factor=0.9, overhead_ms=400),
+}
+
+def select_whisper_profile(
+    duration_s: float,
+    quality: Optional[str] = None,
+    latency_slo_ms: Optional[float] = None
+) -> Tuple[WhisperProfile, str]:
+    """Выбирает профиль для запроса и возвращает его вместе с причиной выбора.
+
+    Приоритет: явный quality, SLO по задержке, длительность.
+    Каждое решение пишется в лог stt.routing для последующей настройки.
+    """
+    if quality is not None:
+        if quality not in WHISPER_PROFILES:
+            raise ValueError(f"Неизвестный профиль качества: {quality}. Доступны: {', '.join(WHISPER_PROFILES)}")
+        profile, reason = WHISPER_PROFILES[quality], "explicit_quality"
+    elif latency_slo_ms is not None:
+        # Самый точный профиль, который укладывается в SLO; иначе самый быстрый
+        fitting = [p for p in WHISPER_PROFILES.values() if p.estimate_latency_ms(duration_s) <= latency_slo_ms]
+        if fitting:
+            profile, reason = fitting[-1], "latency_slo"
+        else:
+            profile, reason = WHISPER_PROFILES["fastest"], "latency_slo_unreachable"
+    elif duration_s <= STT_SHORT_AUDIO_SECONDS:
+        profile, reason = WHISPER_PROFILES[STT_SHORT_AUDIO_PROFILE], "short_audio"
+    else:
+        profile, reason = WHISPER_PROFILES[STT_DEFAULT_PROFILE], "default"
+
+    logger.info(
+        "stt_route profile=%s model=%s beam=%d reason=%s duration_s=%.2f quality=%s slo_ms=%s est_ms=%.0f",
+        profile.name, profile.model_size, profile.beam_size, reason, duration_s,
+        quality, latency_slo_ms, profile.estimate_latency_ms(duration_s)
+    )
+    return profile, reason
@@ -0,0 +1,55 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+def _periodic_hann(size: int) -> np.ndarray:
+    # Периодическое окно Ханна при перекрытии 50% в сумме дает ровно 1
+    return (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(size) / size)).astype(np.float32)
+
+def time_stretch(
+    audio: np.ndarray,
+    sample_rate: int,
+    speed: float,
+    frame_ms: float = 40.0,
+    tolerance_ms: float = 10.0
+) -> np.ndarray:
+    """Меняет темп речи без изменения высоты тона (WSOLA).
+
+    Выход собирается из кадров по frame_ms с перекрытием 50%. Кадр k берется
+    из входа около позиции k * hop * speed со сдвигом в пределах ±tolerance_ms,
+    при котором он больше всего похож на естественное продолжение предыдущего
+    кадра (нормированная корреляция), поэтому периоды основного тона на стыках
+    совпадают. Корреляция считается сразу для всех сдвигов одним матричным
+    умножением; цикл идет только по кадрам.
+    """
+    audio = np.asarray(audio, dtype=np.float32)
+    if speed == 1.0 or len(audio) == 0:
+        return audio
+
+    frame = int(sample_rate * frame_ms / 1000) // 2 * 2
+    hop = frame // 2
+    tolerance = int(sample_rate * tolerance_ms / 1000)
+    window = _periodic_hann(frame)
+
+    out_length = int(len(audio) / speed)
+    n_frames = out_length // hop + 1
+    # Вход с запасом: слева под поиск сдвига, справа под последний кадр
+    padded = np.pad(audio, (tolerance, frame + 2 * tolerance + int((hop + 1) * speed) + hop))
+    # Скользящая энергия кандидатов для нормировки корреляции
+    squares = np.concatenate(([0.0], np.cumsum(np.square(padded, dtype=np.float64))))
+
+    output = np.zeros(n_frames * hop + frame, dtype=np.float32)
+    position = 0
+    for k in range(n_frames):
+        nominal = int(k * hop * speed)
+        if k > 0:
+            # Что шло бы дальше во входе, если бы предыдущий кадр продолжился
+            natural = padded[position + tolerance + hop:position + tolerance + hop + frame]
+            region = padded[nominal:nominal + frame + 2 * tolerance]
+            candidates = sliding_window_view(region, frame)
+            energy = squares[nominal + frame:nominal + frame + len(candidates)] - squares[nominal:nominal + len(candidates)]
+            similarity = (candidates @ natural) / np.sqrt(energy + 1e-8)
+            position = nominal - tolerance + int(np.argmax(similarity))
+        start = position + tolerance
+        output[k * hop:k * hop + frame] += padded[start:start + frame] * window
+
+    return output[:out_length]
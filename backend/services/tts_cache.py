@@ -0,0 +1,141 @@
+import hashlib
+import os
+import re
+import shutil
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+class TTSAudioCache:
+    """Контентно-адресуемый дисковый кэш синтезированного аудио.
+
+    Ключ — sha256 от нормализованного текста, модели, голоса, языка и
+    параметров кодирования. Файлы лежат в cache_dir с расширением исходного
+    файла, индекс (ключ -> (размер, расширение)) хранится в памяти в порядке
+    последнего использования; при превышении max_bytes удаляются самые
+    давно использованные записи.
+
+    get/put отдают файл уже открытым (открывается под блокировкой): вытеснение
+    удаляет только имя файла, а отдаваемый клиенту ответ дочитывается целиком.
+    Индекс свой в каждом процессе: воркеры gunicorn соблюдают max_bytes
+    независимо, поэтому каталог может занять до WEB_CONCURRENCY * max_bytes;
+    файлы, записанные другим воркером, этот процесс видит после перезапуска.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._index = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.enabled:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._load_index()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        text = unicodedata.normalize("NFKC", text)
+        return re.sub(r"\s+", " ", text).strip()
+
+    def make_key(self, text: str, model: str, voice: str, language: str, encoding: str = "") -> str:
+        payload = "\x1f".join([self.normalize_text(text), model, voice, language, encoding])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str, suffix: str) -> Path:
+        return self.cache_dir / f"{key}{suffix}"
+
+    def _load_index(self):
+        """Восстанавливает индекс по файлам на диске (старые по atime — первыми)."""
+        entries = []
+        for path in self.cache_dir.glob("*.*"):
+            stat = path.stat()
+            entries.append((stat.st_atime, path.stem, path.suffix, stat.st_size))
+        for _, key, suffix, size in sorted(entries):
+            self._index[key] = (size, suffix)
+            self._total_bytes += size
+        with self._lock:
+            self._evict_locked()
+
+    def contains(self, key: str) -> bool:
+        with self._lock:
+            return key in self._index
+
+    def get(self, key: str) -> Optional[BinaryIO]:
+        """Возвращает открытый на чтение закэшированный файл или None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+            size, suffix = self._index[key]
+            try:
+                handle = open(self._path(key, suffix), "rb")
+            except FileNotFoundError:
+                del self._index[key]
+                self._total_bytes -= size
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+            self.hits += 1
+            return handle
+
+    def put(self, key: str, source_path: str) -> BinaryIO:
+        """Переносит готовый файл в кэш и возвращает его открытым на чтение.
+
+        Если кэш выключен или файл больше всего кэша, в кэш он не попадает:
+        возвращается открытый source_path, а сам файл удаляется.
+        """
+        # Открываем до переноса: rename и копирование не меняют прочитанное
+        handle = open(source_path, "rb")
+        size = os.path.getsize(source_path)
+        if not self.enabled or size > self.max_bytes:
+            os.unlink(source_path)
+            return handle
+        suffix = Path(source_path).suffix
+        path = self._path(key, suffix)
+        shutil.move(source_path, path)
+        with self._lock:
+            if key in self._index:
+                self._total_bytes -= self._index.pop(key)[0]
+            self._index[key] = (size, suffix)
+            self._total_bytes += size
+            self._evict_locked(keep=key)
+        return handle
+
+    def _evict_locked(self, keep: Optional[str] = None):
+        while self._total_bytes > self.max_bytes and self._index:
+            key, (size, suffix) = next(iter(self._index.items()))
+            if key == keep:
+                break
+            del self._index[key]
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                self._path(key, suffix).unlink()
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._index),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+            }
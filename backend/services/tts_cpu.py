@@ -0,0 +1,145 @@
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+import numpy as np
+import torch
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Режимы CPU-инференса TTS: fp32 — как есть, int8 — динамическая квантизация
+# Linear/LSTM/GRU, onnx — граф VITS в ONNX Runtime (только VITS)
+TTS_CPU_MODES = ("fp32", "int8", "onnx")
+
+PARITY_TEXT = "Please check that the optimized voice sounds the same as the original one."
+# Минимальное косинусное сходство лог-спектрограмм, при котором режим принимается
+PARITY_MIN_SIMILARITY = 0.9
+
+def _log_spectrogram(audio: np.ndarray, frame: int = 1024, hop: int = 256) -> np.ndarray:
+    audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+    if len(audio) < frame:
+        audio = np.pad(audio, (0, frame - len(audio)))
+    frames = sliding_window_view(audio, frame)[::hop] * np.hanning(frame).astype(np.float32)
+    return np.log1p(np.abs(np.fft.rfft(frames, axis=1)))
+
+def audio_parity(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    """Сравнивает аудио оптимизированной модели с эталонным fp32.
+
+    length_ratio — отношение длительностей (длительности фонем предсказывает
+    сама модель), spectral_similarity — косинусное сходство лог-спектрограмм
+    на общей длине, snr_db — отношение сигнал/разность во временной области.
+    """
+    reference = np.asarray(reference, dtype=np.float32).reshape(-1)
+    candidate = np.asarray(candidate, dtype=np.float32).reshape(-1)
+    length = min(len(reference), len(candidate))
+    ref_spec = _log_spectrogram(reference[:length])
+    cand_spec = _log_spectrogram(candidate[:length])
+    similarity = float(
+        np.sum(ref_spec * cand_spec) / (np.linalg.norm(ref_spec) * np.linalg.norm(cand_spec) + 1e-12)
+    )
+    noise = np.sum(np.square(reference[:length] - candidate[:length])) + 1e-12
+    return {
+        "length_ratio": round(len(candidate) / max(len(reference), 1), 4),
+        "spectral_similarity": round(similarity, 4),
+        "snr_db": round(float(10 * np.log10(np.sum(np.square(reference[:length])) / noise + 1e-12)), 2),
+        "passed": similarity >= PARITY_MIN_SIMILARITY and abs(len(candidate) / max(len(reference), 1) - 1) < 0.1
+    }
+
+@contextmanager
+def deterministic_vits(tts):
+    """Отключает шум VITS (сэмплирование латентов и длительностей), чтобы режимы можно было сравнить."""
+    vits = tts.synthesizer.tts_model
+    saved = (vits.inference_noise_scale, vits.inference_noise_scale_dp)
+    vits.inference_noise_scale, vits.inference_noise_scale_dp = 0.0, 0.0
+    try:
+        yield
+    finally:
+        vits.inference_noise_scale, vits.inference_noise_scale_dp = saved
+
+def quantize_int8(tts):
+    """Динамическая int8-квантизация весов модели (активации считаются на лету)."""
+    synthesizer = tts.synthesizer
+    synthesizer.tts_model = torch.ao.quantization.quantize_dynamic(
+        synthesizer.tts_model,
+        {torch.nn.Linear, torch.nn.LSTM, torch.nn.GRU},
+        dtype=torch.qint8
+    )
+    return tts
+
+class OnnxVitsTTS:
+    """VITS через ONNX Runtime с тем же интерфейсом tts(text, speaker), что у TTS.api.TTS.
+
+    Граф экспортируется один раз в onnx_path и переиспользуется при следующих
+    запусках. Токенизация (очистка текста, фонемизация) остается из Coqui.
+    """
+
+    def __init__(self, tts, onnx_path: str, threads: Optional[int] = None):
+        import onnxruntime as ort
+
+        self._tts = tts
+        self._vits = tts.synthesizer.tts_model
+        path = Path(onnx_path)
+        if not path.exists():
+            print(f"Exporting VITS to ONNX: {path}")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._vits.export_onnx(output_path=str(path), verbose=False)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self._vits.onnx_sess = ort.InferenceSession(
+            str(path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+
+    def tts(self, text: str, speaker: Optional[str] = None, **kwargs) -> np.ndarray:
+        ids = np.asarray([self._vits.tokenizer.text_to_ids(text)], dtype=np.int64)
+        speaker_id = None
+        if speaker is not None and self._vits.speaker_manager is not None:
+            speaker_id = np.asarray([self._vits.speaker_manager.name_to_id[speaker]], dtype=np.int64)
+        audio = self._vits.inference_onnx(ids, speaker_id=speaker_id)
+        return np.asarray(audio, dtype=np.float32).reshape(-1)
+
+    def __getattr__(self, name):
+        # Остальное (speakers, synthesizer, ...) — от исходной модели
+        return getattr(self._tts, name)
+
+def optimize_vits_for_cpu(
+    tts,
+    mode: str,
+    onnx_path: str,
+    parity_check: bool = True,
+    threads: Optional[int] = None
+):
+    """Возвращает VITS в выбранном CPU-режиме.
+
+    При parity_check эталонная фраза синтезируется до и после оптимизации без
+    шума; если аудио расходится, остается fp32 и пишется предупреждение.
+    """
+    if mode not in TTS_CPU_MODES:
+        raise ValueError(f"Unknown TTS CPU mode: {mode}. Available: {', '.join(TTS_CPU_MODES)}")
+    if mode == "fp32":
+        return tts
+
+    speaker = tts.speakers[0] if getattr(tts, "speakers", None) else None
+    reference = None
+    if parity_check:
+        with deterministic_vits(tts):
+            reference = tts.tts(text=PARITY_TEXT, speaker=speaker)
+
+    fp32_model = tts.synthesizer.tts_model
+    try:
+        optimized = quantize_int8(tts) if mode == "int8" else OnnxVitsTTS(tts, onnx_path, threads)
+    except Exception as e:
+        print(f"CPU mode '{mode}' is unavailable, using fp32: {str(e)}")
+        tts.synthesizer.tts_model = fp32_model
+        return tts
+
+    if parity_check:
+        with deterministic_vits(tts):
+            candidate = optimized.tts(text=PARITY_TEXT, speaker=speaker)
+        parity = audio_parity(reference, candidate)
+        print(f"TTS CPU mode '{mode}' parity: {parity}")
+        if not parity["passed"]:
+            print(f"Warning: TTS CPU mode '{mode}' failed the parity check, using fp32")
+            tts.synthesizer.tts_model = fp32_model
+            return tts
+    return optimized
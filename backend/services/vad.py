@@ -0,0 +1,99 @@
+from typing import List, Optional
+import numpy as np
+
+class VoiceActivityDetector:
+    """Энергетический VAD для потокового аудио (float32, моно).
+
+    Аудио режется на кадры по frame_ms. Кадр считается речью, если его RMS
+    выше адаптивного порога: max(min_rms, уровень шума * speech_ratio).
+    Уровень шума оценивается экспоненциальным средним по кадрам тишины.
+    Высказывание открывается после speech_start_frames речевых кадров подряд
+    и закрывается после silence_end_ms тишины или по достижении max_utterance_s.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 16000,
+        frame_ms: int = 30,
+        speech_ratio: float = 3.0,
+        min_rms: float = 0.01,
+        speech_start_frames: int = 3,
+        silence_end_ms: int = 600,
+        pre_roll_ms: int = 300,
+        max_utterance_s: float = 15.0
+    ):
+        self.sample_rate = sample_rate
+        self.frame_size = int(sample_rate * frame_ms / 1000)
+        self.speech_ratio = speech_ratio
+        self.min_rms = min_rms
+        self.speech_start_frames = speech_start_frames
+        self.silence_end_frames = max(1, silence_end_ms // frame_ms)
+        self.pre_roll_frames = max(0, pre_roll_ms // frame_ms)
+        self.max_utterance_frames = int(max_utterance_s * 1000 / frame_ms)
+
+        self.noise_rms = min_rms
+        self.in_speech = False
+        self._remainder = np.zeros(0, dtype=np.float32)
+        self._frames: List[np.ndarray] = []
+        self._speech_run = 0
+        self._silence_run = 0
+
+    def _frame_rms(self, frames: np.ndarray) -> np.ndarray:
+        return np.sqrt(np.mean(np.square(frames), axis=1))
+
+    def feed(self, samples: np.ndarray) -> List[np.ndarray]:
+        """Добавляет сэмплы и возвращает закрытые высказывания (если есть)."""
+        samples = np.concatenate([self._remainder, samples.astype(np.float32, copy=False)])
+        n_frames = len(samples) // self.frame_size
+        self._remainder = samples[n_frames * self.frame_size:]
+        if n_frames == 0:
+            return []
+
+        frames = samples[:n_frames * self.frame_size].reshape(n_frames, self.frame_size)
+        energies = self._frame_rms(frames)
+        closed = []
+
+        for frame, rms in zip(frames, energies):
+            is_speech = rms > max(self.min_rms, self.noise_rms * self.speech_ratio)
+            if not is_speech:
+                self.noise_rms = 0.95 * self.noise_rms + 0.05 * rms
+
+            if not self.in_speech:
+                # Держим немного аудио до начала речи, чтобы не срезать первую фонему
+                self._frames.append(frame)
+                self._frames = self._frames[-(self.speech_start_frames + self.pre_roll_frames):]
+                self._speech_run = self._speech_run + 1 if is_speech else 0
+                if self._speech_run >= self.speech_start_frames:
+                    self.in_speech = True
+                    self._silence_run = 0
+                continue
+
+            self._frames.append(frame)
+            self._silence_run = 0 if is_speech else self._silence_run + 1
+            if self._silence_run >= self.silence_end_frames or len(self._frames) >= self.max_utterance_frames:
+                closed.append(self._close())
+
+        return closed
+
+    def current_utterance(self) -> Optional[np.ndarray]:
+        """Аудио открытого высказывания (для промежуточных транскриптов)."""
+        if not self.in_speech or not self._frames:
+            return None
+        return np.concatenate(self._frames)
+
+    def flush(self) -> Optional[np.ndarray]:
+        """Закрывает открытое высказывание в конце потока."""
+        if not self.in_speech:
+            self._frames = []
+            return None
+        return self._close()
+
+    def _close(self) -> np.ndarray:
+        # Хвост тишины после речи Whisper не нужен
+        frames = self._frames[:len(self._frames) - self._silence_run] or self._frames
+        utterance = np.concatenate(frames)
+        self._frames = []
+        self.in_speech = False
+        self._speech_run = 0
+        self._silence_run = 0
+        return utterance
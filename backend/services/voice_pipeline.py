@@ -0,0 +1,279 @@
+import asyncio
+import logging
+import re
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+import numpy as np
+
+from config import (
+    SAMPLE_RATE,
+    STT_STREAM_SAMPLE_RATE,
+    STREAM_TTS_LOOKAHEAD,
+    TTS_MAX_SENTENCE_CHARS,
+    VOICE_LLM_MODEL,
+    VOICE_REPLY_MAX_TOKENS,
+    VOICE_HISTORY_TURNS
+)
+from services.audio_service import AudioService
+from services.llm_service import OptimizedLLMService
+from services.stt_routing import select_whisper_profile
+
+logger = logging.getLogger("voice.pipeline")
+
+VOICE_ASSISTANT_PROMPT = (
+    "You are a friendly voice assistant in a learning planner app. Your replies are spoken aloud, "
+    "so answer in short, natural sentences of plain text: no markdown, lists, emojis or links. "
+    "Start with the direct answer and keep the whole reply under five sentences."
+)
+
+# Конец предложения: знак препинания (с закрывающими кавычками/скобками) и пробел после него
+_SENTENCE_END = re.compile(r'[.!?…]+["\')\]]*\s+')
+# После этих слов точка не заканчивает предложение
+_ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "prof", "st", "vs", "etc", "e.g", "i.e", "approx", "no"}
+_MARKDOWN_LINK = re.compile(r'\[([^\]]*)\]\([^)]*\)')
+_MARKDOWN_MARKS = re.compile(r'[*_#`>~|]+')
+
+# Тайминги последних реплик для /audio/assistant/stats
+_recent_timings = deque(maxlen=200)
+
+def _ms(since: float) -> float:
+    return round((time.perf_counter() - since) * 1000, 1)
+
+def _speakable(text: str) -> str:
+    """Убирает разметку, которую LLM иногда добавляет вопреки промпту."""
+    text = _MARKDOWN_LINK.sub(r'\1', text)
+    text = re.sub(r'^\s*(?:[-+]|\d+[.)])\s+', '', text, flags=re.MULTILINE)
+    return _MARKDOWN_MARKS.sub('', text).strip()
+
+class SentenceChunker:
+    """Собирает поток токенов LLM в предложения для TTS.
+
+    Предложение отдается, как только после знака конца предложения пришел
+    пробел, — первое предложение уходит в синтез, пока LLM пишет следующие.
+    Слишком длинный текст без точки режется по запятой или пробелу.
+    """
+
+    def __init__(self, max_chars: int = TTS_MAX_SENTENCE_CHARS):
+        self.max_chars = max_chars
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        """Добавляет фрагмент текста и возвращает завершенные предложения."""
+        self._buffer += text
+        sentences = []
+        while True:
+            cut = self._find_cut()
+            if cut is None:
+                break
+            sentence, self._buffer = self._buffer[:cut].strip(), self._buffer[cut:]
+            if sentence:
+                sentences.append(sentence)
+        return sentences
+
+    def flush(self) -> List[str]:
+        """Остаток после конца ответа LLM."""
+        rest, self._buffer = self._buffer.strip(), ""
+        return [rest] if rest else []
+
+    def _find_cut(self) -> Optional[int]:
+        for match in _SENTENCE_END.finditer(self._buffer):
+            words = self._buffer[:match.start()].split()
+            last_word = words[-1].lower() if words else ""
+            # Сокращения, инициалы и номера пунктов ("1.") предложение не заканчивают
+            if last_word in _ABBREVIATIONS or len(last_word) == 1 or last_word.isdigit():
+                continue
+            return match.end()
+        if len(self._buffer) > self.max_chars:
+            head = self._buffer[:self.max_chars]
+            for separator in (", ", "; ", ": ", " "):
+                position = head.rfind(separator)
+                if position > 0:
+                    return position + len(separator)
+            return self.max_chars
+        return None
+
+class VoiceAssistantSession:
+    """Голосовой диалог поверх одного WebSocket: высказывание -> Whisper -> LLM -> TTS.
+
+    send отправляет клиенту JSON-сообщение (dict) или PCM-аудио (bytes). Каждая
+    реплика обрабатывается отдельной задачей; новое высказывание пользователя
+    прерывает текущий ответ (barge-in), поэтому прием аудио и отправка ответа
+    идут одновременно.
+    """
+
+    def __init__(
+        self,
+        audio_service: AudioService,
+        llm_service: OptimizedLLMService,
+        send: Callable[[Union[dict, bytes]], Awaitable[None]],
+        speaker: str,
+        language: str = "en",
+        speed: float = 1.0
+    ):
+        self.audio_service = audio_service
+        self.llm_service = llm_service
+        self.send = send
+        self.speaker = speaker
+        self.language = language
+        self.speed = speed
+        self.history: List[Dict[str, str]] = []
+        self._turn_index = 0
+        self._turn_task: Optional[asyncio.Task] = None
+        # Пауза между предложениями, как в потоковом /tts/ (нули PCM16 — нулевые байты)
+        self._silence = bytes(2 * int(0.15 * SAMPLE_RATE / speed))
+
+    def on_utterance(self, audio: np.ndarray, speech_end: float):
+        """Запускает ответ на закрытое высказывание; speech_end — time.perf_counter() конца речи."""
+        self.interrupt()
+        index = self._turn_index
+        self._turn_index += 1
+        self._turn_task = asyncio.create_task(self._run_turn(index, audio, speech_end))
+
+    def interrupt(self) -> bool:
+        """Прерывает текущий ответ; True, если было что прерывать."""
+        if self._turn_task is not None and not self._turn_task.done():
+            self._turn_task.cancel()
+            return True
+        return False
+
+    async def finish(self):
+        """Дожидается текущего ответа (конец записи)."""
+        if self._turn_task is not None:
+            try:
+                await self._turn_task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run_turn(self, index: int, audio: np.ndarray, speech_end: float):
+        timings = {}
+        reply_parts: List[str] = []
+        user_text = ""
+        try:
+            stt_start = time.perf_counter()
+            profile, _ = select_whisper_profile(len(audio) / STT_STREAM_SAMPLE_RATE)
+            user_text = (await self.audio_service.transcribe_array_async(audio, profile)).strip()
+            timings["stt_ms"] = _ms(stt_start)
+            await self.send({"type": "transcript", "text": user_text, "turn": index})
+            if not user_text:
+                return
+
+            messages = (
+                [{"role": "system", "content": VOICE_ASSISTANT_PROMPT}]
+                + self.history[-2 * VOICE_HISTORY_TURNS:]
+                + [{"role": "user", "content": user_text}]
+            )
+            await self._stream_reply(index, messages, speech_end, timings, reply_parts)
+            timings["total_ms"] = _ms(speech_end)
+            _recent_timings.append(timings)
+            logger.info("Voice turn %d done", index, extra={"turn": index, "timings": timings})
+            await self.send({"type": "reply_end", "text": "".join(reply_parts), "turn": index, "timings": timings})
+        except asyncio.CancelledError:
+            await self._notify({"type": "interrupted", "turn": index})
+            raise
+        except Exception as e:
+            logger.exception("Voice turn %d failed: %s", index, e)
+            await self._notify({"type": "error", "detail": str(e), "turn": index})
+        finally:
+            if user_text:
+                # Прерванный ответ тоже попадает в историю — пользователь слышал его начало
+                self.history.append({"role": "user", "content": user_text})
+                if reply_parts:
+                    self.history.append({"role": "assistant", "content": "".join(reply_parts)})
+
+    async def _notify(self, message: dict):
+        # Клиент мог уже отключиться — ошибка отправки не должна маскировать исходную
+        try:
+            await self.send(message)
+        except Exception:
+            pass
+
+    async def _stream_reply(self, index, messages, speech_end, timings, reply_parts):
+        """LLM пишет ответ, предложения синтезируются по мере готовности и уходят клиенту по порядку."""
+        sentences: asyncio.Queue = asyncio.Queue()
+        # Сколько предложений синтезируется наперед, пока отправляется текущее
+        limiter = asyncio.Semaphore(max(STREAM_TTS_LOOKAHEAD, 1))
+        producer = asyncio.create_task(
+            self._generate_reply(index, messages, sentences, limiter, speech_end, timings, reply_parts)
+        )
+        audio_samples = 0
+        try:
+            while True:
+                synthesis = await sentences.get()
+                if synthesis is None:
+                    break
+                pcm = await synthesis
+                if "time_to_first_audio_ms" not in timings:
+                    timings["time_to_first_audio_ms"] = _ms(speech_end)
+                try:
+                    await self.send(pcm)
+                finally:
+                    # Слот упреждения занят, пока аудио предложения не отправлено клиенту
+                    limiter.release()
+                await self.send(self._silence)
+                audio_samples += len(pcm) // 2
+            # Ошибка LLM всплывает здесь
+            await producer
+        finally:
+            producer.cancel()
+            while not sentences.empty():
+                synthesis = sentences.get_nowait()
+                if synthesis is not None:
+                    synthesis.cancel()
+        timings["audio_seconds"] = round(audio_samples / SAMPLE_RATE, 2)
+
+    async def _generate_reply(self, index, messages, sentences, limiter, speech_end, timings, reply_parts):
+        chunker = SentenceChunker()
+        llm_start = time.perf_counter()
+        try:
+            async for delta in self.llm_service.stream_chat(
+                messages, max_tokens=VOICE_REPLY_MAX_TOKENS, model=VOICE_LLM_MODEL
+            ):
+                if "llm_first_token_ms" not in timings:
+                    timings["llm_first_token_ms"] = _ms(llm_start)
+                reply_parts.append(delta)
+                await self.send({"type": "reply_delta", "text": delta, "turn": index})
+                for sentence in chunker.feed(delta):
+                    self._enqueue_sentence(sentence, sentences, limiter, speech_end, timings)
+            for sentence in chunker.flush():
+                self._enqueue_sentence(sentence, sentences, limiter, speech_end, timings)
+            timings["llm_ms"] = _ms(llm_start)
+        finally:
+            sentences.put_nowait(None)
+
+    def _enqueue_sentence(self, sentence, sentences, limiter, speech_end, timings):
+        text = _speakable(sentence)
+        if not text:
+            return
+        first = "first_sentence_ms" not in timings
+        if first:
+            timings["first_sentence_ms"] = _ms(speech_end)
+        sentences.put_nowait(asyncio.create_task(self._synthesize(text, limiter, timings, first)))
+
+    async def _synthesize(self, text, limiter, timings, first) -> bytes:
+        """Синтез предложения; слот limiter при успехе освобождает _stream_reply после отправки."""
+        await limiter.acquire()
+        try:
+            start = time.perf_counter()
+            pcm = await self.audio_service.synthesize_pcm(text, self.speaker, self.language, self.speed)
+            if first:
+                timings["tts_first_sentence_ms"] = _ms(start)
+            return pcm
+        except BaseException:
+            limiter.release()
+            raise
+
+def voice_pipeline_stats() -> dict:
+    """Перцентили таймингов этапов по последним репликам."""
+    stats = {"turns": len(_recent_timings)}
+    timings = list(_recent_timings)
+    for stage in ("stt_ms", "llm_first_token_ms", "first_sentence_ms", "tts_first_sentence_ms",
+                  "time_to_first_audio_ms", "llm_ms", "total_ms"):
+        values = [t[stage] for t in timings if stage in t]
+        if values:
+            stats[stage] = {
+                "p50": round(float(np.percentile(values, 50)), 1),
+                "p95": round(float(np.percentile(values, 95)), 1)
+            }
+    return stats
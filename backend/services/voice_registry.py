@@ -0,0 +1,99 @@
+import hashlib
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Tuple
+import numpy as np
+import torch
+
+class XTTSVoiceRegistry:
+    """Реестр голосов XTTS с кэшем латентов кондиционирования.
+
+    XTTS при каждом tts_to_file(speaker_wav=...) заново читает образец голоса
+    и считает GPT-латенты и эмбеддинг диктора. Здесь они считаются один раз на
+    образец: хранятся в памяти и на диске (ключ — sha256 содержимого файла),
+    а синтез идет через Xtts.inference с готовыми латентами.
+    """
+
+    def __init__(self, model_getter: Callable, cache_dir: str):
+        self._model_getter = model_getter
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._latents: Dict[str, Tuple[torch.Tensor, torch.Tensor]] = {}
+        # Хэши по (путь, размер, mtime), чтобы не перечитывать файл на каждый запрос
+        self._hashes: Dict[Tuple[str, int, float], str] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def _xtts(self):
+        # TTS.api.TTS -> Synthesizer -> модель Xtts
+        return self._model_getter().synthesizer.tts_model
+
+    def voice_id(self, speaker_wav: str) -> str:
+        """sha256 содержимого образца голоса."""
+        stat = Path(speaker_wav).stat()
+        stat_key = (str(Path(speaker_wav).resolve()), stat.st_size, stat.st_mtime)
+        voice_id = self._hashes.get(stat_key)
+        if voice_id is None:
+            voice_id = hashlib.sha256(Path(speaker_wav).read_bytes()).hexdigest()
+            self._hashes[stat_key] = voice_id
+        return voice_id
+
+    def get_latents(self, speaker_wav: str) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Возвращает (gpt_cond_latent, speaker_embedding), считая их только один раз."""
+        voice_id = self.voice_id(speaker_wav)
+        latents = self._latents.get(voice_id)
+        if latents is not None:
+            return latents
+
+        with self._lock:
+            latents = self._latents.get(voice_id)
+            if latents is not None:
+                return latents
+
+            xtts = self._xtts
+            device = next(xtts.parameters()).device
+            cache_path = self.cache_dir / f"{voice_id}.pt"
+            if cache_path.exists():
+                stored = torch.load(cache_path, map_location=device)
+                latents = (stored["gpt_cond_latent"], stored["speaker_embedding"])
+            else:
+                print(f"Computing XTTS conditioning latents for {speaker_wav}...")
+                gpt_cond_latent, speaker_embedding = xtts.get_conditioning_latents(
+                    audio_path=[speaker_wav],
+                    gpt_cond_len=xtts.config.gpt_cond_len,
+                    gpt_cond_chunk_len=xtts.config.gpt_cond_chunk_len,
+                    max_ref_length=xtts.config.max_ref_len,
+                    sound_norm_refs=xtts.config.sound_norm_refs
+                )
+                latents = (gpt_cond_latent, speaker_embedding)
+                torch.save(
+                    {"gpt_cond_latent": gpt_cond_latent.cpu(), "speaker_embedding": speaker_embedding.cpu()},
+                    cache_path
+                )
+            self._latents[voice_id] = latents
+            return latents
+
+    def register_voice(self, speaker_wav: str) -> str:
+        """Разовая регистрация нового голоса: латенты считаются и сохраняются сразу."""
+        self.get_latents(speaker_wav)
+        return self.voice_id(speaker_wav)
+
+    def synthesize(self, text: str, speaker_wav: str, language: str = "en") -> np.ndarray:
+        """Синтез одной фразы с закэшированными латентами голоса."""
+        gpt_cond_latent, speaker_embedding = self.get_latents(speaker_wav)
+        xtts = self._xtts
+        result = xtts.inference(
+            text,
+            language,
+            gpt_cond_latent,
+            speaker_embedding,
+            temperature=xtts.config.temperature,
+            length_penalty=xtts.config.length_penalty,
+            repetition_penalty=xtts.config.repetition_penalty,
+            top_k=xtts.config.top_k,
+            top_p=xtts.config.top_p
+        )
+        wav = result["wav"]
+        if isinstance(wav, torch.Tensor):
+            wav = wav.cpu().numpy()
+        return np.asarray(wav, dtype=np.float32)
@@ -0,0 +1,155 @@
+import asyncio
+import difflib
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from metrics import track_inference
+
+@dataclass(frozen=True)
+class WakeWordResult:
+    detected: bool
+    keyword: Optional[str]
+    text: str
+    score: float
+    # Клип отклонен энергетическим гейтом, модель не запускалась
+    skipped: bool
+    latency_ms: float
+
+def _normalize(text: str) -> List[str]:
+    return re.sub(r"[^\w\s]", " ", text.lower()).split()
+
+def match_keyword(text: str, keywords: List[str]) -> Tuple[Optional[str], float]:
+    """Лучшее нечеткое совпадение ключевой фразы с окном слов транскрипта той же длины (±1 слово).
+
+    Tiny-модель пишет "act ai" как "act a.i." или "acti" — поэтому сравниваются
+    строки без пробелов и пунктуации, а не точные слова. Окно должно быть почти
+    той же длины в буквах, что и фраза (±четверть, минимум ±1): иначе короткие
+    "act" или "at a" набирали бы высокое сходство с "act ai".
+
+    >>> match_keyword("Hey, act A.I., play music", ["hey act ai", "act ai"])
+    ('hey act ai', 1.0)
+    >>> match_keyword("Acti", ["hey act ai", "act ai"])
+    ('act ai', 0.889)
+    >>> match_keyword("Act.", ["hey act ai", "act ai"])
+    (None, 0.0)
+    >>> match_keyword("I looked at a map", ["hey act ai", "act ai"])[1] < 0.85
+    True
+    >>> match_keyword("hey, a tie", ["hey act ai", "act ai"])[1] < 0.85
+    True
+    >>> match_keyword("in fact a", ["hey act ai", "act ai"])[1] < 0.85
+    True
+    """
+    words = _normalize(text)
+    best_keyword, best_score = None, 0.0
+    for keyword in keywords:
+        target = "".join(_normalize(keyword))
+        length = len(_normalize(keyword))
+        tolerance = max(1, len(target) // 4)
+        for size in {max(length - 1, 1), length, length + 1}:
+            for start in range(max(len(words) - size + 1, 1)):
+                candidate = "".join(words[start:start + size])
+                if abs(len(candidate) - len(target)) > tolerance:
+                    continue
+                score = difflib.SequenceMatcher(None, target, candidate).ratio()
+                if score > best_score:
+                    best_keyword, best_score = keyword, score
+    return best_keyword, round(best_score, 3)
+
+class WakeWordDetector:
+    """Быстрая проверка wake word на коротких клипах, которые клиент шлет непрерывно.
+
+    1. Энергетический гейт: клип без речи отклоняется без модели.
+    2. Whisper tiny (greedy, без таймстемпов, язык задан, hotwords) по первым
+       max_seconds клипа — на своем пуле потоков и своей копии модели, поэтому
+       проверка не ждет в очереди за длинными транскрипциями.
+    3. Нечеткое сравнение транскрипта с ключевыми фразами.
+    """
+
+    def __init__(
+        self,
+        model_getter: Callable,
+        keywords: List[str],
+        language: str = "en",
+        max_workers: int = 2,
+        max_seconds: float = 3.0,
+        threshold: float = 0.85,
+        sample_rate: int = 16000,
+        min_rms: float = 0.01,
+        min_speech_ms: int = 150
+    ):
+        self._model_getter = model_getter
+        self.keywords = keywords
+        self.language = language
+        self.max_samples = int(max_seconds * sample_rate)
+        self.threshold = threshold
+        self.frame_size = int(0.03 * sample_rate)
+        self.min_rms = min_rms
+        self.min_speech_frames = max(1, min_speech_ms // 30)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="wake_word")
+        self._stats_lock = threading.Lock()
+        self._stats = {"checks": 0, "skipped_silence": 0, "detected": 0, "model_ms_total": 0.0}
+
+    def has_speech(self, audio: np.ndarray) -> bool:
+        """Есть ли в клипе хотя бы min_speech_ms кадров заметно громче фона."""
+        n_frames = len(audio) // self.frame_size
+        if n_frames == 0:
+            return False
+        frames = audio[:n_frames * self.frame_size].reshape(n_frames, self.frame_size)
+        rms = np.sqrt(np.mean(np.square(frames), axis=1))
+        # Фон — тихие кадры клипа; речь должна быть в разы громче
+        threshold = max(self.min_rms, 3.0 * float(np.percentile(rms, 20)))
+        return int(np.count_nonzero(rms > threshold)) >= self.min_speech_frames
+
+    def _transcribe(self, audio: np.ndarray) -> str:
+        model = self._model_getter()
+        segments, _ = model.transcribe(
+            audio,
+            language=self.language,
+            beam_size=1,
+            without_timestamps=True,
+            condition_on_previous_text=False,
+            vad_filter=False,
+            hotwords=", ".join(self.keywords)
+        )
+        return " ".join(segment.text.strip() for segment in segments).strip()
+
+    async def detect(self, audio: np.ndarray) -> WakeWordResult:
+        start = time.perf_counter()
+        audio = np.asarray(audio, dtype=np.float32)[:self.max_samples]
+        if not self.has_speech(audio):
+            with self._stats_lock:
+                self._stats["checks"] += 1
+                self._stats["skipped_silence"] += 1
+            return WakeWordResult(False, None, "", 0.0, True, round((time.perf_counter() - start) * 1000, 1))
+
+        loop = asyncio.get_event_loop()
+        with track_inference("wake_word", "transcribe"):
+            text = await loop.run_in_executor(self.executor, self._transcribe, audio)
+        keyword, score = match_keyword(text, self.keywords)
+        detected = score >= self.threshold
+        latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        with self._stats_lock:
+            self._stats["checks"] += 1
+            self._stats["detected"] += int(detected)
+            self._stats["model_ms_total"] += latency_ms
+        return WakeWordResult(detected, keyword if detected else None, text, score, False, latency_ms)
+
+    def warm_up(self):
+        """Загружает модель в фоне, не блокируя вызывающего."""
+        return self.executor.submit(self._model_getter)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        model_runs = stats["checks"] - stats["skipped_silence"]
+        stats["model_ms_avg"] = round(stats.pop("model_ms_total") / model_runs, 1) if model_runs else None
+        return stats
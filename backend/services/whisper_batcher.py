@@ -0,0 +1,193 @@
+import asyncio
+import time
+from bisect import bisect_right
+from concurrent.futures import Executor
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from faster_whisper import BatchedInferencePipeline, WhisperModel
+from faster_whisper.vad import VadOptions, get_speech_timestamps, merge_segments
+
+WHISPER_SAMPLE_RATE = 16000
+# Whisper работает окнами по 30 секунд — длинное аудио режется на такие клипы
+CLIP_SAMPLES = 30 * WHISPER_SAMPLE_RATE
+# VAD как в BatchedInferencePipeline: куски речи склеиваются в клипы до 30 с
+_VAD_OPTIONS = VadOptions(max_speech_duration_s=30, min_silence_duration_ms=160)
+# Параметры профиля (WhisperProfile.decode_options), которые батч выполняет так же, как model.transcribe
+BATCHED_DECODE_OPTIONS = {"beam_size", "language", "vad_filter"}
+
+def supports_batching(options: Dict) -> bool:
+    """Можно ли декодировать запрос с этими параметрами в батче без потери части из них."""
+    return set(options) <= BATCHED_DECODE_OPTIONS
+
+def _request_clips(audio: np.ndarray, vad_filter: bool) -> List[dict]:
+    """Клипы одного запроса в отсчетах: речь по VAD или подряд окна по 30 с."""
+    if vad_filter:
+        speech = get_speech_timestamps(audio, _VAD_OPTIONS)
+        return [{"start": clip["start"], "end": clip["end"]} for clip in merge_segments(speech, _VAD_OPTIONS)]
+    return [
+        {"start": offset, "end": min(len(audio), offset + CLIP_SAMPLES)}
+        for offset in range(0, len(audio), CLIP_SAMPLES)
+    ]
+
+def transcribe_batch(
+    pipeline: BatchedInferencePipeline,
+    audios: List[np.ndarray],
+    max_batch_size: int,
+    options: Dict
+) -> List[str]:
+    """Склеивает аудио запросов и декодирует их одним батчем.
+
+    Каждый запрос занимает свой регион склейки и режется на клипы до 30 с
+    (clip_timestamps), так что каждый клип — отдельный элемент батча. С
+    vad_filter клипы — участки речи запроса: VAD пайплайна при заданных
+    clip_timestamps не работает, поэтому он выполняется здесь, по запросам.
+    Сегменты возвращаются запросам по времени начала.
+    """
+    decode = {key: value for key, value in options.items() if key != "vad_filter"}
+    language = decode.get("language")
+    region_starts = []
+    clips = []
+    position = 0
+    for audio in audios:
+        region_starts.append(position / WHISPER_SAMPLE_RATE)
+        for clip in _request_clips(audio, options.get("vad_filter", False)):
+            clips.append({"start": position + clip["start"], "end": position + clip["end"]})
+        position += len(audio)
+
+    texts = [[] for _ in audios]
+    if not clips:
+        return ["" for _ in audios]
+
+    segments, _ = pipeline.transcribe(
+        np.concatenate(audios).astype(np.float32, copy=False),
+        clip_timestamps=clips,
+        batch_size=min(len(clips), max_batch_size),
+        # Без подсказки языка запросы могут быть на разных языках —
+        # тогда язык определяется для каждого клипа
+        multilingual=language is None,
+        **decode
+    )
+    for segment in segments:
+        index = bisect_right(region_starts, segment.start + 1e-3) - 1
+        texts[max(index, 0)].append(segment.text.strip())
+    return [" ".join(parts).strip() for parts in texts]
+
+class WhisperBatchScheduler:
+    """Динамический микро-батчинг запросов к Whisper.
+
+    Запросы складываются в очередь; сборщик ждет первый запрос, затем добирает
+    остальные в течение window_ms (или пока батч не заполнится) и отправляет
+    их одним батчем в BatchedInferencePipeline. Пока батч считается, новые
+    запросы копятся в очереди, поэтому под нагрузкой батчи растут сами.
+
+    По умолчанию батч считается в executor текущего процесса; runner позволяет
+    отправить его в другое место (например, в процесс-воркер инференса).
+    """
+
+    def __init__(
+        self,
+        model_getter: Callable[[], WhisperModel],
+        executor: Executor,
+        max_batch_size: int = 8,
+        window_ms: float = 10.0,
+        max_concurrent_batches: int = 1,
+        options: Optional[Dict] = None,
+        runner: Optional[Callable[[List[np.ndarray]], Awaitable[List[str]]]] = None
+    ):
+        self._model_getter = model_getter
+        self._runner = runner
+        self._executor = executor
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000
+        # Параметры декодирования профиля (WhisperProfile.decode_options)
+        self.options = dict(options or {"beam_size": 5})
+        self._max_concurrent_batches = max_concurrent_batches
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._collector: Optional[asyncio.Task] = None
+
+        self.batches = 0
+        self.requests = 0
+        self.batch_size_sum = 0
+        self.batch_size_max = 0
+        self.queue_wait_sum = 0.0
+        self.queue_wait_max = 0.0
+
+    def _ensure_started(self):
+        if self._collector is None or self._collector.done():
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self._max_concurrent_batches)
+            self._collector = asyncio.create_task(self._collect())
+
+    async def transcribe(self, audio: np.ndarray) -> str:
+        """Ставит аудио (float32, 16 кГц) в очередь и ждет его транскрипт."""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((audio, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            await self._slots.acquire()
+            asyncio.create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch: List[Tuple[np.ndarray, asyncio.Future, float]]):
+        try:
+            started = time.perf_counter()
+            waits = [started - enqueued for _, _, enqueued in batch]
+            self._record(len(batch), waits)
+            loop = asyncio.get_running_loop()
+            audios = [audio for audio, _, _ in batch]
+            try:
+                if self._runner is not None:
+                    texts = await self._runner(audios)
+                else:
+                    texts = await loop.run_in_executor(self._executor, self._run_batch, audios)
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            for (_, future, _), text in zip(batch, texts):
+                if not future.done():
+                    future.set_result(text)
+        finally:
+            self._slots.release()
+
+    def _get_pipeline(self) -> BatchedInferencePipeline:
+        # Обертка дешевая и создается на батч: ссылка на модель не мешает registry ее выгрузить
+        return BatchedInferencePipeline(model=self._model_getter())
+
+    def _run_batch(self, audios: List[np.ndarray]) -> List[str]:
+        return transcribe_batch(
+            self._get_pipeline(), audios, self.max_batch_size, self.options
+        )
+
+    def _record(self, batch_size: int, waits: List[float]):
+        self.batches += 1
+        self.requests += batch_size
+        self.batch_size_sum += batch_size
+        self.batch_size_max = max(self.batch_size_max, batch_size)
+        self.queue_wait_sum += sum(waits)
+        self.queue_wait_max = max(self.queue_wait_max, max(waits))
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "avg_batch_size": round(self.batch_size_sum / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.batch_size_max,
+            "avg_queue_wait_ms": round(self.queue_wait_sum / self.requests * 1000, 2) if self.requests else 0.0,
+            "max_queue_wait_ms": round(self.queue_wait_max * 1000, 2)
+        }
@@ -0,0 +1,322 @@
+"""Трассировка запросов: дерево спанов в процессе, экспорт в формате OTLP/JSON.
+
+Спан открывается на HTTP-запрос (middleware), шаг LLM и каждую попытку,
+вызов OpenAI, SQL-запрос и задачу инференса; родитель берется из contextvar,
+поэтому asyncio.gather и async SQLAlchemy сохраняют вложенность.
+
+Решение о записи принимается на корневом спане: доля TRACE_SAMPLE_RATE
+(или флаг sampled входящего заголовка traceparent). Кроме того, трасса
+целиком экспортируется, если корневой спан длился дольше TRACE_SLOW_MS —
+медленный POST /plans/ попадает в файл независимо от доли.
+
+Экспорт — фоновым потоком, по трассе на строку: TRACE_EXPORTER=file пишет
+ExportTraceServiceRequest (OTLP/JSON) в TRACE_FILE, otlp — POST на коллектор
+(TRACE_OTLP_ENDPOINT, например Jaeger или otel-collector на :4318). Файл
+ротируется по размеру TRACE_FILE_MAX_MB.
+"""
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config import (
+    TRACE_EXPORTER,
+    TRACE_FILE,
+    TRACE_FILE_BACKUPS,
+    TRACE_FILE_MAX_MB,
+    TRACE_OTLP_ENDPOINT,
+    TRACE_SAMPLE_RATE,
+    TRACE_SERVICE_NAME,
+    TRACE_SLOW_MS
+)
+
+logger = logging.getLogger("tracing")
+
+TRACING_ENABLED = TRACE_EXPORTER in ("file", "otlp")
+
+# Виды спанов OTLP
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+_STATUS_OK = 1
+_STATUS_ERROR = 2
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+class _Trace:
+    """Спаны одной трассы в процессе; экспортируются вместе по завершении корня."""
+    __slots__ = ("trace_id", "sampled", "root", "spans", "exported", "lock")
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        # Первый спан трассы в этом процессе; его завершение выгружает трассу
+        self.root: Optional["Span"] = None
+        self.spans: List["Span"] = []
+        self.exported = False
+        self.lock = threading.Lock()
+
+class Span:
+    __slots__ = ("name", "kind", "span_id", "parent_id", "trace", "start_ns", "end_ns", "attributes", "events", "status", "status_message")
+
+    def __init__(self, name: str, trace: _Trace, parent_id: Optional[str], kind: int, attributes: Dict[str, Any]):
+        self.name = name
+        self.kind = kind
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.trace = trace
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.events: List[dict] = []
+        self.status = 0
+        self.status_message = ""
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_error(self, message: str):
+        self.status = _STATUS_ERROR
+        self.status_message = message[:500]
+
+    def record_exception(self, exc: BaseException):
+        self.status = _STATUS_ERROR
+        self.status_message = str(exc)[:500]
+        self.events.append({
+            "name": "exception",
+            "time_ns": time.time_ns(),
+            "attributes": {"exception.type": type(exc).__name__, "exception.message": str(exc)[:500]}
+        })
+
+    def end(self, exc: Optional[BaseException] = None):
+        if self.end_ns:
+            return
+        if exc is not None:
+            self.record_exception(exc)
+        elif not self.status:
+            self.status = _STATUS_OK
+        self.end_ns = time.time_ns()
+        trace = self.trace
+        is_root = trace.root is self
+        with trace.lock:
+            trace.spans.append(self)
+            if not is_root and not trace.exported:
+                return
+            if is_root:
+                slow = TRACE_SLOW_MS > 0 and (self.end_ns - self.start_ns) / 1e6 >= TRACE_SLOW_MS
+                if not (trace.sampled or slow):
+                    trace.spans = []
+                    return
+                trace.exported = True
+            # Корень или спан, завершившийся после уже выгруженного корня
+            spans, trace.spans = trace.spans, []
+        _exporter.submit(spans)
+
+class _NoopSpan:
+    """Спан при выключенной трассировке: все вызовы ничего не делают."""
+    trace_id = None
+    span_id = None
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_error(self, message: str):
+        pass
+
+    def record_exception(self, exc: BaseException):
+        pass
+
+    def end(self, exc: Optional[BaseException] = None):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+def parse_traceparent(header: Optional[str]):
+    """W3C traceparent "00-<trace_id>-<span_id>-<flags>" -> (trace_id, span_id, sampled) или None."""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+def begin_span(
+    name: str,
+    kind: int = KIND_INTERNAL,
+    traceparent: Optional[str] = None,
+    **attributes
+):
+    """Открывает спан, не делая его текущим (листовые спаны, например SQL). Закрыть — span.end()."""
+    if not TRACING_ENABLED:
+        return NOOP_SPAN
+    parent = _current_span.get()
+    if parent is not None:
+        return Span(name, parent.trace, parent.span_id, kind, attributes)
+    remote = parse_traceparent(traceparent)
+    if remote is not None:
+        trace_id, parent_id, sampled = remote
+        # Вызывающий уже решил за нас; parent_id указывает на спан в другом сервисе
+        trace = _Trace(trace_id, sampled)
+    else:
+        trace, parent_id = _Trace(os.urandom(16).hex(), random.random() < TRACE_SAMPLE_RATE), None
+    trace.root = Span(name, trace, parent_id, kind, attributes)
+    return trace.root
+
+def begin_child_span(name: str, kind: int = KIND_INTERNAL, **attributes):
+    """Как begin_span, но только внутри текущего спана: вне трассы (фоновые задачи,
+    опрос очереди) не открывает новую трассу на каждый вызов и возвращает NOOP_SPAN."""
+    if _current_span.get() is None:
+        return NOOP_SPAN
+    return begin_span(name, kind, **attributes)
+
+@contextmanager
+def start_span(name: str, kind: int = KIND_INTERNAL, traceparent: Optional[str] = None, **attributes):
+    """Спан на время блока; вложенные спаны (и в задачах asyncio из блока) становятся дочерними."""
+    span = begin_span(name, kind, traceparent, **attributes)
+    if span is NOOP_SPAN:
+        yield span
+        return
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.end(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+def current_span():
+    return _current_span.get() or NOOP_SPAN
+
+def _attribute_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def _attributes(attributes: Dict[str, Any]) -> List[dict]:
+    return [{"key": key, "value": _attribute_value(value)} for key, value in attributes.items() if value is not None]
+
+def _otlp_span(span: Span) -> dict:
+    entry = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": span.kind,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": _attributes(span.attributes),
+        "status": {"code": span.status, "message": span.status_message} if span.status_message else {"code": span.status}
+    }
+    # У корня с удаленным родителем parent_id — спан вызывающего сервиса
+    if span.parent_id is not None:
+        entry["parentSpanId"] = span.parent_id
+    if span.events:
+        entry["events"] = [
+            {"name": event["name"], "timeUnixNano": str(event["time_ns"]), "attributes": _attributes(event["attributes"])}
+            for event in span.events
+        ]
+    return entry
+
+def to_otlp(spans: List[Span]) -> dict:
+    """ExportTraceServiceRequest в JSON-кодировке OTLP."""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _attributes({"service.name": TRACE_SERVICE_NAME, "process.pid": os.getpid()})},
+            "scopeSpans": [{"scope": {"name": "actai"}, "spans": [_otlp_span(span) for span in spans]}]
+        }]
+    }
+
+class _Exporter:
+    """Фоновый поток: сериализация и запись трасс вне обработки запросов."""
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, spans: List[Span]):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace_exporter", daemon=True)
+                    self._thread.start()
+        self._queue.put(spans)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Все, что накопилось, пишется одним заходом
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._export(batch)
+            except Exception as e:
+                logger.warning("Trace export failed: %s", e)
+
+    def _export(self, batch: List[List[Span]]):
+        if TRACE_EXPORTER == "file":
+            Path(TRACE_FILE).parent.mkdir(parents=True, exist_ok=True)
+            _rotate_trace_file()
+            with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                for spans in batch:
+                    f.write(json.dumps(to_otlp(spans), ensure_ascii=False) + "\n")
+        else:
+            body = json.dumps(to_otlp([span for spans in batch for span in spans])).encode("utf-8")
+            request = urllib.request.Request(
+                TRACE_OTLP_ENDPOINT, data=body, headers={"Content-Type": "application/json"}, method="POST"
+            )
+            with urllib.request.urlopen(request, timeout=5):
+                pass
+
+def _rotate_trace_file():
+    # Файл общий для процессов: гонка двух ротаций теряет разве что один старый файл
+    try:
+        if os.path.getsize(TRACE_FILE) < TRACE_FILE_MAX_MB * 1024 * 1024:
+            return
+    except FileNotFoundError:
+        return
+    try:
+        for index in range(TRACE_FILE_BACKUPS - 1, 0, -1):
+            if os.path.exists(f"{TRACE_FILE}.{index}"):
+                os.replace(f"{TRACE_FILE}.{index}", f"{TRACE_FILE}.{index + 1}")
+        if TRACE_FILE_BACKUPS > 0:
+            os.replace(TRACE_FILE, f"{TRACE_FILE}.1")
+        else:
+            os.unlink(TRACE_FILE)
+    except FileNotFoundError:
+        # Файл уже сдвинул другой процесс
+        pass
+
+_exporter = _Exporter()
+
+def _reinit_after_fork():
+    # Поток экспорта в дочерний процесс не копируется — новый стартует при первой трассе
+    global _exporter
+    _exporter = _Exporter()
+
+os.register_at_fork(after_in_child=_reinit_after_fork)